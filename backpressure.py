@@ -0,0 +1,171 @@
+"""
+Модуль адаптивного снижения нагрузки при потоке обновлений
+"""
+import asyncio
+import time
+from typing import Optional
+
+from logger import logger
+
+# Ступени деградации: каждая следующая включает предыдущие
+SHED_LEVELS = ('normal', 'skip_gui', 'defer_media', 'sample_reactions')
+LEVEL_SKIP_GUI = 1
+LEVEL_DEFER_MEDIA = 2
+LEVEL_SAMPLE_REACTIONS = 3
+
+# Доля нового замера в сглаженной задержке цикла событий
+LAG_SMOOTHING = 0.3
+
+
+class BackpressureController:
+    """Контроллер нагрузки по очереди обработчиков и задержке event loop
+
+    Уровень поднимается сразу, как только число выполняющихся обработчиков
+    или задержка цикла событий превышает порог ступени, и опускается на одну
+    ступень после `calm_period` секунд спокойной работы. На ступенях
+    отключается отрисовка в GUI, откладывается загрузка медиа и из реакций
+    в каналах обрабатывается только каждая `sample_rate`-я. Запись сообщений
+    не отключается ни на одной ступени.
+    """
+
+    def __init__(self, backlog_thresholds=(200, 500, 1000), lag_thresholds=(0.1, 0.25, 0.5),
+                 calm_period: float = 5.0, sample_rate: int = 10, interval: float = 0.1,
+                 on_change=None, on_lag=None):
+        self.backlog_thresholds = backlog_thresholds
+        self.lag_thresholds = lag_thresholds  # Пороги задержки цикла событий (сек)
+        self.calm_period = calm_period
+        self.sample_rate = sample_rate
+        self.interval = interval  # Период замера задержки цикла событий (сек)
+        self.on_change = on_change  # Вызывается как (старый уровень, новый уровень)
+        self.on_lag = on_lag  # Получает каждый замер задержки (сек)
+        self.level = 0
+        self.in_flight = 0  # Выполняющиеся обработчики событий
+        self.lag = 0.0  # Сглаженная задержка цикла событий (сек)
+        self._calm_since: Optional[float] = None
+        self._sample_counter = 0
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {
+            'max_level': 0,
+            'transitions': 0,
+            'peak_in_flight': 0,
+            'max_lag': 0.0,
+            'gui_skipped': 0,
+            'media_deferred': 0,
+            'reactions_sampled_out': 0
+        }
+
+    def start(self):
+        """Запуск замера задержки цикла событий"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Остановка замера"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        """Замер задержки: насколько позже заданного просыпается sleep"""
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            sample = max(0.0, loop.time() - started - self.interval)
+            if sample > self.stats['max_lag']:
+                self.stats['max_lag'] = sample
+            if self.on_lag:
+                self.on_lag(sample)
+            # Сглаживание, чтобы единичная пауза (например, сборка мусора) не меняла ступень
+            self.lag += LAG_SMOOTHING * (sample - self.lag)
+            self._update()
+
+    def enter(self):
+        """Начало обработки события"""
+        self.in_flight += 1
+        if self.in_flight > self.stats['peak_in_flight']:
+            self.stats['peak_in_flight'] = self.in_flight
+        if self.level < len(self.backlog_thresholds) and self.in_flight >= self.backlog_thresholds[self.level]:
+            self._update()
+
+    def exit(self):
+        """Окончание обработки события"""
+        self.in_flight -= 1
+
+    def _target(self) -> int:
+        """Ступень, соответствующая текущей нагрузке"""
+        target = 0
+        for level, (backlog, lag) in enumerate(zip(self.backlog_thresholds, self.lag_thresholds), start=1):
+            if self.in_flight >= backlog or self.lag >= lag:
+                target = level
+        return target
+
+    def _update(self):
+        """Пересчет ступени с задержкой при снижении"""
+        target = self._target()
+        now = time.monotonic()
+        if target > self.level:
+            self._set_level(target)
+            self._calm_since = None
+        elif target < self.level:
+            if self._calm_since is None:
+                self._calm_since = now
+            elif now - self._calm_since >= self.calm_period:
+                self._set_level(self.level - 1)
+                self._calm_since = now
+        else:
+            self._calm_since = None
+
+    def _set_level(self, level: int):
+        """Смена ступени"""
+        previous, self.level = self.level, level
+        self.stats['transitions'] += 1
+        if level > self.stats['max_level']:
+            self.stats['max_level'] = level
+        log = logger.warning if level > previous else logger.info
+        log(f"Нагрузка: {SHED_LEVELS[previous]} -> {SHED_LEVELS[level]} "
+            f"(обработчиков: {self.in_flight}, задержка: {self.lag * 1000:.0f} мс)")
+        if self.on_change:
+            try:
+                self.on_change(previous, level)
+            except Exception as e:
+                logger.error(f"Ошибка обработки смены уровня нагрузки: {e}")
+
+    def allow_gui(self) -> bool:
+        """Разрешена ли отрисовка события в GUI"""
+        if self.level >= LEVEL_SKIP_GUI:
+            self.stats['gui_skipped'] += 1
+            return False
+        return True
+
+    def should_defer_media(self) -> bool:
+        """Нужно ли отложить загрузку медиа"""
+        if self.level >= LEVEL_DEFER_MEDIA:
+            self.stats['media_deferred'] += 1
+            return True
+        return False
+
+    def allow_reaction(self, chat_type: Optional[str]) -> bool:
+        """Обрабатывать ли обновление реакций (в каналах - выборочно)"""
+        if self.level < LEVEL_SAMPLE_REACTIONS or chat_type != 'channel':
+            return True
+        self._sample_counter += 1
+        if self._sample_counter % self.sample_rate == 0:
+            return True
+        self.stats['reactions_sampled_out'] += 1
+        return False
+
+    def get_stats(self) -> dict:
+        """Получение статистики контроллера"""
+        return {
+            'level': self.level,
+            'level_name': SHED_LEVELS[self.level],
+            'in_flight': self.in_flight,
+            'lag_ms': round(self.lag * 1000, 2),
+            'max_lag_ms': round(self.stats['max_lag'] * 1000, 2),
+            **{key: value for key, value in self.stats.items() if key != 'max_lag'}
+        }
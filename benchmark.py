@@ -0,0 +1,275 @@
+"""
+Нагрузочный тест конвейера мониторинга на воспроизводимых событиях
+
+Примеры:
+    python benchmark.py --events 20000 --rates 0,2000,5000
+    python benchmark.py --replay export.ndjson.gz --rates 0
+    python benchmark.py --save baseline.json
+    python benchmark.py --baseline baseline.json --tolerance 0.2
+    python benchmark.py --catchup-gap 5000
+"""
+import argparse
+import asyncio
+import json
+import sqlite3
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+# Добавление текущей директории в путь
+sys.path.insert(0, str(Path(__file__).parent))
+
+from config import config
+
+# Префикс строки с результатом дочернего процесса
+RESULT_MARKER = 'BENCHMARK_RESULT '
+
+# Этапы с меньшим числом замеров не сравниваются с базовым прогоном
+MIN_STAGE_SAMPLES = 100
+
+
+def peak_rss_mb():
+    """Пиковый размер резидентной памяти процесса (МБ) или None, если недоступно"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдает килобайты, macOS - байты
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def parse_mix(text: str) -> dict:
+    """Разбор долей видов событий: 'message=70,reaction=30'"""
+    from replay import REPLAY_HANDLERS
+    mix = {}
+    for part in text.split(','):
+        kind, _, weight = part.partition('=')
+        if kind not in REPLAY_HANDLERS:
+            raise argparse.ArgumentTypeError(f"Неизвестный вид события: {kind}")
+        mix[kind] = float(weight)
+    return mix
+
+
+def count_messages(db_paths) -> tuple:
+    """Число строк сообщений и уникальных пар (chat_id, message_id) во всех файлах базы
+
+    Строки-отметки об удалении (базы без mark_messages_deleted) не считаются.
+    """
+    rows = unique = 0
+    for db_path in db_paths:
+        conn = sqlite3.connect(str(db_path))
+        try:
+            total, distinct = conn.execute(
+                "SELECT COUNT(*), (SELECT COUNT(*) FROM (SELECT DISTINCT chat_id, message_id FROM messages "
+                "WHERE NOT is_deleted)) FROM messages WHERE NOT is_deleted"
+            ).fetchone()
+        finally:
+            conn.close()
+        rows += total
+        unique += distinct
+    return rows, unique
+
+
+async def run_catchup(args, db, world) -> dict:
+    """Перезапуски монитора после простоя: догрузка пропущенного и повторная проверка"""
+    from monitor import TelegramMonitor
+    from replay import FakeClient, NullLogger
+
+    world.offline(args.catchup_gap)
+    expected = sum(len(history) for history in world.history.values())
+    passes = []
+    # Второй перезапуск без новых сообщений не должен ничего догружать
+    for _ in range(2):
+        client = FakeClient(world, network_delay=args.network_delay / 1000)
+        monitor = TelegramMonitor(client, db)
+        monitor.logger = NullLogger()
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await monitor.start()
+        await monitor.catchup.wait()
+        await monitor.shutdown()
+        stats = monitor.catchup.get_stats()
+        stats['seconds'] = round(loop.time() - started, 3)
+        stats['client_requests'] = client.requests
+        passes.append(stats)
+    rows, unique = count_messages(getattr(db, 'paths', None) or [config.db_path])
+    return {
+        'gap': args.catchup_gap,
+        'expected': expected,
+        'rows': rows,
+        'duplicates': rows - unique,
+        'passes': passes
+    }
+
+
+async def run_once(args, rate: float) -> dict:
+    """Один прогон на временной базе данных"""
+    from monitor import TelegramMonitor
+    from replay import FakeClient, SyntheticWorld, NullLogger, replay
+    from sharding import open_database
+
+    with tempfile.TemporaryDirectory(prefix='tgmon-bench-') as tmp:
+        config.db_path = str(Path(tmp) / 'bench.db')
+        # Хранилище медиа во временном каталоге: MediaStore при создании очищает свой tmp,
+        # и на рабочем каталоге это удалило бы загрузки запущенного монитора
+        config.media_store_path = Path(tmp) / 'blobs'
+        config.save_media = args.media_ratio > 0
+        config.monitor_media = args.media_ratio > 0
+        db = open_database(config.db_path)
+        world = SyntheticWorld(chats=args.chats, users=args.users, media_ratio=args.media_ratio, seed=args.seed)
+        client = FakeClient(world, network_delay=args.network_delay / 1000)
+        rendered = []
+        monitor = TelegramMonitor(client, db, event_callback=rendered.append if args.gui else None)
+        if not args.app_log:
+            monitor.logger = NullLogger()
+
+        if args.replay:
+            events = world.recorded(client, args.replay)
+        else:
+            events = world.synthetic(client, args.events, args.mix)
+
+        loop = asyncio.get_running_loop()
+        await monitor.start()
+        result = await replay(monitor, events, rate=rate)
+        flush_started = loop.time()
+        await monitor.shutdown()
+        flush_seconds = loop.time() - flush_started
+
+        stats = monitor.get_stats()
+        stages = monitor.perf.snapshot()
+        catchup = await run_catchup(args, db, world) if args.catchup_gap else None
+
+    handled = result['handle_seconds']
+    total = handled + flush_seconds
+    return {
+        'rate': rate,
+        'events': result['events'],
+        'counts': result['counts'],
+        'feed_rate': round(result['events'] / result['feed_seconds'], 1) if result['feed_seconds'] else None,
+        'events_per_sec': round(result['events'] / handled, 1) if handled else None,
+        'events_per_sec_with_flush': round(result['events'] / total, 1) if total else None,
+        'flush_seconds': round(flush_seconds, 3),
+        'db_written': stats.get('db_written', 0),
+        'db_errors': stats.get('db_errors', 0),
+        'load_max_level': stats.get('load_max_level', 0),
+        'rendered': len(rendered),
+        'entity_requests': client.requests,
+        'peak_rss_mb': peak_rss_mb(),
+        'stages': stages,
+        'catchup': catchup
+    }
+
+
+def run_in_subprocess(rate: float) -> dict:
+    """Прогон в отдельном процессе, чтобы пиковая память относилась к одному прогону"""
+    command = [sys.executable, str(Path(__file__).resolve()), '--single-rate', str(rate)] + sys.argv[1:]
+    completed = subprocess.run(command, capture_output=True, text=True, encoding='utf-8')
+    for line in reversed(completed.stdout.splitlines()):
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])
+    raise RuntimeError(f"Прогон с частотой {rate} завершился без результата:\n{completed.stderr[-2000:]}")
+
+
+def print_report(result: dict):
+    """Вывод результата прогона"""
+    rate = f"{result['rate']:g} событий/с" if result['rate'] else "без ограничения"
+    print("═══════════════════════════════════════════════════════")
+    print(f"Частота подачи: {rate} (фактически {result['feed_rate']})")
+    print(f"События: {result['events']} {result['counts']}")
+    print(f"Пропускная способность: {result['events_per_sec']} событий/с, "
+          f"с учетом сброса очереди: {result['events_per_sec_with_flush']} событий/с")
+    print(f"Сброс очереди при остановке: {result['flush_seconds']} с, записано строк: {result['db_written']}, "
+          f"ошибок: {result['db_errors']}")
+    print(f"Запросов сущностей: {result['entity_requests']}, макс. ступень нагрузки: {result['load_max_level']}, "
+          f"пиковая память: {result['peak_rss_mb']} МБ")
+    print(f"{'Этап':<28}{'Кол-во':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'Макс':>10}{'Ошибки':>8}")
+    for stage in result['stages']:
+        print(f"{stage['stage']:<28}{stage['count']:>9}{stage['p50_ms']:>9}{stage['p95_ms']:>9}"
+              f"{stage['p99_ms']:>9}{stage['max_ms']:>10}{stage['errors']:>8}")
+    catchup = result.get('catchup')
+    if catchup:
+        print(f"Догрузка после простоя ({catchup['gap']} сообщений): строк сообщений {catchup['rows']} "
+              f"из {catchup['expected']}, дубликатов: {catchup['duplicates']}")
+        for number, item in enumerate(catchup['passes'], 1):
+            print(f"  Перезапуск {number}: догружено {item['backfilled']}, пропущено {item['skipped']}, "
+                  f"чатов {item['chats']}, запросов {item['client_requests']}, {item['seconds']} с")
+
+
+def compare(results: list, baseline: list, tolerance: float) -> list:
+    """Сравнение с базовым прогоном; возвращает список регрессий"""
+    regressions = []
+    by_rate = {item['rate']: item for item in baseline}
+    for result in results:
+        base = by_rate.get(result['rate'])
+        if base is None:
+            continue
+        if base['events_per_sec'] and result['events_per_sec'] < base['events_per_sec'] * (1 - tolerance):
+            regressions.append(
+                f"частота {result['rate']:g}: {result['events_per_sec']} событий/с против {base['events_per_sec']}"
+            )
+        base_stages = {stage['stage']: stage for stage in base['stages']}
+        for stage in result['stages']:
+            old = base_stages.get(stage['stage'])
+            if not old or min(stage['count'], old['count']) < MIN_STAGE_SAMPLES or not old['p95_ms']:
+                continue
+            if stage['p95_ms'] > old['p95_ms'] * (1 + tolerance):
+                regressions.append(
+                    f"частота {result['rate']:g}, {stage['stage']}: p95 {stage['p95_ms']} мс против {old['p95_ms']} мс"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест конвейера мониторинга без подключения к Telegram")
+    parser.add_argument('--events', type=int, default=20000, help="Число синтетических событий на прогон")
+    parser.add_argument('--rates', default='0', help="Частоты подачи через запятую, событий/с (0 - без ограничения)")
+    parser.add_argument('--mix', type=parse_mix, default=None, help="Доли видов: message=70,reaction=12,...")
+    parser.add_argument('--chats', type=int, default=50, help="Число синтетических чатов")
+    parser.add_argument('--users', type=int, default=500, help="Число синтетических пользователей")
+    parser.add_argument('--media-ratio', type=float, default=0.0, help="Доля сообщений с медиа (0 - без загрузок)")
+    parser.add_argument('--network-delay', type=float, default=0.0, help="Задержка запроса сущности, мс")
+    parser.add_argument('--replay', help="NDJSON выгрузка (команда export) вместо синтетических событий")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--gui', action='store_true', help="Передавать события в callback GUI")
+    parser.add_argument('--app-log', action='store_true', help="Писать файловые логи приложения")
+    parser.add_argument('--catchup-gap', type=int, default=0,
+                        help="Сообщений за время простоя для проверки догрузки после перезапуска (0 - без проверки)")
+    parser.add_argument('--in-process', action='store_true', help="Все прогоны в одном процессе")
+    parser.add_argument('--save', help="Сохранить результаты в JSON")
+    parser.add_argument('--baseline', help="Сравнить с сохраненными результатами")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Допустимое ухудшение (доля)")
+    parser.add_argument('--single-rate', type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single_rate is not None:
+        result = asyncio.run(run_once(args, args.single_rate))
+        print(RESULT_MARKER + json.dumps(result, ensure_ascii=False))
+        return
+
+    results = []
+    for rate in (float(value) for value in args.rates.split(',')):
+        if args.in_process:
+            result = asyncio.run(run_once(args, rate))
+        else:
+            result = run_in_subprocess(rate)
+        print_report(result)
+        results.append(result)
+
+    if args.save:
+        Path(args.save).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding='utf-8')
+        print(f"Результаты сохранены: {args.save}")
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding='utf-8'))
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("❌ Регрессии производительности:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("✅ Регрессий нет")
+
+
+if __name__ == "__main__":
+    main()
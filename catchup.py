@@ -0,0 +1,392 @@
+"""
+Модуль восстановления пропущенных сообщений после перерыва
+"""
+import asyncio
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from telethon.tl.types import MessageService
+
+from logger import logger
+
+# Размер списка message_id в одном запросе к базе данных
+CHUNK_SIZE = 500
+
+# Смещение помеченных ID супергрупп и каналов в Telethon (-100...)
+CHANNEL_PEER_OFFSET = 1000000000000
+
+
+def peer_id(chat_id: int, chat_type: Optional[str]) -> int:
+    """Помеченный ID чата (как в событиях и диалогах Telethon) по ID из базы данных"""
+    if chat_type == 'group':
+        return -chat_id
+    if chat_type in ('supergroup', 'channel'):
+        return -(CHANNEL_PEER_OFFSET + chat_id)
+    return chat_id
+
+
+class HistoryEvent:
+    """Сообщение из истории чата в виде события NewMessage для обработчика монитора"""
+
+    def __init__(self, client, chat_id: int, message):
+        self._client = client
+        self.chat_id = chat_id
+        self.sender_id = getattr(message, 'sender_id', None)
+        self.message = message
+
+    async def get_chat(self):
+        return await self._client.get_entity(self.chat_id)
+
+    async def get_sender(self):
+        if self.sender_id is None:
+            return None
+        return await self._client.get_entity(self.sender_id)
+
+
+class CatchupEngine:
+    """Догрузка сообщений, пришедших, пока мониторинг не работал
+
+    Для каждого чата хранится отметка - последний записанный в базу
+    message_id (таблица `marks`). Чаты учитываются по ID из базы данных,
+    запросы к Telegram идут по помеченному ID (`peer_id`). Отметки обновляются приемником очереди
+    записи, то есть только после записи строк. При запуске и после
+    восстановления соединения история каждого отстающего чата читается
+    пакетами от отметки вперед, не больше `concurrency` чатов одновременно,
+    и передается в обычный обработчик новых сообщений. Запись идемпотентна:
+    сообщения, которые уже есть в базе данных, пропускаются, а отметки не
+    сдвигаются сообщениями, полученными вживую, пока догрузка не закончена
+    (иначе прерванная догрузка оставила бы дыру под отметкой). Разрыв
+    соединения виден по is_connected() раз в `interval` секунд, а быстрое
+    переподключение - по обратному вызову автопереподключения Telethon,
+    который сразу запускает догрузку.
+    """
+
+    def __init__(self, client, path: Path, handle, db_paths=(), concurrency: int = 4,
+                 batch_size: int = 100, max_per_chat: int = 5000, interval: float = 10):
+        self.client = client
+        self.path = Path(path)
+        self.handle = handle  # async (event) - обработка сообщения в конвейере монитора
+        self.db_paths = [Path(db_path) for db_path in db_paths]
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.max_per_chat = max_per_chat
+        self.interval = interval  # Период проверки соединения (сек)
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._wake = asyncio.Event()  # Переподключение: проверка без ожидания interval
+        self._hook = None  # (отправитель Telethon, его прежний обратный вызов переподключения)
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._pending = False  # Догрузка не закончена: новые отметки откладываются
+        self._active = set()  # Чаты (ID из базы), которые сейчас догружаются
+        self._held = {}  # chat_id -> отметка, отложенная до конца догрузки
+        self._live_floor = {}  # chat_id -> первый ID, полученный вживую во время догрузки
+        self.stats = {
+            'runs': 0,
+            'chats': 0,
+            'fetched': 0,
+            'backfilled': 0,
+            'skipped': 0,
+            'requests': 0,
+            'truncated': 0,
+            'reconnects': 0,
+            'last_run_ms': 0.0
+        }
+
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS marks (
+                chat_id INTEGER PRIMARY KEY,
+                peer_id INTEGER NOT NULL,
+                message_id INTEGER NOT NULL,
+                date INTEGER
+            )
+        """)
+        self._conn.commit()
+        self.marks = {}  # chat_id -> отметка
+        self.peers = {}  # chat_id -> помеченный ID
+        for chat_id, peer, message_id in self._conn.execute("SELECT chat_id, peer_id, message_id FROM marks"):
+            self.marks[chat_id] = message_id
+            self.peers[chat_id] = peer
+        self._chat_ids = {peer: chat_id for chat_id, peer in self.peers.items()}
+
+    def start(self):
+        """Запуск догрузки и наблюдения за соединением"""
+        if self._task is None or self._task.done():
+            self._pending = True
+            self._idle.clear()
+            self._hook_reconnects()
+            self._task = asyncio.create_task(self._run())
+
+    def _hook_reconnects(self):
+        """Подписка на автопереподключение Telethon (MTProtoSender вызывает его после нового соединения)"""
+        sender = getattr(self.client, '_sender', None)
+        if sender is None or not hasattr(sender, '_auto_reconnect_callback') or self._hook is not None:
+            return
+        previous = sender._auto_reconnect_callback
+
+        async def reconnected():
+            self.stats['reconnects'] += 1
+            self._pending = True
+            self._wake.set()
+            if previous is not None:
+                await previous()
+
+        self._hook = (sender, previous, reconnected)
+        sender._auto_reconnect_callback = reconnected
+
+    def _unhook_reconnects(self):
+        """Восстановление прежнего обратного вызова переподключения"""
+        if self._hook is not None:
+            sender, previous, reconnected = self._hook
+            if sender._auto_reconnect_callback is reconnected:
+                sender._auto_reconnect_callback = previous
+            self._hook = None
+
+    async def stop(self):
+        """Остановка догрузки
+
+        Отметки, отложенные незаконченной догрузкой, отбрасываются: при
+        следующем запуске эти сообщения будут запрошены снова и пропущены
+        проверкой по базе данных.
+        """
+        self._unhook_reconnects()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._active.clear()
+        self._live_floor.clear()
+        self._held.clear()
+        self._idle.set()
+
+    async def wait(self):
+        """Ожидание окончания текущей догрузки"""
+        await self._idle.wait()
+
+    async def _run(self):
+        """Догрузка при запуске и после каждого восстановления соединения"""
+        seen = self.stats['reconnects']
+        while True:
+            self._wake.clear()
+            if self.stats['reconnects'] != seen:
+                # Переподключение могло случиться и во время предыдущей догрузки
+                seen = self.stats['reconnects']
+                self._pending = True
+            if not self.client.is_connected():
+                self._pending = True
+            elif self._pending:
+                # Неудачная догрузка повторяется на следующей проверке
+                try:
+                    await self.catch_up()
+                except Exception as e:
+                    logger.error(f"Ошибка догрузки пропущенных сообщений: {e}")
+            self._idle.set()
+            # asyncio.wait, а не wait_for: отмена при одновременном пробуждении не теряется
+            wake = asyncio.create_task(self._wake.wait())
+            try:
+                await asyncio.wait({wake}, timeout=self.interval)
+            finally:
+                wake.cancel()
+
+    def observe(self, peer, message_id: int):
+        """Учет сообщения, пришедшего вживую (граница догрузки чата); peer - ID чата события"""
+        if not self._pending:
+            return
+        chat_id = self._chat_ids.get(peer)
+        if chat_id is not None:
+            self._live_floor.setdefault(chat_id, message_id)
+
+    async def on_rows(self, method: str, rows: list):
+        """Приемник очереди записи: сдвиг отметок по записанным сообщениям"""
+        if method != 'insert_message':
+            return
+        updates = {}
+        for row in rows:
+            if row.is_deleted or row.is_edited or row.chat_id is None:
+                continue
+            if row.message_id > updates.get(row.chat_id, (0, None, None))[0]:
+                updates[row.chat_id] = (row.message_id, row.date, peer_id(row.chat_id, row.chat_type))
+        if self._pending:
+            for chat_id, held in updates.items():
+                self._hold(chat_id, held)
+            return
+        if updates:
+            await asyncio.to_thread(self._save_marks, updates)
+
+    def _hold(self, chat_id: int, mark: tuple):
+        """Отложенная отметка чата: (message_id, date, peer_id)"""
+        if mark[0] > self._held.get(chat_id, (0, None, None))[0]:
+            self._held[chat_id] = mark
+
+    def _save_marks(self, updates: dict):
+        """Сохранение отметок (отметка только растет)"""
+        with self._lock:
+            try:
+                self._conn.executemany(
+                    "INSERT INTO marks (chat_id, peer_id, message_id, date) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (chat_id) DO UPDATE SET message_id = excluded.message_id, date = excluded.date "
+                    "WHERE excluded.message_id > marks.message_id",
+                    [(chat_id, peer, message_id, date) for chat_id, (message_id, date, peer) in updates.items()]
+                )
+                self._conn.commit()
+            except Exception as e:
+                self._conn.rollback()
+                logger.error(f"Ошибка сохранения отметок догрузки: {e}")
+                return
+        for chat_id, (message_id, _, peer) in updates.items():
+            if chat_id not in self.peers:
+                self.peers[chat_id] = peer
+                self._chat_ids[peer] = chat_id
+            if message_id > self.marks.get(chat_id, 0):
+                self.marks[chat_id] = message_id
+
+    async def _lagging_chats(self) -> dict:
+        """Чаты, в которых есть сообщения новее отметки: chat_id -> отметка"""
+        marks = dict(self.marks)
+        if not hasattr(self.client, 'get_dialogs'):
+            return marks
+        # Список диалогов отдает последнее сообщение каждого чата - чаты без
+        # новых сообщений не запрашиваются
+        self.stats['requests'] += 1
+        dialogs = await self.client.get_dialogs(limit=None)
+        lagging = {}
+        for dialog in dialogs:
+            top = getattr(getattr(dialog, 'message', None), 'id', None)
+            chat_id = self._chat_ids.get(dialog.id)
+            mark = marks.get(chat_id)
+            if mark is not None and top is not None and top > mark:
+                lagging[chat_id] = mark
+        return lagging
+
+    async def catch_up(self) -> int:
+        """Один проход догрузки по всем отстающим чатам; возвращает число сообщений"""
+        started = time.perf_counter()
+        self._pending = True
+        self._idle.clear()
+        failed = set()
+        try:
+            lagging = await self._lagging_chats()
+            self._active.update(lagging)
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def run_chat(chat_id, mark):
+                async with semaphore:
+                    try:
+                        return await self._catch_up_chat(chat_id, mark)
+                    except Exception as e:
+                        failed.add(chat_id)
+                        logger.error(f"Ошибка догрузки чата {chat_id}: {e}")
+                        return 0
+                    finally:
+                        self._active.discard(chat_id)
+
+            counts = await asyncio.gather(*(run_chat(chat_id, mark) for chat_id, mark in lagging.items()))
+        except BaseException:
+            self._held.clear()
+            self._live_floor.clear()
+            self._idle.set()
+            raise
+        self._live_floor.clear()
+        # Отложенные отметки применяются ко всем чатам, кроме недогруженных
+        held = {chat_id: mark for chat_id, mark in self._held.items() if chat_id not in failed}
+        self._held.clear()
+        self._pending = bool(failed)
+        if held:
+            await asyncio.to_thread(self._save_marks, held)
+        total = sum(counts)
+        self.stats['runs'] += 1
+        self.stats['chats'] += len(lagging)
+        self.stats['last_run_ms'] = (time.perf_counter() - started) * 1000
+        if total:
+            logger.info(f"Догружено пропущенных сообщений: {total} в {len(lagging)} чатах")
+        self._idle.set()
+        return total
+
+    async def _catch_up_chat(self, chat_id: int, mark: int) -> int:
+        """Догрузка одного чата пакетами от отметки до первого сообщения, полученного вживую"""
+        peer = self.peers[chat_id]
+        entity = await self.client.get_entity(peer)
+        last_id = mark
+        handled = 0
+        fetched = 0
+        while fetched < self.max_per_chat:
+            self.stats['requests'] += 1
+            batch = await self.client.get_messages(entity, limit=self.batch_size, min_id=last_id, reverse=True)
+            if not batch:
+                break
+            floor = self._live_floor.get(chat_id)
+            messages = [message for message in batch
+                        if not isinstance(message, MessageService) and (floor is None or message.id < floor)]
+            fetched += len(batch)
+            self.stats['fetched'] += len(batch)
+            stored = await asyncio.to_thread(self._stored_ids, chat_id, [message.id for message in messages])
+            for message in messages:
+                if message.id in stored:
+                    self.stats['skipped'] += 1
+                    continue
+                await self.handle(HistoryEvent(self.client, peer, message))
+                handled += 1
+                self.stats['backfilled'] += 1
+            last_id = max(message.id for message in batch)
+            # Все сообщения ниже границы обработаны - отметка чата сдвигается и
+            # без новых строк (например, если все они уже были в базе)
+            done = max((message for message in batch if floor is None or message.id < floor),
+                       key=lambda message: message.id, default=None)
+            if done is not None:
+                self._hold(chat_id, (done.id, int(done.date.timestamp()), peer))
+            if len(batch) < self.batch_size or (floor is not None and last_id >= floor):
+                break
+        else:
+            self.stats['truncated'] += 1
+            logger.warning(f"Догрузка чата {chat_id} остановлена на лимите {self.max_per_chat} сообщений")
+        return handled
+
+    def _stored_ids(self, chat_id: int, message_ids: list) -> set:
+        """ID сообщений чата, которые уже есть в базе данных (во всех шардах)"""
+        stored = set()
+        if not message_ids:
+            return stored
+        for db_path in self.db_paths:
+            if not db_path.exists():
+                continue
+            conn = sqlite3.connect(f"file:{db_path.as_posix()}?mode=ro", uri=True)
+            try:
+                if conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='messages'").fetchone() is None:
+                    continue
+                for offset in range(0, len(message_ids), CHUNK_SIZE):
+                    chunk = message_ids[offset:offset + CHUNK_SIZE]
+                    stored.update(message_id for (message_id,) in conn.execute(
+                        f"SELECT message_id FROM messages WHERE chat_id = ? AND message_id IN ({','.join('?' * len(chunk))})",
+                        [chat_id] + chunk
+                    ))
+            finally:
+                conn.close()
+        return stored
+
+    def get_stats(self) -> dict:
+        """Получение статистики догрузки"""
+        return {
+            'runs': self.stats['runs'],
+            'chats': self.stats['chats'],
+            'tracked': len(self.marks),
+            'active': len(self._active),
+            'fetched': self.stats['fetched'],
+            'backfilled': self.stats['backfilled'],
+            'skipped': self.stats['skipped'],
+            'requests': self.stats['requests'],
+            'truncated': self.stats['truncated'],
+            'last_run_ms': round(self.stats['last_run_ms'], 2)
+        }
+
+    def close(self):
+        """Закрытие файла отметок"""
+        with self._lock:
+            self._conn.close()
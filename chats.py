@@ -0,0 +1,86 @@
+"""
+Модуль классификации чатов
+"""
+import sys
+from typing import NamedTuple, Optional
+
+from telethon.tl.types import User, Chat, Channel
+
+# Иконки типов чатов для отображения в GUI
+CHAT_TYPE_ICONS = {
+    'private': '👤',
+    'group': '👥',
+    'supergroup': '👥',
+    'channel': '📢'
+}
+
+
+class ChatInfo(NamedTuple):
+    """Описание чата: вычисляется один раз на чат"""
+    id: int
+    type: str
+    title: str
+    icon: str
+
+
+def classify_chat(chat) -> ChatInfo:
+    """Определение типа и названия чата по сущности Telegram"""
+    if isinstance(chat, User):
+        chat_type = 'private'
+    elif isinstance(chat, Chat):
+        chat_type = 'group'
+    elif isinstance(chat, Channel):
+        chat_type = 'channel' if chat.broadcast else 'supergroup'
+    else:
+        chat_type = 'unknown'
+
+    # Название интернируется: одна строка на все записи и кэши чата
+    chat_title = sys.intern(getattr(chat, 'title', None) or getattr(chat, 'first_name', None) or 'Unknown')
+    return ChatInfo(chat.id, chat_type, chat_title, CHAT_TYPE_ICONS.get(chat_type, '❓'))
+
+
+class ChatTable:
+    """Таблица описаний чатов по ID чата события
+
+    События Telethon помечают ID групп и каналов (-..., -100...), а в
+    строках базы данных хранится ID сущности (ChatInfo.id) - для поиска
+    по нему есть `by_id`.
+    """
+
+    def __init__(self):
+        self._chats = {}  # chat_id события -> ChatInfo
+        self._by_id = {}  # ID чата в базе данных -> ChatInfo
+
+    def get(self, chat_id) -> Optional[ChatInfo]:
+        """Получение описания чата по ID события"""
+        return self._chats.get(chat_id)
+
+    def by_id(self, chat_id) -> Optional[ChatInfo]:
+        """Получение описания чата по ID из строк базы данных"""
+        return self._by_id.get(chat_id)
+
+    def add(self, chat_id, chat) -> ChatInfo:
+        """Классификация чата и сохранение описания"""
+        info = classify_chat(chat)
+        self._chats[chat_id] = info
+        self._by_id[info.id] = info
+        return info
+
+    def update_title(self, chat_id, title: str):
+        """Обновление названия чата после его изменения"""
+        info = self._chats.get(chat_id)
+        if info is not None and title:
+            info = info._replace(title=sys.intern(title))
+            self._chats[chat_id] = info
+            self._by_id[info.id] = info
+
+    def items(self):
+        """Пары (chat_id события, ChatInfo) всех известных чатов"""
+        return list(self._chats.items())
+
+    def values(self):
+        """Описания всех известных чатов"""
+        return list(self._by_id.values())
+
+    def __len__(self):
+        return len(self._chats)
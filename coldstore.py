@@ -0,0 +1,417 @@
+"""
+Модуль холодного хранения старой истории в колоночных файлах
+"""
+import asyncio
+import base64
+import json
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Optional
+
+from logger import logger
+from records import record_from_row
+from retention import UNKNOWN_TYPE, _to_date
+
+# Таблицы, которые переносятся в холодное хранилище по умолчанию
+COLD_TABLES = ('messages',)
+
+# Сигнатура и расширение файла сегмента
+SEGMENT_MAGIC = b'TGCOLD1\n'
+SEGMENT_SUFFIX = '.tgc'
+
+# Уровень сжатия колонок zlib
+COMPRESS_LEVEL = 9
+
+# Служебная колонка сегмента: rowid строки в базе данных (ключ дедупликации)
+ROWID_COLUMN = '_rowid'
+
+
+def _to_json(value):
+    """Значение колонки для JSON: BLOB хранится как {"$b64": base64}"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {'$b64': base64.b64encode(bytes(value)).decode('ascii')}
+    return value
+
+
+def _from_json(value):
+    """Значение колонки из JSON (обратное _to_json)"""
+    if isinstance(value, dict) and '$b64' in value:
+        return base64.b64decode(value['$b64'])
+    return value
+
+
+def _encode_column(values: list):
+    """Кодирование колонки: (способ, данные)
+
+    const - все значения одинаковы (хранится в заголовке), delta - целые
+    без пропусков хранятся разностями соседних значений, json - остальное.
+    """
+    first = values[0]
+    if all(value == first for value in values):
+        return 'const', None
+    if all(type(value) is int for value in values):
+        deltas = [first] + [values[i] - values[i - 1] for i in range(1, len(values))]
+        return 'delta', zlib.compress(json.dumps(deltas, separators=(',', ':')).encode(), COMPRESS_LEVEL)
+    payload = json.dumps([_to_json(value) for value in values], ensure_ascii=False, separators=(',', ':'))
+    return 'json', zlib.compress(payload.encode('utf-8'), COMPRESS_LEVEL)
+
+
+def _decode_column(column: dict, data: bytes, rows: int) -> list:
+    """Декодирование колонки сегмента"""
+    encoding = column['encoding']
+    if encoding == 'const':
+        return [_from_json(column['value'])] * rows
+    values = json.loads(zlib.decompress(data))
+    if encoding == 'delta':
+        for i in range(1, len(values)):
+            values[i] += values[i - 1]
+        return values
+    return [_from_json(value) for value in values]
+
+
+def write_segment(path: Path, header: dict, columns: list, rows: list):
+    """Атомарная запись сегмента: заголовок и независимо сжатые колонки"""
+    blocks = []
+    descriptions = []
+    offset = 0
+    for index, name in enumerate(columns):
+        encoding, data = _encode_column([row[index] for row in rows])
+        description = {'name': name, 'encoding': encoding}
+        if encoding == 'const':
+            description['value'] = _to_json(rows[0][index])
+        else:
+            description['offset'], description['length'] = offset, len(data)
+            blocks.append(data)
+            offset += len(data)
+        descriptions.append(description)
+    meta = json.dumps({**header, 'rows': len(rows), 'columns': descriptions},
+                      ensure_ascii=False, default=str).encode('utf-8')
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(path.name + '.tmp')
+    with open(temp_path, 'wb') as f:
+        f.write(SEGMENT_MAGIC)
+        f.write(struct.pack('<I', len(meta)))
+        f.write(meta)
+        for data in blocks:
+            f.write(data)
+    os.replace(temp_path, path)
+
+
+class Segment:
+    """Сегмент холодного хранилища: строки одного чата за один день
+
+    Заголовок читается сразу, колонки - по требованию, поэтому проход по
+    одной колонке не распаковывает остальные.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            if f.read(len(SEGMENT_MAGIC)) != SEGMENT_MAGIC:
+                raise ValueError(f"Не сегмент холодного хранилища: {self.path}")
+            (length,) = struct.unpack('<I', f.read(4))
+            self.header = json.loads(f.read(length))
+        self.data_offset = len(SEGMENT_MAGIC) + 4 + length
+        self.rows = self.header['rows']
+        self.columns = {column['name']: column for column in self.header['columns']}
+
+    def column(self, name: str) -> list:
+        """Значения одной колонки"""
+        column = self.columns.get(name)
+        if column is None:
+            return [None] * self.rows
+        if column['encoding'] == 'const':
+            return _decode_column(column, b'', self.rows)
+        with open(self.path, 'rb') as f:
+            f.seek(self.data_offset + column['offset'])
+            return _decode_column(column, f.read(column['length']), self.rows)
+
+    def read(self, columns=None) -> list:
+        """Строки сегмента словарями (все колонки таблицы или выбранные)"""
+        names = list(columns or (name for name in self.columns if name != ROWID_COLUMN))
+        values = [self.column(name) for name in names]
+        return [dict(zip(names, row)) for row in zip(*values)]
+
+
+class ColdStore:
+    """Колоночное холодное хранилище закрытых периодов истории
+
+    Фоновая задача переносит строки таблиц старше `after_days` из базы
+    данных (и всех шардов) в файлы `<таблица>/<chat_id>/<ГГГГ-ММ-ДД>.tgc`:
+    каждая колонка сжата отдельно, повторяющиеся значения хранятся один раз,
+    целые - разностями. Переносятся только целые месяцы, которые закончились
+    до порога. Сегменты дня записываются до удаления строк из базы, поэтому
+    сбой не теряет данные, а повторный перенос того же дня дописывает
+    сегмент без дубликатов: ключ строки - ее rowid в базе (служебная колонка
+    `_rowid`; чат целиком лежит в одном шарде), так что одинаковые по
+    содержимому строки, например повторные реакции, не сливаются. Чтение
+    (`iter_rows`, `scan_column`, `count`) отбирает сегменты по пути файла
+    и читает только нужные колонки;
+    StreamingExporter выгружает горячие и холодные строки вместе.
+    Сроки хранения применяются и к сегментам: RetentionManager удаляет
+    устаревшие дни через `drop_segments`. StatsStore и SearchIndex при
+    первом построении учитывают строки сегментов (`cold`); статистика самой
+    Database (get_statistics) считает только строки базы, поэтому заголовок
+    экспорта дополняется числом строк архива.
+    """
+
+    def __init__(self, path: Path, db_paths=(), tables=COLD_TABLES, after_days: Optional[int] = None,
+                 interval: float = 6 * 3600):
+        self.path = Path(path)
+        self.db_paths = [Path(db_path) for db_path in db_paths]
+        self.tables = tables
+        self.after_days = after_days  # None - только чтение, без переноса
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.stats = {
+            'runs': 0,
+            'moved': 0,
+            'segments': 0,  # Пересчитываются после каждого прохода переноса
+            'bytes': 0,
+            'last_run_ms': 0.0
+        }
+
+    def start(self):
+        """Запуск фонового переноса на текущем event loop"""
+        self._stopping = False
+        if self.after_days is not None and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Остановка фонового переноса"""
+        self._stopping = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        """Периодический запуск переноса"""
+        while True:
+            try:
+                await asyncio.to_thread(self.tier)
+            except Exception as e:
+                logger.error(f"Ошибка переноса в холодное хранилище: {e}")
+            await asyncio.sleep(self.interval)
+
+    def cutoff(self, now: Optional[datetime] = None) -> date:
+        """Первый день, остающийся в базе: начало месяца, в который попадает порог"""
+        threshold = (now or datetime.now()).date() - timedelta(days=self.after_days or 0)
+        return threshold.replace(day=1)
+
+    def tier(self, now: Optional[datetime] = None) -> int:
+        """Один проход переноса по всем базам; возвращает число перенесенных строк"""
+        started = time.perf_counter()
+        cutoff = self.cutoff(now)
+        moved = 0
+        with self._lock:
+            for db_path in self.db_paths:
+                if not db_path.exists():
+                    continue
+                conn = sqlite3.connect(str(db_path), timeout=30, isolation_level=None)
+                try:
+                    for table in self.tables:
+                        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+                        if not {'date', 'chat_id'} <= set(columns):
+                            continue
+                        moved += self._tier_table(conn, table, columns, cutoff)
+                finally:
+                    conn.close()
+        files = list(self.path.rglob(f"*{SEGMENT_SUFFIX}")) if self.path.exists() else []
+        self.stats['segments'] = len(files)
+        self.stats['bytes'] = sum(item.stat().st_size for item in files)
+        self.stats['runs'] += 1
+        self.stats['last_run_ms'] = (time.perf_counter() - started) * 1000
+        if moved:
+            logger.info(f"Перенос в холодное хранилище: {moved} строк до {cutoff.isoformat()}")
+        return moved
+
+    def _tier_table(self, conn, table: str, columns: list, cutoff: date) -> int:
+        """Перенос дневных партиций таблицы до cutoff
+
+        Строки читаются и записываются в сегменты вне транзакции, затем
+        удаляются коротким DELETE по дню и rowid, чтобы не держать блокировку
+        записи базы данных на время сжатия.
+        """
+        oldest = conn.execute(f"SELECT MIN(date) FROM {table}").fetchone()[0]
+        if oldest is None:
+            return 0
+        epoch = isinstance(oldest, (int, float))
+        day = _to_date(oldest)
+        chat_index = columns.index('chat_id') + 1
+        moved = 0
+        while day < cutoff and not self._stopping:
+            start = datetime.combine(day, datetime.min.time())
+            end = start + timedelta(days=1)
+            bounds = (start.timestamp(), end.timestamp()) if epoch else (start.isoformat(sep=' '), end.isoformat(sep=' '))
+            rows = conn.execute(
+                f"SELECT rowid, {', '.join(columns)} FROM {table} WHERE date >= ? AND date < ? ORDER BY chat_id, date",
+                bounds
+            ).fetchall()
+            if rows:
+                groups = {}
+                for row in rows:
+                    groups.setdefault(row[chat_index], []).append(row)
+                for chat_id, chat_rows in groups.items():
+                    self._append_segment(table, chat_id, day, [ROWID_COLUMN] + columns, chat_rows)
+                max_rowid = max(row[0] for row in rows)
+                conn.execute(f"DELETE FROM {table} WHERE date >= ? AND date < ? AND rowid <= ?", bounds + (max_rowid,))
+                moved += len(rows)
+            # Пустые дни пропускаются: следующий день - по ближайшей оставшейся строке
+            following = conn.execute(f"SELECT MIN(date) FROM {table} WHERE date >= ?", (bounds[1],)).fetchone()[0]
+            if following is None:
+                break
+            day = _to_date(following)
+        self.stats['moved'] += moved
+        return moved
+
+    def segment_path(self, table: str, chat_id, day: date) -> Path:
+        """Путь сегмента таблицы для чата и дня"""
+        return self.path / table / ('none' if chat_id is None else str(chat_id)) / f"{day.isoformat()}{SEGMENT_SUFFIX}"
+
+    def _append_segment(self, table: str, chat_id, day: date, columns: list, rows: list):
+        """Запись сегмента; columns и rows начинаются с rowid
+
+        Строки уже существующего сегмента сохраняются, новые добавляются,
+        если их rowid в сегменте еще нет.
+        """
+        path = self.segment_path(table, chat_id, day)
+        rows = [tuple(row) for row in rows]
+        if path.exists():
+            existing = Segment(path)
+            old_rows = [tuple(row[name] for name in columns) for row in existing.read(columns)]
+            if ROWID_COLUMN in existing.columns:
+                seen = {row[0] for row in old_rows}
+                rows = old_rows + [row for row in rows if row[0] not in seen]
+            else:
+                # Сегмент до появления rowid: сравнение по содержимому строк
+                seen = {row[1:] for row in old_rows}
+                rows = old_rows + [row for row in rows if row[1:] not in seen]
+        write_segment(path, {'table': table, 'chat_id': chat_id, 'day': day.isoformat()}, columns, rows)
+
+    def segments(self, table: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                 chat_id: Optional[int] = None):
+        """Пути сегментов с отбором по чату и дню (по именам файлов, без чтения)"""
+        root = self.path / table
+        if not root.exists():
+            return
+        if chat_id is not None:
+            chat_dirs = [root / str(chat_id)]
+        else:
+            chat_dirs = sorted(item for item in root.iterdir() if item.is_dir())
+        first = since.date() if since else None
+        last = until.date() if until else None
+        for chat_dir in chat_dirs:
+            if not chat_dir.exists():
+                continue
+            for path in sorted(chat_dir.glob(f"*{SEGMENT_SUFFIX}")):
+                day = date.fromisoformat(path.stem)
+                if (first and day < first) or (last and day > last):
+                    continue
+                yield day, path
+
+    def chat_ids(self, table: str) -> list:
+        """ID чатов (из базы данных), у которых есть сегменты таблицы"""
+        root = self.path / table
+        if not root.exists():
+            return []
+        return [int(item.name) for item in root.iterdir() if item.is_dir() and item.name.lstrip('-').isdigit()]
+
+    def chat_type(self, chat_id: int) -> Optional[str]:
+        """Тип чата по колонке chat_type его сообщений в сегментах"""
+        for _, path in self.segments('messages', chat_id=chat_id):
+            for value in Segment(path).column('chat_type'):
+                if value and value != UNKNOWN_TYPE:
+                    return value
+        return None
+
+    def drop_segments(self, table: str, chat_id: int, before: date) -> list:
+        """Удаление сегментов чата за дни до before; возвращает [(день, строк)]"""
+        dropped = []
+        with self._lock:
+            for day, path in self.segments(table, until=datetime.combine(before, datetime.min.time()), chat_id=chat_id):
+                if day >= before:
+                    continue
+                rows = Segment(path).rows
+                path.unlink()
+                dropped.append((day, rows))
+        return dropped
+
+    @staticmethod
+    def _partial(day: date, since: Optional[datetime], until: Optional[datetime]) -> bool:
+        """Нужна ли построчная проверка дат (день попадает на границу периода)"""
+        start = datetime.combine(day, datetime.min.time())
+        return bool((since and start < since) or (until and start + timedelta(days=1) > until))
+
+    @staticmethod
+    def _in_range(value, since: Optional[datetime], until: Optional[datetime]) -> bool:
+        """Попадает ли значение колонки date в период"""
+        if value is None:
+            return False
+        moment = datetime.fromtimestamp(value) if isinstance(value, (int, float)) else datetime.fromisoformat(str(value)[:19])
+        return (since is None or moment >= since) and (until is None or moment < until)
+
+    def iter_rows(self, table: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                  chat_id: Optional[int] = None, columns=None):
+        """Строки таблицы из холодного хранилища"""
+        for day, path in self.segments(table, since, until, chat_id):
+            segment = Segment(path)
+            rows = segment.read(columns and list(dict.fromkeys(list(columns) + ['date'])))
+            partial = self._partial(day, since, until)
+            for row in rows:
+                if partial and not self._in_range(row['date'], since, until):
+                    continue
+                if columns and 'date' not in columns:
+                    del row['date']
+                yield row
+
+    def records(self, table: str, skip: int = 0):
+        """Все строки таблицы записями records.py в постоянном порядке, пропуская первые skip"""
+        for index, row in enumerate(self.iter_rows(table)):
+            if index >= skip:
+                yield record_from_row(table, row)
+
+    def scan_column(self, table: str, column: str, since: Optional[datetime] = None,
+                    until: Optional[datetime] = None, chat_id: Optional[int] = None):
+        """Значения одной колонки (распаковывается только она и, на границах периода, date)"""
+        for day, path in self.segments(table, since, until, chat_id):
+            segment = Segment(path)
+            values = segment.column(column)
+            if self._partial(day, since, until):
+                dates = segment.column('date')
+                values = [value for value, moment in zip(values, dates) if self._in_range(moment, since, until)]
+            yield from values
+
+    def count(self, table: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+              chat_id: Optional[int] = None) -> int:
+        """Число строк: для целых дней - по заголовкам сегментов без распаковки"""
+        total = 0
+        for day, path in self.segments(table, since, until, chat_id):
+            segment = Segment(path)
+            if self._partial(day, since, until):
+                total += sum(1 for moment in segment.column('date') if self._in_range(moment, since, until))
+            else:
+                total += segment.rows
+        return total
+
+    def get_stats(self) -> dict:
+        """Статистика переноса и объем хранилища"""
+        return {
+            'runs': self.stats['runs'],
+            'moved': self.stats['moved'],
+            'segments': self.stats['segments'],
+            'bytes': self.stats['bytes'],
+            'last_run_ms': round(self.stats['last_run_ms'], 2)
+        }
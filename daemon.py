@@ -0,0 +1,350 @@
+"""
+Фоновый режим мониторинга без графического интерфейса
+"""
+import asyncio
+import getpass
+import hmac
+import json
+import os
+import signal
+import socket
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from config import config
+from auth import TelegramAuth
+from monitor import TelegramMonitor
+from logger import logger
+from sharding import open_database
+from export import StreamingExporter, export_header, parse_export_filters
+from filters import ALL_FILTERS, set_filter, filter_states
+from revisions import format_history
+
+# Адрес управления по умолчанию там, где нет Unix-сокетов
+DEFAULT_CONTROL_PORT = 8765
+
+# Конец ответа на команду управления
+RESPONSE_END = '.'
+
+
+def control_token() -> Optional[str]:
+    """Токен управления из config.control_token (обязателен для TCP)"""
+    return getattr(config, 'control_token', None) or None
+
+
+def export_dir() -> Path:
+    """Каталог, в который разрешен экспорт командой управления"""
+    return Path(getattr(config, 'export_dir', None) or Path(config.db_path).with_name('exports')).resolve()
+
+
+def resolve_export_path(path: str) -> Path:
+    """Путь экспорта внутри export_dir(); ValueError для путей вне каталога"""
+    base = export_dir()
+    target = (base / path).resolve()
+    if not target.is_relative_to(base):
+        raise ValueError(f"Экспорт разрешен только в каталог {base}")
+    return target
+
+
+def default_control_address() -> str:
+    """Unix-сокет рядом с базой данных или localhost-порт (Windows)"""
+    if hasattr(asyncio, 'start_unix_server'):
+        return str(Path(config.db_path).with_name('monitor.sock'))
+    return f"127.0.0.1:{DEFAULT_CONTROL_PORT}"
+
+
+def _split_address(address: str):
+    """(host, port) для TCP-адреса или None для пути Unix-сокета"""
+    host, _, port = address.rpartition(':')
+    if host and port.isdigit():
+        return host, int(port)
+    return None
+
+
+class MonitorDaemon:
+    """Мониторинг на основном event loop без Tkinter
+
+    Авторизация, монитор и база данных работают в одном потоке asyncio.
+    SIGINT/SIGTERM останавливают мониторинг со сбросом очереди записи.
+    Локальный сокет управления принимает команды построчно (stats, filter,
+    status, export, help); ответ завершается строкой из одной точки.
+    Если задан config.control_token, первой строкой клиент передает токен;
+    TCP без токена не включается. Экспорт пишет только в export_dir().
+    """
+
+    def __init__(self, control_address: Optional[str] = None, print_events: bool = False):
+        self.control_address = control_address or default_control_address()
+        self.print_events = print_events
+        self.event_filter = ALL_FILTERS  # Маска фильтров вывода (filters.py)
+        self.auth: Optional[TelegramAuth] = None
+        self.client = None
+        self.db = None
+        self.monitor: Optional[TelegramMonitor] = None
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.started = time.time()
+        self.token = control_token()
+        self.exporting = False
+        self._stop: Optional[asyncio.Event] = None
+
+    async def run(self) -> int:
+        """Запуск до сигнала остановки; возвращает код завершения"""
+        self._stop = asyncio.Event()
+        self._install_signal_handlers()
+
+        # Очередь записи сбрасывается и при ошибке запуска или работы
+        try:
+            if not await self._connect():
+                return 1
+            self.db = open_database(config.db_path)
+            self.monitor = TelegramMonitor(
+                self.client, self.db, event_callback=self._on_event if self.print_events else None
+            )
+            self.monitor.set_event_filter(self.event_filter)
+            await self.monitor.start()
+            if await self._start_control_server():
+                logger.info(f"Фоновый режим: управление через {self.control_address}")
+
+            await self._stop.wait()
+            return 0
+        finally:
+            await self.shutdown()
+
+    def _install_signal_handlers(self):
+        """Остановка по SIGINT/SIGTERM"""
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                # Windows: обработчик выполняется вне цикла событий
+                signal.signal(sig, lambda *_: loop.call_soon_threadsafe(self.stop))
+
+    def stop(self):
+        """Запрос остановки"""
+        if self._stop is not None and not self._stop.is_set():
+            logger.info("Получен сигнал остановки")
+            self._stop.set()
+
+    async def _connect(self) -> bool:
+        """Подключение и, при необходимости, авторизация из терминала"""
+        self.auth = TelegramAuth(config.api_id, config.api_hash, config.session_path)
+        self.auth.set_phone_code_callback(lambda: input("Код из Telegram: ").strip())
+        self.auth.set_password_callback(lambda: getpass.getpass("Облачный пароль: "))
+        try:
+            connected = await self.auth.connect()
+            if not connected:
+                if not sys.stdin.isatty():
+                    logger.error("Сессия не авторизована: запустите фоновый режим один раз из терминала")
+                    return False
+                if not await self.auth.authorize(config.phone):
+                    logger.error("Ошибка авторизации")
+                    return False
+        except Exception as e:
+            logger.error(f"Ошибка подключения: {e}")
+            return False
+        self.client = self.auth.get_client()
+        return True
+
+    async def shutdown(self):
+        """Остановка сервера управления и мониторинга со сбросом очереди"""
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+            if not _split_address(self.control_address):
+                Path(self.control_address).unlink(missing_ok=True)
+        if self.monitor is not None:
+            await self.monitor.shutdown()
+        if self.client is not None:
+            try:
+                await self.client.disconnect()
+            except Exception as e:
+                logger.error(f"Ошибка отключения: {e}")
+
+    async def _start_control_server(self) -> bool:
+        """Запуск локального сокета управления; False, если управление выключено"""
+        tcp = _split_address(self.control_address)
+        if tcp:
+            # Порт доступен любому локальному процессу, поэтому только с токеном
+            if not self.token:
+                logger.warning("Управление по TCP выключено: задайте config.control_token")
+                return False
+            self.server = await asyncio.start_server(self._handle_client, tcp[0], tcp[1])
+        else:
+            path = Path(self.control_address)
+            path.unlink(missing_ok=True)
+            # Сокет создается сразу с правами 0600: маска действует только на время bind
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            umask = os.umask(0o077)
+            try:
+                sock.bind(str(path))
+            except OSError:
+                sock.close()
+                raise
+            finally:
+                os.umask(umask)
+            self.server = await asyncio.start_unix_server(self._handle_client, sock=sock)
+        return True
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Обработка подключения: команда на строку, ответ до строки '.'"""
+        try:
+            if self.token:
+                line = await reader.readline()
+                token = line.decode('utf-8', errors='replace').strip()
+                if not hmac.compare_digest(token.encode('utf-8'), self.token.encode('utf-8')):
+                    writer.write(f"Ошибка: неверный токен управления\n{RESPONSE_END}\n".encode('utf-8'))
+                    await writer.drain()
+                    return
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode('utf-8', errors='replace').strip()
+                if not command:
+                    continue
+                try:
+                    response = await self.execute(command)
+                except Exception as e:
+                    response = f"Ошибка: {e}"
+                writer.write(f"{response}\n{RESPONSE_END}\n".encode('utf-8'))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def execute(self, command: str) -> str:
+        """Выполнение команды управления; возвращает текст ответа"""
+        parts = command.split()
+        cmd, args = parts[0].lower(), parts[1:]
+        if cmd in ('stats', 'stat'):
+            stats = self.monitor.get_stats()
+            if args and args[0] == 'json':
+                return json.dumps(stats, ensure_ascii=False, default=str)
+            return '\n'.join(f"{key}: {value}" for key, value in stats.items())
+        if cmd == 'filter':
+            return self._filter(args)
+        if cmd == 'status':
+            return self._status()
+        if cmd == 'export':
+            return await self._export(args)
+        if cmd == 'revisions':
+            return await self._revisions(args)
+        if cmd in ('help', '?'):
+            return ("stats [json]                 - статистика\n"
+                    "filter [<тип> <on/off>]      - фильтры вывода событий\n"
+                    "status                       - статус подключения\n"
+                    "revisions <chat_id> <message_id> - история правок сообщения\n"
+                    "export <файл> [since:ГГГГ-ММ-ДД] [until:ГГГГ-ММ-ДД] [chat:<id>] - экспорт (NDJSON/CSV, .gz) "
+                    f"в каталог {export_dir()}")
+        return f"Неизвестная команда: {cmd}"
+
+    def _filter(self, args) -> str:
+        """Команда filter: без аргументов - список, иначе <тип> <on/off>"""
+        if not args:
+            states = filter_states(self.event_filter)
+            return '\n'.join(f"{key}: {'on' if value else 'off'}" for key, value in states.items())
+        if len(args) < 2 or args[1].lower() not in ('on', 'off'):
+            return "Использование: filter <тип> <on/off>"
+        filter_type, value = args[0].lower(), args[1].lower() == 'on'
+        try:
+            self.event_filter = set_filter(self.event_filter, filter_type, value)
+        except ValueError as e:
+            return str(e)
+        if self.monitor is not None:
+            self.monitor.set_event_filter(self.event_filter)
+        return f"Фильтр '{filter_type}' {'включен' if value else 'выключен'}"
+
+    async def _revisions(self, args) -> str:
+        """Команда revisions: история правок сообщения"""
+        if len(args) != 2:
+            return "Использование: revisions <chat_id> <message_id>"
+        if self.monitor is None:
+            return "Мониторинг не запущен"
+        try:
+            chat_id, message_id = int(args[0]), int(args[1])
+        except ValueError:
+            return "chat_id и message_id должны быть числами"
+        versions = await asyncio.to_thread(self.monitor.revisions.history, chat_id, message_id)
+        if not versions:
+            return "Правок сообщения не найдено"
+        return format_history(versions)
+
+    def _status(self) -> str:
+        """Команда status"""
+        connected = bool(self.client and self.client.is_connected())
+        stats = self.monitor.get_stats() if self.monitor else {}
+        uptime = int(time.time() - self.started)
+        return '\n'.join((
+            f"Подключение: {'активно' if connected else 'нет'}",
+            f"Мониторинг: {'запущен' if self.monitor and self.monitor.running else 'остановлен'}",
+            f"База данных: {config.db_path}",
+            f"Работает: {uptime // 3600} ч {uptime % 3600 // 60} мин",
+            f"Нагрузка: {stats.get('load_level', 'normal')}, очередь БД: {stats.get('db_queue_depth', 0)}",
+            f"Экспорт: {'выполняется' if self.exporting else 'нет'}"
+        ))
+
+    async def _export(self, args) -> str:
+        """Команда export: выгрузка в отдельном потоке"""
+        if not args:
+            return "Использование: export <файл> [since:ГГГГ-ММ-ДД] [until:ГГГГ-ММ-ДД] [chat:<id>]"
+        if self.exporting:
+            return "Экспорт уже выполняется"
+        try:
+            target = resolve_export_path(args[0])
+        except ValueError as e:
+            return str(e)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        path, filters = str(target), parse_export_filters(args[1:])
+        compress = path.endswith('.gz')
+        fmt = 'csv' if path.endswith(('.csv', '.csv.gz')) else 'ndjson'
+        exporter = StreamingExporter(getattr(self.db, 'paths', None) or config.db_path,
+                                     cold=self.monitor.cold_store if self.monitor else None)
+        self.exporting = True
+        try:
+            header = await asyncio.to_thread(export_header, self.db)
+            total = await asyncio.to_thread(exporter.export, path, fmt=fmt, compress=compress,
+                                            header=header, **filters)
+        finally:
+            self.exporting = False
+        return f"Данные экспортированы: {path} ({total} строк)"
+
+    def _on_event(self, event_data: dict):
+        """Вывод событий в консоль (фильтры применяет монитор)"""
+        print(f"{datetime.now().strftime('%H:%M:%S')} {event_data.get('display', '')}", flush=True)
+
+
+def send_command(command: str, address: Optional[str] = None, timeout: float = 60) -> str:
+    """Отправка команды работающему фоновому процессу"""
+    async def request():
+        address_ = address or default_control_address()
+        tcp = _split_address(address_)
+        if tcp:
+            reader, writer = await asyncio.open_connection(tcp[0], tcp[1])
+        else:
+            reader, writer = await asyncio.open_unix_connection(address_)
+        token = control_token()
+        if token:
+            writer.write(token.encode('utf-8') + b'\n')
+        writer.write(command.encode('utf-8') + b'\n')
+        await writer.drain()
+        lines = []
+        while True:
+            line = (await reader.readline()).decode('utf-8')
+            if not line or line.rstrip('\n') == RESPONSE_END:
+                break
+            lines.append(line.rstrip('\n'))
+        writer.close()
+        return '\n'.join(lines)
+
+    return asyncio.run(asyncio.wait_for(request(), timeout))
+
+
+def main(control_address: Optional[str] = None, print_events: bool = False):
+    """Запуск фонового режима"""
+    daemon = MonitorDaemon(control_address, print_events)
+    sys.exit(asyncio.run(daemon.run()))
@@ -0,0 +1,65 @@
+"""
+Модуль кэша сущностей Telegram (чатов и пользователей)
+"""
+import time
+from collections import OrderedDict
+
+# Маркер отсутствия значения в кэше (None - допустимое закэшированное значение)
+MISSING = object()
+
+
+class EntityCache:
+    """LRU кэш сущностей с ограничением размера и временем жизни записей"""
+
+    def __init__(self, max_size: int = 5000, ttl: float = 600.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items: OrderedDict = OrderedDict()  # key -> (expires_at, value)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Получение значения из кэша или MISSING"""
+        item = self._items.get(key)
+        if item is None:
+            self.misses += 1
+            return MISSING
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._items[key]
+            self.misses += 1
+            return MISSING
+        self._items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Сохранение значения в кэше"""
+        self._items[key] = (time.monotonic() + self.ttl, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key):
+        """Удаление значения из кэша"""
+        self._items.pop(key, None)
+
+    def clear(self):
+        """Очистка кэша"""
+        self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get_stats(self) -> dict:
+        """Получение статистики кэша"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._items),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / total * 100, 1) if total else 0.0
+        }
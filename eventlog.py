@@ -0,0 +1,237 @@
+"""
+Модуль асинхронной записи журнала событий
+"""
+import asyncio
+import gzip
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import aiofiles
+
+from logger import logger
+
+
+class EventLogWriter:
+    """Фоновый журнал событий в формате JSON Lines
+
+    Замена синхронного app_logger на пути событий: обработчики вызывают
+    log_message, log_reaction, log_event и log_media с записями records.py,
+    и вызов только кладет запись в ограниченную очередь. Фоновая задача
+    пишет записи в JSON Lines через aiofiles крупными блоками. Если задан
+    `forward` (app_logger), записи дополнительно передаются ему словарями
+    Database в отдельном потоке - прежние логи сохраняются ценой двойной
+    записи, поэтому по умолчанию передача выключена. Файл ротируется
+    по размеру и возрасту, ротированные файлы сжимаются gzip в фоне,
+    хранится не больше `backups` архивов. При переполнении очереди записи
+    отбрасываются и учитываются в счетчике `dropped` - журнал никогда не
+    задерживает прием событий.
+    """
+
+    def __init__(self, path, max_bytes: int = 50 * 1024 * 1024, max_age: float = 86400,
+                 backups: int = 10, compress: bool = True, queue_size: int = 20000,
+                 batch_size: int = 2000, flush_interval: float = 1.0, forward=None):
+        self.forward = forward  # Синхронный логгер с методами log_<вид> (app_logger)
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.max_age = max_age  # Максимальный возраст файла до ротации (сек)
+        self.backups = backups
+        self.compress = compress
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval  # Максимальное ожидание накопления блока (сек)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._file = None
+        self._size = 0
+        self._opened = 0.0
+        self._compressing = set()
+        self._archive_lock = threading.Lock()  # Архивы сжимаются и удаляются по одному
+        self.stats = {
+            'written': 0,
+            'dropped': 0,
+            'errors': 0,
+            'rotations': 0
+        }
+
+    def log_message(self, record):
+        """Сообщение (MessageRecord)"""
+        self._put('message', record)
+
+    def log_reaction(self, record):
+        """Реакция (ReactionRecord)"""
+        self._put('reaction', record)
+
+    def log_event(self, record):
+        """Событие чата или пользователя (EventRecord)"""
+        self._put('event', record)
+
+    def log_media(self, record):
+        """Сохраненный медиафайл (MediaRecord)"""
+        self._put('media', record)
+
+    def _put(self, kind: str, record):
+        """Постановка записи в очередь без ожидания"""
+        try:
+            self.queue.put_nowait((kind, record))
+        except asyncio.QueueFull:
+            self.stats['dropped'] += 1
+
+    def start(self):
+        """Запуск фоновой задачи записи"""
+        self._closing = False
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Запись остатка очереди, закрытие файла и ожидание сжатия архивов"""
+        self._closing = True
+        if self._task is None or self._task.done():
+            # Задача не запущена - записываем остаток напрямую
+            batch = []
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            if batch:
+                try:
+                    await self._write(batch)
+                except Exception as e:
+                    self.stats['errors'] += len(batch)
+                    logger.error(f"Ошибка записи журнала событий ({len(batch)} записей): {e}")
+                finally:
+                    for _ in batch:
+                        self.queue.task_done()
+        else:
+            await self.queue.join()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        if self._file is not None:
+            await self._file.close()
+            self._file = None
+        if self._compressing:
+            await asyncio.gather(*self._compressing, return_exceptions=True)
+
+    async def _run(self):
+        """Цикл сбора и записи блоков"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            started = loop.time()
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                remaining = self.flush_interval - (loop.time() - started)
+                if remaining <= 0 or self._closing:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._write(batch)
+            except Exception as e:
+                self.stats['errors'] += len(batch)
+                logger.error(f"Ошибка записи журнала событий ({len(batch)} записей): {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def _write(self, batch: list):
+        """Запись блока в файл (и передача в app_logger, если задан) с ротацией перед записью"""
+        if self.forward is not None:
+            await asyncio.to_thread(self._forward, batch)
+        chunk = await asyncio.to_thread(self._encode, batch)
+        if self._file is None:
+            await self._open()
+        elif self._size >= self.max_bytes or time.time() - self._opened >= self.max_age:
+            await self._rotate()
+        await self._file.write(chunk)
+        await self._file.flush()
+        self._size += len(chunk)
+        self.stats['written'] += len(batch)
+
+    def _forward(self, batch: list):
+        """Вызов app_logger для каждой записи блока (в отдельном потоке)"""
+        for kind, record in batch:
+            try:
+                getattr(self.forward, f"log_{kind}")(record.as_dict() if hasattr(record, 'as_dict') else record)
+            except Exception as e:
+                logger.error(f"Ошибка передачи записи журнала в app_logger ({kind}): {e}")
+
+    @staticmethod
+    def _encode(batch: list) -> bytes:
+        """Сериализация блока записей в JSON Lines"""
+        lines = []
+        for kind, record in batch:
+            data = {'kind': kind}
+            data.update(record.fields() if hasattr(record, 'fields') else record)
+            date = data.get('date')
+            if isinstance(date, (int, float)):
+                data['date'] = datetime.fromtimestamp(date).isoformat()
+            lines.append(json.dumps(data, ensure_ascii=False, default=str))
+        lines.append('')
+        return '\n'.join(lines).encode('utf-8')
+
+    async def _open(self):
+        """Открытие текущего файла журнала на дозапись"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = await aiofiles.open(self.path, 'ab')
+        self._size = os.path.getsize(self.path)
+        # Возраст файла, оставшегося от прошлого запуска, считается с момента открытия
+        self._opened = time.time()
+
+    async def _rotate(self):
+        """Переименование текущего файла и сжатие архива в фоне"""
+        await self._file.close()
+        self._file = None
+        stamp = f"{datetime.now():%Y%m%d-%H%M%S}"
+        rotated = self.path.with_name(f"{self.path.stem}-{stamp}{self.path.suffix}")
+        counter = 1
+        while rotated.exists() or rotated.with_name(rotated.name + '.gz').exists():
+            rotated = self.path.with_name(f"{self.path.stem}-{stamp}-{counter}{self.path.suffix}")
+            counter += 1
+        os.replace(self.path, rotated)
+        self.stats['rotations'] += 1
+        await self._open()
+
+        task = asyncio.create_task(asyncio.to_thread(self._archive, rotated))
+        self._compressing.add(task)
+        task.add_done_callback(self._compressing.discard)
+
+    def _archive(self, rotated: Path):
+        """Сжатие ротированного файла и удаление лишних архивов (в отдельном потоке)"""
+        try:
+            with self._archive_lock:
+                suffix = self.path.suffix
+                if self.compress:
+                    with open(rotated, 'rb') as source, gzip.open(rotated.with_name(rotated.name + '.gz'), 'wb') as target:
+                        shutil.copyfileobj(source, target, 1024 * 1024)
+                    rotated.unlink()
+                    suffix += '.gz'
+                archives = sorted(self.path.parent.glob(f"{self.path.stem}-*{suffix}"),
+                                  key=lambda item: item.stat().st_mtime)
+                for old in archives[:max(0, len(archives) - self.backups)]:
+                    old.unlink(missing_ok=True)
+        except Exception as e:
+            logger.error(f"Ошибка архивирования журнала событий {rotated}: {e}")
+
+    def get_stats(self) -> dict:
+        """Получение статистики журнала"""
+        return {
+            'depth': self.queue.qsize(),
+            'written': self.stats['written'],
+            'dropped': self.stats['dropped'],
+            'errors': self.stats['errors'],
+            'rotations': self.stats['rotations']
+        }
@@ -0,0 +1,200 @@
+"""
+Модуль потокового экспорта данных
+"""
+import csv
+import gzip
+import json
+import sqlite3
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional
+
+from logger import logger
+
+# Таблицы базы данных, попадающие в экспорт
+EXPORT_TABLES = ('messages', 'reactions', 'events', 'media')
+
+
+def export_header(db) -> dict:
+    """Заголовок выгрузки со статистикой базы данных
+
+    Статистика считается запросами к базе данных, поэтому вызывается в
+    потоке экспорта, а не в потоке Tk или event loop.
+    """
+    header = {'export_date': datetime.now().isoformat()}
+    try:
+        header['statistics'] = db.get_statistics()
+    except Exception as e:
+        logger.error(f"Ошибка получения статистики для экспорта: {e}")
+    return header
+
+
+class ExportCancelled(Exception):
+    """Экспорт отменен пользователем"""
+
+
+def parse_export_filters(tokens) -> dict:
+    """Разбор фильтров экспорта since:ГГГГ-ММ-ДД until:ГГГГ-ММ-ДД chat:<id>
+
+    Возвращает именованные аргументы для StreamingExporter.export;
+    при ошибке разбора выбрасывает ValueError.
+    """
+    filters = {}
+    for token in tokens or []:
+        key, _, value = token.partition(':')
+        key = key.lower()
+        if key == 'since':
+            filters['since'] = datetime.strptime(value, '%Y-%m-%d')
+        elif key == 'until':
+            filters['until'] = datetime.strptime(value, '%Y-%m-%d') + timedelta(days=1)
+        elif key == 'chat':
+            filters['chat_id'] = int(value)
+        else:
+            raise ValueError(f"Неизвестный параметр экспорта: {token}")
+    return filters
+
+
+def _open_output(path: Path, compress: bool):
+    """Открытие файла для текстовой записи (с gzip-сжатием при необходимости)"""
+    if compress:
+        return gzip.open(path, 'wt', encoding='utf-8', newline='')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+class StreamingExporter:
+    """Постраничный экспорт базы данных в NDJSON или CSV
+
+    Читает SQLite файл базы данных напрямую (только чтение) страницами по
+    rowid и сразу пишет строки в файл, поэтому расход памяти не зависит от
+    объема истории. Выполняется в отдельном потоке. Вместо одного пути можно
+    передать список файлов шардов - таблицы выгружаются из всех по очереди.
+    Если передано холодное хранилище (ColdStore), перенесенные в него строки
+    выгружаются перед строками базы данных.
+    """
+
+    def __init__(self, db_path, tables=EXPORT_TABLES, page_size: int = 2000, cold=None):
+        paths = db_path if isinstance(db_path, (list, tuple)) else [db_path]
+        self.db_paths = [Path(path) for path in paths]
+        self.tables = tables
+        self.page_size = page_size
+        self.cold = cold
+        self.cancelled = False
+
+    def cancel(self):
+        """Запрос отмены экспорта"""
+        self.cancelled = True
+
+    @staticmethod
+    def _connect(db_path: Path):
+        """Подключение к базе данных только для чтения"""
+        conn = sqlite3.connect(f"file:{db_path.as_posix()}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _iter_rows(self, conn, table: str, since: Optional[datetime], until: Optional[datetime],
+                   chat_id: Optional[int], progress=None):
+        """Постраничное чтение строк таблицы с фильтрами"""
+        columns = {row['name'] for row in conn.execute(f"PRAGMA table_info({table})")}
+        conditions = ["rowid > ?"]
+        params = []
+        if since and 'date' in columns:
+            conditions.append("date >= ?")
+            params.append(since.isoformat(sep=' '))
+        if until and 'date' in columns:
+            conditions.append("date < ?")
+            params.append(until.isoformat(sep=' '))
+        if chat_id is not None and 'chat_id' in columns:
+            conditions.append("chat_id = ?")
+            params.append(chat_id)
+        sql = f"SELECT rowid AS _rowid, * FROM {table} WHERE {' AND '.join(conditions)} ORDER BY rowid LIMIT ?"
+
+        max_rowid = conn.execute(f"SELECT MAX(rowid) FROM {table}").fetchone()[0] or 0
+        last_rowid = 0
+        while True:
+            if self.cancelled:
+                raise ExportCancelled()
+            page = conn.execute(sql, [last_rowid] + params + [self.page_size]).fetchall()
+            if not page:
+                break
+            last_rowid = page[-1]['_rowid']
+            for row in page:
+                data = dict(row)
+                del data['_rowid']
+                yield data
+            if progress:
+                progress(table, last_rowid / max_rowid if max_rowid else 1.0)
+
+    @staticmethod
+    def _has_table(conn, table: str) -> bool:
+        """Есть ли таблица в базе данных"""
+        return conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name = ?", (table,)
+        ).fetchone() is not None
+
+    @staticmethod
+    def _columns(conns, table: str) -> list:
+        """Колонки таблицы по схеме всех баз (шардов) в порядке объявления"""
+        columns = {}
+        for conn in conns:
+            for row in conn.execute(f"PRAGMA table_info({table})"):
+                columns.setdefault(row['name'], None)
+        return list(columns)
+
+    def _iter_table(self, conns, table: str, since, until, chat_id, progress=None):
+        """Строки таблицы из холодного хранилища и всех баз (шардов) по очереди"""
+        if self.cold is not None:
+            for row in self.cold.iter_rows(table, since, until, chat_id):
+                if self.cancelled:
+                    raise ExportCancelled()
+                yield row
+        for conn in conns:
+            if self._has_table(conn, table):
+                yield from self._iter_rows(conn, table, since, until, chat_id, progress)
+
+    def export(self, path, fmt: str = 'ndjson', compress: bool = False,
+               since: Optional[datetime] = None, until: Optional[datetime] = None,
+               chat_id: Optional[int] = None, header: Optional[dict] = None, progress=None) -> int:
+        """Экспорт в файл; возвращает количество выгруженных строк
+
+        progress(table, доля 0..1, всего строк) вызывается после каждой страницы.
+        Для CSV каждая таблица пишется в отдельный файл `<имя>_<таблица>.csv`.
+        """
+        path = Path(path)
+        total = 0
+
+        def report(table, fraction):
+            if progress:
+                progress(table, fraction, total)
+
+        conns = [self._connect(db_path) for db_path in self.db_paths]
+        try:
+            tables = [table for table in self.tables if any(self._has_table(conn, table) for conn in conns)]
+            if fmt == 'ndjson':
+                with _open_output(path, compress) as f:
+                    if header is not None:
+                        if self.cold is not None:
+                            header = {**header, 'cold_rows': {table: self.cold.count(table) for table in tables}}
+                        f.write(json.dumps({'table': '_meta', **header}, ensure_ascii=False, default=str) + '\n')
+                    for table in tables:
+                        for row in self._iter_table(conns, table, since, until, chat_id, report):
+                            row['table'] = table
+                            f.write(json.dumps(row, ensure_ascii=False, default=str) + '\n')
+                            total += 1
+            elif fmt == 'csv':
+                suffix = '.csv.gz' if compress else '.csv'
+                stem = path.name[:-len(suffix)] if path.name.endswith(suffix) else path.stem
+                for table in tables:
+                    table_path = path.with_name(f"{stem}_{table}{suffix}")
+                    with _open_output(table_path, compress) as f:
+                        # Заголовок по схеме таблицы: первая строка может быть холодной, без новых колонок
+                        writer = csv.DictWriter(f, fieldnames=self._columns(conns, table), extrasaction='ignore')
+                        writer.writeheader()
+                        for row in self._iter_table(conns, table, since, until, chat_id, report):
+                            writer.writerow(row)
+                            total += 1
+            else:
+                raise ValueError(f"Неизвестный формат экспорта: {fmt}")
+        finally:
+            for conn in conns:
+                conn.close()
+        return total
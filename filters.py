@@ -0,0 +1,70 @@
+"""
+Модуль фильтров отображения событий
+"""
+
+# Ключи фильтров: категории событий и типы чатов (порядок задает биты маски)
+FILTER_KEYS = ('messages', 'my_messages', 'deleted', 'edited', 'reactions', 'events', 'status', 'media',
+               'private', 'group', 'supergroup', 'channel')
+
+# Ключ фильтра -> бит маски
+FILTER_BITS = {key: 1 << index for index, key in enumerate(FILTER_KEYS)}
+
+# Маска "показывать все"
+ALL_FILTERS = (1 << len(FILTER_KEYS)) - 1
+
+# Тип события монитора -> бит категории
+EVENT_FILTERS = {
+    'message': FILTER_BITS['messages'],
+    'message_deleted': FILTER_BITS['deleted'],
+    'message_edited': FILTER_BITS['edited'],
+    'reaction': FILTER_BITS['reactions'],
+    'chat_event': FILTER_BITS['events'],
+    'status': FILTER_BITS['status'],
+    'media': FILTER_BITS['media']
+}
+
+# Тип чата -> биты, которые должны быть включены (супергруппы скрываются и фильтром групп)
+CHAT_FILTERS = {
+    'private': FILTER_BITS['private'],
+    'group': FILTER_BITS['group'],
+    'supergroup': FILTER_BITS['group'] | FILTER_BITS['supergroup'],
+    'channel': FILTER_BITS['channel']
+}
+
+_OUTGOING = FILTER_BITS['my_messages']
+
+
+def compile_filters(states: dict) -> int:
+    """Маска из словаря ключ -> включен; отсутствующие ключи включены"""
+    mask = 0
+    for key, bit in FILTER_BITS.items():
+        if states.get(key, True):
+            mask |= bit
+    return mask
+
+
+def set_filter(mask: int, key: str, value: bool) -> int:
+    """Новая маска с измененным фильтром; key='all' меняет все фильтры"""
+    if key == 'all':
+        return ALL_FILTERS if value else 0
+    bit = FILTER_BITS.get(key)
+    if bit is None:
+        raise ValueError(f"Неизвестный тип фильтра: {key}")
+    return mask | bit if value else mask & ~bit
+
+
+def filter_states(mask: int) -> dict:
+    """Словарь ключ -> включен для отображения маски"""
+    return {key: bool(mask & bit) for key, bit in FILTER_BITS.items()}
+
+
+def event_allowed(mask: int, event_type: str, chat_type=None, outgoing: bool = False) -> bool:
+    """Проходит ли событие фильтры маски
+
+    Маска - обычное число: проверка не обращается к Tk и безопасна из любого
+    потока, а изменение фильтра - замена числа целиком.
+    """
+    required = EVENT_FILTERS.get(event_type, 0) | CHAT_FILTERS.get(chat_type, 0)
+    if outgoing and event_type == 'message':
+        required |= _OUTGOING
+    return mask & required == required
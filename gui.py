@@ -5,15 +5,40 @@ import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox, filedialog
 import asyncio
 import threading
-from datetime import datetime
+from collections import deque
+from datetime import datetime, timedelta
+from pathlib import Path
 from typing import Optional
-import json
 
 from config import config
 from auth import TelegramAuth
 from database import Database
+from sharding import open_database
 from monitor import TelegramMonitor
 from logger import logger
+from logview import LogView, LogRecord
+from search import SEARCH_KINDS
+from revisions import format_history
+from export import StreamingExporter, ExportCancelled, export_header, parse_export_filters
+from filters import FILTER_KEYS, ALL_FILTERS, compile_filters, event_allowed
+
+# Передача событий из потока event loop в поток Tk
+EVENT_QUEUE_LIMIT = 20000  # Максимум событий в очереди, остальные отбрасываются
+EVENT_LINES_PER_FRAME = 300  # Максимум строк, добавляемых в лог за один тик
+EVENT_DRAIN_INTERVAL_MS = 50  # Период разбора очереди событий
+
+SEARCH_RESULTS_LIMIT = 50  # Максимум результатов поиска в консоли
+LOG_CAPACITY = 100000  # Емкость кольцевого буфера истории лога
+LOG_TAGS = ('message', 'my_message', 'deleted', 'edited', 'reaction', 'event', 'status', 'media', 'info', 'error')
+# Тип события монитора -> тег строки лога
+EVENT_TAGS = {
+    'message_deleted': 'deleted',
+    'message_edited': 'edited',
+    'reaction': 'reaction',
+    'chat_event': 'event',
+    'status': 'status',
+    'media': 'media'
+}
 
 class TelegramMonitorGUI:
     """Графический интерфейс для мониторинга Telegram"""
@@ -32,6 +57,7 @@ class TelegramMonitorGUI:
         self.monitoring = False
         self.loop: Optional[asyncio.AbstractEventLoop] = None
         self.loop_thread: Optional[threading.Thread] = None
+        self.exporter: Optional[StreamingExporter] = None
         
         # Переменные для ввода
         self.phone_code_var = tk.StringVar()
@@ -54,9 +80,21 @@ class TelegramMonitorGUI:
             'supergroup': tk.BooleanVar(value=True),
             'channel': tk.BooleanVar(value=True)
         }
+        # Маска фильтров (filters.py) пересобирается при изменении флажков
+        # и передается монитору, чтобы скрытые события не форматировались
+        self.event_filter = ALL_FILTERS
+        for var in self.filters.values():
+            var.trace_add('write', self._on_filters_changed)
+        
+        # Очередь событий от монитора: пишет поток event loop, читает поток Tk.
+        # append/popleft у deque атомарны, блокировки не нужны
+        self.event_queue = deque()
+        self.events_dropped = 0  # Изменяется только потоком event loop
+        self._events_dropped_shown = 0  # Изменяется только потоком Tk
         
         self._create_widgets()
         self._start_event_loop()
+        self.root.after(EVENT_DRAIN_INTERVAL_MS, self._drain_events)
     
     def _create_widgets(self):
         """Создание виджетов интерфейса"""
@@ -324,15 +362,16 @@ class TelegramMonitorGUI:
         logs_container.pack(fill=tk.BOTH, expand=True)
         
         # Текстовое поле для логов
-        self.log_text = scrolledtext.ScrolledText(
+        self.log_view = LogView(
             logs_container,
+            capacity=LOG_CAPACITY,
             bg='#1e1e1e',
             fg='#ffffff',
             font=("Consolas", 9),
             wrap=tk.WORD,
             insertbackground='#ffffff'
         )
-        self.log_text.pack(fill=tk.BOTH, expand=True)
+        self.log_view.pack(fill=tk.BOTH, expand=True)
         
         # Разделитель
         separator_frame = tk.Frame(logs_container, height=2, bg='#3b3b3b')
@@ -423,74 +462,62 @@ class TelegramMonitorGUI:
     
     def _log(self, message: str, level: str = "INFO", event_type: str = "info"):
         """Добавление сообщения в лог с цветовой подсветкой"""
+        tag = event_type if event_type in LOG_TAGS else 'info'
+        self._append_lines([(message, tag)])
+    
+    def _append_lines(self, lines):
+        """Добавление пакета строк (текст, тег) в лог одной операцией"""
+        if not lines:
+            return
         timestamp = datetime.now().strftime("%H:%M:%S")
-        log_message = f"[{timestamp}] {message}\n"
-        
-        # Определение тега по типу события
-        tag = event_type if event_type in ['message', 'my_message', 'deleted', 'edited', 
-                                            'reaction', 'event', 'status', 'media', 'info', 'error'] else 'info'
-        
-        self.log_text.insert(tk.END, log_message, tag)
-        self.log_text.see(tk.END)
-        
-        # Ограничение размера логов (сохраняем последние 2000 строк)
-        if int(self.log_text.index('end-1c').split('.')[0]) > 2000:
-            self.log_text.delete('1.0', '200.0')
+        self.log_view.append_many([LogRecord(timestamp, tag, message) for message, tag in lines])
     
     def _on_event(self, event_data: dict):
-        """Обработка события от монитора"""
+        """Обработка события от монитора (вызывается из потока event loop)"""
+        if len(self.event_queue) >= EVENT_QUEUE_LIMIT:
+            self.events_dropped += 1
+            return
+        self.event_queue.append(event_data)
+    
+    def _drain_events(self):
+        """Разбор очереди событий в потоке Tk по таймеру"""
+        lines = []
+        queue = self.event_queue
+        for _ in range(min(len(queue), EVENT_LINES_PER_FRAME)):
+            line = self._format_event(queue.popleft())
+            if line:
+                lines.append(line)
+        
+        dropped = self.events_dropped - self._events_dropped_shown
+        if dropped:
+            self._events_dropped_shown += dropped
+            lines.append((f"⚠️ Пропущено событий: {dropped} (слишком высокая нагрузка)", 'error'))
+        
+        self._append_lines(lines)
+        self.root.after(EVENT_DRAIN_INTERVAL_MS, self._drain_events)
+    
+    def _format_event(self, event_data: dict):
+        """Проверка фильтров и подготовка строки (текст, тег) для события"""
         event_type = event_data.get('type', 'info')
-        display_text = event_data.get('display', '')
-        chat_type = event_data.get('chat_type', None)
-        
-        # Проверка фильтра по типу чата
-        if chat_type:
-            # Преобразование supergroup в group для фильтра
-            filter_key = 'group' if chat_type == 'supergroup' else chat_type
-            if filter_key in self.filters and not self.filters[filter_key].get():
-                return
+        outgoing = getattr(event_data.get('data'), 'is_outgoing', False)
+        
+        # Монитор уже отсеивает события по маске; повторная проверка числа
+        # убирает события, попавшие в очередь до изменения фильтров
+        if not event_allowed(self.event_filter, event_type, event_data.get('chat_type'), outgoing):
+            return None
         
-        # Проверка фильтров по типам событий
         if event_type == 'message':
-            if not self.filters['messages'].get():
-                return
-            # Проверка на свои сообщения
-            data = event_data.get('data', {})
-            if data.get('is_outgoing', False):
-                if not self.filters['my_messages'].get():
-                    return
-                tag = 'my_message'
-            else:
-                tag = 'message'
-        elif event_type == 'message_deleted':
-            if not self.filters['deleted'].get():
-                return
-            tag = 'deleted'
-        elif event_type == 'message_edited':
-            if not self.filters['edited'].get():
-                return
-            tag = 'edited'
-        elif event_type == 'reaction':
-            if not self.filters['reactions'].get():
-                return
-            tag = 'reaction'
-        elif event_type == 'chat_event':
-            if not self.filters['events'].get():
-                return
-            tag = 'event'
-        elif event_type == 'status':
-            if not self.filters['status'].get():
-                return
-            tag = 'status'
-        elif event_type == 'media':
-            if not self.filters['media'].get():
-                return
-            tag = 'media'
+            tag = 'my_message' if outgoing else 'message'
         else:
-            tag = 'info'
+            tag = EVENT_TAGS.get(event_type, 'info')
         
-        # Отображение в консоли
-        self._log(display_text, event_type=tag)
+        return event_data.get('display', ''), tag
+    
+    def _on_filters_changed(self, *_):
+        """Пересборка маски фильтров после изменения флажка"""
+        self.event_filter = compile_filters({key: var.get() for key, var in self.filters.items()})
+        if self.monitor:
+            self.monitor.set_event_filter(self.event_filter)
     
     def _update_status(self, text: str, color: str = "#ffffff"):
         """Обновление статуса"""
@@ -572,9 +599,10 @@ class TelegramMonitorGUI:
                 
                 if authorized:
                     self.client = self.auth.get_client()
-                    self.db = Database(config.db_path)
+                    self.db = open_database(config.db_path)
                     # Передаем callback для событий
                     self.monitor = TelegramMonitor(self.client, self.db, event_callback=self._on_event)
+                    self.monitor.set_event_filter(self.event_filter)
                     self.root.after(0, lambda: self._log("✅ Успешное подключение и авторизация!", event_type='info'))
                     self.root.after(0, lambda: self._update_status("✅ Подключено", "#4CAF50"))
                     self.root.after(0, lambda: self.monitor_btn.config(state=tk.NORMAL))
@@ -583,9 +611,10 @@ class TelegramMonitorGUI:
                     self.root.after(0, lambda: self._update_status("❌ Ошибка авторизации", "#f44336"))
             else:
                 self.client = self.auth.get_client()
-                self.db = Database(config.db_path)
+                self.db = open_database(config.db_path)
                 # Передаем callback для событий
                 self.monitor = TelegramMonitor(self.client, self.db, event_callback=self._on_event)
+                self.monitor.set_event_filter(self.event_filter)
                 self.root.after(0, lambda: self._log("✅ Успешное подключение!", event_type='info'))
                 self.root.after(0, lambda: self._update_status("✅ Подключено", "#4CAF50"))
                 self.root.after(0, lambda: self.monitor_btn.config(state=tk.NORMAL))
@@ -737,7 +766,7 @@ class TelegramMonitorGUI:
     
     def _clear_logs(self):
         """Очистка логов"""
-        self.log_text.delete('1.0', tk.END)
+        self.log_view.clear()
         self._log("Логи очищены", event_type='info')
     
     def _execute_command(self, event=None):
@@ -777,7 +806,9 @@ class TelegramMonitorGUI:
             elif cmd == 'filter':
                 self._handle_filter_command(args)
             elif cmd == 'export':
-                self._export_data()
+                self._export_data(args)
+            elif cmd == 'perf':
+                self._handle_perf_command(args)
             elif cmd == 'stop' or cmd == 'pause':
                 if self.monitoring:
                     self._stop_monitoring()
@@ -792,6 +823,8 @@ class TelegramMonitorGUI:
                     self._log("Мониторинг уже запущен или не подключен", event_type='info')
             elif cmd == 'status':
                 self._show_connection_status()
+            elif cmd == 'revisions':
+                self._show_revisions(args)
             elif cmd == 'search':
                 if args:
                     self._search_logs(' '.join(args))
@@ -833,6 +866,46 @@ class TelegramMonitorGUI:
                 self.command_entry.delete(0, tk.END)
         return "break"
     
+    def _handle_perf_command(self, args):
+        """Команда perf: сводка задержек, экспорт для Prometheus, сброс"""
+        if not self.monitor:
+            self._log("Мониторинг не подключен", event_type='error')
+            return
+        perf = self.monitor.perf
+        if args and args[0].lower() == 'reset':
+            perf.reset()
+            self._log("Замеры сброшены", event_type='info')
+            return
+        if args and args[0].lower() == 'export':
+            path = args[1] if len(args) > 1 else str(Path(config.db_path).with_name('metrics.prom'))
+            try:
+                self.monitor.export_metrics(path)
+                self._log(f"📈 Метрики записаны: {path}", event_type='info')
+            except Exception as e:
+                self._log(f"Ошибка записи метрик: {e}", event_type='error')
+            return
+        if args:
+            self._log("Использование: perf [export [путь]|reset]", event_type='error')
+            return
+        
+        rows = perf.snapshot()
+        if not rows:
+            self._log("Замеров пока нет", event_type='info')
+            return
+        lines = [
+            "═══════════════════════════════════════════════════════",
+            f"⏱️ ЗАДЕРЖКИ ЭТАПОВ (с {datetime.fromtimestamp(perf.started).strftime('%H:%M:%S')}), мс:",
+            "═══════════════════════════════════════════════════════",
+            f"{'Этап':<28}{'Кол-во':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'Макс':>10}{'Ошибки':>8}"
+        ]
+        for row in rows:
+            lines.append(
+                f"{row['stage']:<28}{row['count']:>9}{row['p50_ms']:>9}{row['p95_ms']:>9}"
+                f"{row['p99_ms']:>9}{row['max_ms']:>10}{row['errors']:>8}"
+            )
+        lines.append("═══════════════════════════════════════════════════════")
+        self._log('\n'.join(lines), event_type='info')
+    
     def _show_help(self):
         """Показ справки по командам"""
         help_text = """
@@ -847,21 +920,58 @@ filter <тип> <on/off> - Управление фильтрами
     filter messages on    - Включить фильтр сообщений
     filter private off    - Выключить фильтр личных чатов
     filter all on         - Включить все фильтры
-export                 - Экспортировать данные
+export [фильтры]       - Экспортировать данные (NDJSON/CSV, .gz - сжатие)
+  Фильтры: since:ГГГГ-ММ-ДД until:ГГГГ-ММ-ДД chat:<id>
 stop, pause           - Остановить мониторинг
 start, resume          - Запустить мониторинг
 status                 - Показать статус подключения
-search <текст>         - Поиск в логах
+perf [export [путь]|reset] - Задержки этапов (p50/p95/p99) и ошибки
+  export - записать метрики в файл формата Prometheus
+revisions <chat_id> <message_id> - История правок сообщения
+search <текст> [фильтры] - Поиск по сохраненным событиям
+  Фильтры: chat:<id|название> from:<id|username>
+           type:message|edited|deleted|reaction|event
+           since:ГГГГ-ММ-ДД until:ГГГГ-ММ-ДД
 spamtg <номер> <кол-во> - Отправить запросы на вход
   Пример: spamtg +1234567890 10
 ═══════════════════════════════════════════════════════
         """
         self._log(help_text.strip(), event_type='info')
     
+    def _show_revisions(self, args):
+        """Команда revisions: история правок сообщения"""
+        if not self.monitor or not self.monitor.running:
+            self._log("Мониторинг не запущен", event_type='error')
+            return
+        try:
+            chat_id, message_id = (int(arg) for arg in args)
+        except ValueError:
+            self._log("Использование: revisions <chat_id> <message_id>", event_type='error')
+            return
+        versions = self.monitor.revisions.history(chat_id, message_id)
+        if not versions:
+            self._log("Правок сообщения не найдено", event_type='info')
+            return
+        self._log(f"✏️ История правок ({len(versions) - 1}):\n{format_history(versions)}", event_type='info')
+    
+    def _chat_title(self, chat_id: int) -> str:
+        """Название чата по ID из базы данных: из таблицы чатов монитора, из агрегатов или сам ID"""
+        if not self.monitor:
+            return str(chat_id)
+        info = self.monitor.chats.by_id(chat_id)
+        if info is not None:
+            return info.title
+        return self.monitor.aggregates.chat_title(chat_id) or str(chat_id)
+    
     def _show_stats(self):
         """Показ статистики"""
         if self.monitor:
             stats = self.monitor.get_stats()
+            # Хранилище агрегатов открыто только пока мониторинг запущен
+            top_chats = ', '.join(
+                f"{self._chat_title(int(chat_id))} ({count})"
+                for chat_id, count in self.monitor.aggregates.top('chat', 'messages', 5)
+            ) if self.monitor.running else ''
             stats_text = f"""
 ═══════════════════════════════════════════════════════
 📊 СТАТИСТИКА МОНИТОРИНГА:
@@ -872,6 +982,24 @@ spamtg <номер> <кол-во> - Отправить запросы на вх
 Медиа:        {stats.get('media', 0)}
 Контакты:     {stats.get('contacts', 0)}
 Группы:       {stats.get('groups', 0)}
+Каналы:       {stats.get('channels', 0)}
+Правки:       {stats.get('edited', 0)}, удаления: {stats.get('deleted', 0)}
+За сеанс:     сообщений {stats.get('session_messages', 0)}, реакций {stats.get('session_reactions', 0)}, событий {stats.get('session_events', 0)}
+Активные чаты: {top_chats or 'нет данных'}
+Очередь БД:   {stats.get('db_queue_depth', 0)} (записано: {stats.get('db_written', 0)}, пакетов: {stats.get('db_batches', 0)}, ошибок: {stats.get('db_errors', 0)}, повторов: {stats.get('db_retries', 0)})
+Сброс в БД:   {stats.get('db_flush_ms_avg', 0)} мс в среднем, {stats.get('db_flush_ms_max', 0)} мс макс.
+Шарды БД:     {stats.get('db_shard_rows', 'не используются')}
+Очистка:      удалено {stats.get('retention_dropped', 0)} строк, партиций: {stats.get('retention_partitions', 0)}, в агрегатах: {stats.get('retention_rolled_up', 0)}
+Догрузка:     догружено {stats.get('catchup_backfilled', 0)}, уже в базе {stats.get('catchup_skipped', 0)}, чатов: {stats.get('catchup_tracked', 0)} (догружается: {stats.get('catchup_active', 0)}, запросов: {stats.get('catchup_requests', 0)})
+Архив:        перенесено {stats.get('cold_moved', 0)} строк, сегментов: {stats.get('cold_segments', 0)}, {stats.get('cold_bytes', 0)} байт
+Нагрузка:     {stats.get('load_level', 'normal')} (макс. ступень: {stats.get('load_max_level', 0)}, обработчиков: {stats.get('load_in_flight', 0)}/{stats.get('load_peak_in_flight', 0)}, задержка цикла: {stats.get('load_lag_ms', 0)}/{stats.get('load_max_lag_ms', 0)} мс)
+Снижение:     без отрисовки {stats.get('load_gui_skipped', 0)}, медиа отложено {stats.get('load_media_deferred', 0)} (ждет: {stats.get('load_media_deferred_pending', 0)}, сверх лимита: {stats.get('load_media_deferred_dropped', 0)}), реакций пропущено {stats.get('load_reactions_sampled_out', 0)}
+Журнал:       записано {stats.get('log_written', 0)}, в очереди {stats.get('log_queue_depth', 0)}, отброшено {stats.get('log_dropped', 0)}, ротаций {stats.get('log_rotations', 0)}
+Загрузка медиа: в очереди {stats.get('media_queued', 0)}, загружается {stats.get('media_active', 0)}, {stats.get('media_bytes', 0)} байт (ошибок: {stats.get('media_failed', 0)}, сверх бюджета: {stats.get('media_skipped_budget', 0)}, отброшено: {stats.get('media_dropped', 0)})
+Хранилище медиа: {stats.get('media_blobs', 0)} файлов, дубликатов: {stats.get('media_dedup_hits', 0)}, сэкономлено {stats.get('media_bytes_saved', 0)} байт
+Кэш сообщений: {stats.get('message_cache_size', 0)} (попаданий: {stats.get('message_cache_hits', 0)}, промахов: {stats.get('message_cache_misses', 0)})
+Правок сохранено дельтами: {stats.get('revisions', 0)}
+Кэш сущностей: {stats.get('entity_cache_size', 0)} (попаданий: {stats.get('entity_cache_hits', 0)}, промахов: {stats.get('entity_cache_misses', 0)}, {stats.get('entity_cache_hit_rate', 0)}%)
 ═══════════════════════════════════════════════════════
             """
             self._log(stats_text.strip(), event_type='info')
@@ -882,7 +1010,7 @@ spamtg <номер> <кол-во> - Отправить запросы на вх
         """Обработка команд фильтров"""
         if len(args) < 2:
             self._log("Использование: filter <тип> <on/off>", event_type='error')
-            self._log("Типы: messages, my_messages, deleted, edited, reactions, events, status, media, private, group, supergroup, channel, all", event_type='info')
+            self._log(f"Типы: {', '.join(FILTER_KEYS)}, all", event_type='info')
             return
         
         filter_type = args[0].lower()
@@ -927,20 +1055,58 @@ spamtg <номер> <кол-во> - Отправить запросы на вх
         self._log(status_text.strip(), event_type='info')
     
     def _search_logs(self, search_text):
-        """Поиск в логах"""
-        content = self.log_text.get('1.0', tk.END)
-        lines = content.split('\n')
-        matches = [i+1 for i, line in enumerate(lines) if search_text.lower() in line.lower()]
-        
-        if matches:
-            self._log(f"Найдено совпадений: {len(matches)}", event_type='info')
-            # Прокрутка к первому совпадению
+        """Поиск по сохраненным событиям"""
+        if not self.monitor or not self.monitor.running:
+            # Без запущенного мониторинга ищем только в истории лога
+            needle = search_text.lower()
+            matches = [i for i, record in enumerate(self.log_view.records) if needle in record.text.lower()]
+            
             if matches:
-                line_num = matches[0]
-                self.log_text.see(f"{line_num}.0")
-                self.log_text.mark_set(tk.INSERT, f"{line_num}.0")
-        else:
-            self._log(f"Совпадений не найдено: '{search_text}'", event_type='info')
+                # Прокрутка к первому совпадению (до записи в лог: новая строка может сдвинуть индексы буфера)
+                self.log_view.see_record(matches[0])
+                self._log(f"Найдено совпадений в логе: {len(matches)}", event_type='info')
+            else:
+                self._log(f"Совпадений не найдено: '{search_text}'", event_type='info')
+            return
+        
+        # Разбор фильтров вида ключ:значение, остальное - искомый текст
+        words = []
+        query = {}
+        keys = {'chat': 'chat', 'from': 'sender', 'type': 'kind', 'since': 'since', 'until': 'until'}
+        for token in search_text.split():
+            key, sep, value = token.partition(':')
+            if sep and key.lower() in keys and value:
+                query[keys[key.lower()]] = value
+            else:
+                words.append(token)
+        
+        try:
+            if 'since' in query:
+                query['since'] = datetime.strptime(query['since'], '%Y-%m-%d')
+            if 'until' in query:
+                query['until'] = datetime.strptime(query['until'], '%Y-%m-%d') + timedelta(days=1)
+        except ValueError:
+            self._log("Дата должна быть в формате ГГГГ-ММ-ДД", event_type='error')
+            return
+        if 'kind' in query and query['kind'] not in SEARCH_KINDS:
+            self._log(f"Неизвестный тип: {query['kind']}. Типы: {', '.join(SEARCH_KINDS)}", event_type='error')
+            return
+        
+        results, elapsed_ms = self.monitor.search_index.search(text=' '.join(words), limit=SEARCH_RESULTS_LIMIT, **query)
+        if not results:
+            self._log(f"Совпадений не найдено: '{search_text}' ({elapsed_ms:.1f} мс)", event_type='info')
+            return
+        
+        lines = [(f"🔎 Найдено: {len(results)}{'+' if len(results) == SEARCH_RESULTS_LIMIT else ''} ({elapsed_ms:.1f} мс)", 'info')]
+        for result in results:
+            date = datetime.fromtimestamp(result['date']).strftime('%Y-%m-%d %H:%M:%S') if result['date'] else '-'
+            text = (result['text'] or '').replace('\n', ' ')[:100]
+            lines.append((
+                f"  {date} | {result['kind']} | {result['chat_title'] or result['chat_id'] or '-'} | "
+                f"{result['sender'] or result['sender_id'] or 'Unknown'}: {text}",
+                'info'
+            ))
+        self._append_lines(lines)
     
     def _open_spam_dialog(self):
         """Открытие диалога для отправки запросов"""
@@ -1313,39 +1479,75 @@ spamtg <номер> <кол-во> - Отправить запросы на вх
         
         threading.Thread(target=spam_thread, daemon=True).start()
     
-    def _export_data(self):
-        """Экспорт данных"""
+    def _export_data(self, args=None):
+        """Экспорт данных (в фоновом потоке, постранично)"""
         if not self.db:
             messagebox.showerror("Ошибка", "База данных не инициализирована!")
             return
+        if self.exporter:
+            self._log("Экспорт уже выполняется", event_type='error')
+            return
+        
+        # Фильтры из консоли: since:ГГГГ-ММ-ДД until:ГГГГ-ММ-ДД chat:<id>
+        try:
+            filters = parse_export_filters(args)
+        except ValueError as e:
+            self._log(str(e), event_type='error')
+            self._log("Использование: export [since:ГГГГ-ММ-ДД] [until:ГГГГ-ММ-ДД] [chat:<id>]", event_type='error')
+            return
         
         file_path = filedialog.asksaveasfilename(
-            defaultextension=".json",
-            filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
+            defaultextension=".ndjson",
+            filetypes=[
+                ("NDJSON", "*.ndjson"),
+                ("NDJSON (gzip)", "*.ndjson.gz"),
+                ("CSV", "*.csv"),
+                ("CSV (gzip)", "*.csv.gz"),
+                ("All files", "*.*")
+            ]
         )
+        if not file_path:
+            return
         
-        if file_path:
+        compress = file_path.endswith('.gz')
+        fmt = 'csv' if file_path.endswith(('.csv', '.csv.gz')) else 'ndjson'
+        
+        self.exporter = StreamingExporter(getattr(self.db, 'paths', None) or config.db_path,
+                                          cold=self.monitor.cold_store if self.monitor else None)
+        self._log(f"💾 Экспорт начат: {file_path}", event_type='info')
+        last_reported = [0.0]
+        
+        def progress(table, fraction, total):
+            # Отчет в GUI не чаще, чем каждые 10% по таблице
+            if fraction - last_reported[0] >= 0.1 or fraction < last_reported[0]:
+                last_reported[0] = fraction
+                self.root.after(0, lambda: self._update_status(
+                    f"💾 Экспорт: {table} {fraction * 100:.0f}% ({total} строк)", "#FF9800"
+                ))
+        
+        def export_thread():
             try:
-                stats = self.db.get_statistics()
-                recent_events = self.db.get_recent_events(limit=1000)
-                
-                data = {
-                    'statistics': stats,
-                    'events': recent_events,
-                    'export_date': datetime.now().isoformat()
-                }
-                
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, ensure_ascii=False, indent=2)
-                
-                messagebox.showinfo("Успех", f"Данные экспортированы в {file_path}")
-                self._log(f"Данные экспортированы: {file_path}")
+                total = self.exporter.export(file_path, fmt=fmt, compress=compress, header=export_header(self.db),
+                                             progress=progress, **filters)
+                self.root.after(0, lambda: self._log(f"✅ Данные экспортированы: {file_path} ({total} строк)", event_type='info'))
+                self.root.after(0, lambda: messagebox.showinfo("Успех", f"Данные экспортированы в {file_path}"))
+            except ExportCancelled:
+                self.root.after(0, lambda: self._log("Экспорт отменен", event_type='info'))
             except Exception as e:
-                messagebox.showerror("Ошибка", f"Ошибка экспорта: {e}")
-                self._log(f"Ошибка экспорта: {e}", event_type='error')
+                # Имя e удаляется после блока except - отложенным вызовам передается готовый текст
+                msg = f"Ошибка экспорта: {e}"
+                self.root.after(0, lambda: self._log(msg, event_type='error'))
+                self.root.after(0, lambda: messagebox.showerror("Ошибка", msg))
+            finally:
+                self.exporter = None
+                self.root.after(0, lambda: self._update_status("✅ Подключено", "#4CAF50"))
+        
+        threading.Thread(target=export_thread, daemon=True).start()
     
     def on_closing(self):
         """Обработка закрытия приложения"""
+        if self.exporter:
+            self.exporter.cancel()
         if self.monitoring:
             self._stop_monitoring()
         if self.loop:
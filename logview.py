@@ -0,0 +1,172 @@
+"""
+Модуль виртуализированного просмотра логов
+"""
+import tkinter as tk
+from tkinter import ttk
+import tkinter.font as tkfont
+from typing import NamedTuple
+
+
+class LogRecord(NamedTuple):
+    """Запись лога событий"""
+    time: str
+    tag: str
+    text: str
+
+
+class RingBuffer:
+    """Кольцевой буфер фиксированной емкости: новые записи вытесняют самые старые"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._items = [None] * capacity
+        self._start = 0  # Индекс самой старой записи
+        self._len = 0
+
+    def append(self, item):
+        """Добавление записи"""
+        if self._len < self.capacity:
+            self._items[(self._start + self._len) % self.capacity] = item
+            self._len += 1
+        else:
+            self._items[self._start] = item
+            self._start = (self._start + 1) % self.capacity
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, index: int):
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError(index)
+        return self._items[(self._start + index) % self.capacity]
+
+    def slice(self, start: int, stop: int):
+        """Записи с индексами [start, stop), 0 - самая старая"""
+        start = max(0, start)
+        stop = min(self._len, stop)
+        return [self._items[(self._start + i) % self.capacity] for i in range(start, stop)]
+
+    def __iter__(self):
+        for i in range(self._len):
+            yield self._items[(self._start + i) % self.capacity]
+
+    def clear(self):
+        """Очистка буфера"""
+        self._items = [None] * self.capacity
+        self._start = 0
+        self._len = 0
+
+
+class LogView(tk.Frame):
+    """Просмотр лога: история хранится в кольцевом буфере,
+    в текстовом виджете отрисовываются только видимые строки"""
+
+    def __init__(self, master, capacity: int = 100000, **text_options):
+        super().__init__(master, bg=text_options.get('bg'))
+        self.records = RingBuffer(capacity)
+        self.first = 0  # Индекс первой видимой записи
+        self.follow = True  # Автопрокрутка к новым записям
+
+        self.text = tk.Text(self, **text_options)
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self._on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        font = tkfont.Font(font=self.text.cget('font'))
+        self._line_height = max(1, font.metrics('linespace'))
+
+        self.text.bind('<Configure>', lambda e: self.render())
+        self.text.bind('<MouseWheel>', self._on_mousewheel)
+        self.text.bind('<Button-4>', lambda e: self.scroll(-3))
+        self.text.bind('<Button-5>', lambda e: self.scroll(3))
+
+    def tag_configure(self, tag, **options):
+        """Настройка оформления тега"""
+        self.text.tag_configure(tag, **options)
+
+    @property
+    def visible_rows(self) -> int:
+        """Количество строк, помещающихся в виджет"""
+        return max(1, self.text.winfo_height() // self._line_height)
+
+    def append_many(self, records):
+        """Добавление записей и перерисовка"""
+        before = len(self.records)
+        added = 0
+        for record in records:
+            # Многострочные сообщения хранятся построчно
+            if '\n' in record.text:
+                for line in record.text.split('\n'):
+                    self.records.append(LogRecord(record.time, record.tag, line))
+                    added += 1
+            else:
+                self.records.append(record)
+                added += 1
+        if self.follow:
+            self.first = max(0, len(self.records) - self.visible_rows)
+        else:
+            # Вытесненные записи сдвигают индексы: видимое окно остается на тех же записях
+            evicted = max(0, before + added - len(self.records))
+            self.first = min(max(0, self.first - evicted), max(0, len(self.records) - self.visible_rows))
+        self.render()
+
+    def render(self):
+        """Отрисовка видимого окна записей"""
+        rows = self.visible_rows
+        total = len(self.records)
+        if self.follow:
+            self.first = max(0, total - rows)
+
+        args = []
+        for record in self.records.slice(self.first, self.first + rows):
+            args.append(f"[{record.time}] {record.text}\n")
+            args.append(record.tag)
+
+        self.text.delete('1.0', tk.END)
+        if args:
+            self.text.insert('1.0', *args)
+        if self.follow:
+            self.text.see(tk.END)
+
+        if total:
+            self.scrollbar.set(self.first / total, min(1.0, (self.first + rows) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def scroll(self, lines: int):
+        """Прокрутка на заданное число строк"""
+        max_first = max(0, len(self.records) - self.visible_rows)
+        self.first = min(max_first, max(0, self.first + lines))
+        self.follow = self.first >= max_first
+        self.render()
+
+    def see_record(self, index: int):
+        """Прокрутка к записи с заданным индексом"""
+        self.follow = False
+        self.first = max(0, index - self.visible_rows // 2)
+        self.scroll(0)
+
+    def clear(self):
+        """Очистка лога"""
+        self.records.clear()
+        self.first = 0
+        self.follow = True
+        self.render()
+
+    def _on_scrollbar(self, *args):
+        """Обработка действий полосы прокрутки"""
+        if args[0] == 'moveto':
+            self.first = int(float(args[1]) * len(self.records))
+            self.scroll(0)
+        elif args[0] == 'scroll':
+            amount = int(args[1])
+            if args[2] == 'pages':
+                amount *= self.visible_rows
+            self.scroll(amount)
+
+    def _on_mousewheel(self, event):
+        """Прокрутка колесом мыши"""
+        self.scroll(int(-1 * (event.delta / 120)) * 3)
+        return "break"
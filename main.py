@@ -1,6 +1,7 @@
 """
 Главный файл запуска приложения
 """
+import argparse
 import sys
 import os
 from pathlib import Path
@@ -8,8 +9,25 @@ from pathlib import Path
 # Добавление текущей директории в путь
 sys.path.insert(0, str(Path(__file__).parent))
 
-from gui import main
 
-if __name__ == "__main__":
-    main()
+def parse_args():
+    parser = argparse.ArgumentParser(description="Telegram Monitor")
+    parser.add_argument('--headless', action='store_true', help="Фоновый режим без графического интерфейса")
+    parser.add_argument('--print-events', action='store_true', help="Выводить события в консоль (фоновый режим)")
+    parser.add_argument('--control-address', help="Unix-сокет или host:port управления фоновым режимом")
+    parser.add_argument('--control', metavar='КОМАНДА', help="Отправить команду работающему фоновому процессу")
+    return parser.parse_args()
+
 
+if __name__ == "__main__":
+    args = parse_args()
+    if args.control:
+        from daemon import send_command
+        print(send_command(args.control, args.control_address))
+    elif args.headless:
+        # Tkinter в фоновом режиме не импортируется
+        from daemon import main
+        main(args.control_address, args.print_events)
+    else:
+        from gui import main
+        main()
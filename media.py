@@ -0,0 +1,343 @@
+"""
+Модуль фоновой загрузки медиа файлов
+"""
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Optional, Tuple
+
+from logger import logger
+
+# Порядок загрузки: сначала фото, затем более тяжелые типы
+MEDIA_PRIORITY = {
+    'photo': 0,
+    'image': 1,
+    'audio': 2,
+    'video': 3,
+    'document': 4
+}
+
+
+def telegram_file_id(message) -> Optional[str]:
+    """Постоянный идентификатор файла Telegram (фото или документа)"""
+    media = getattr(message, 'media', None)
+    photo = getattr(media, 'photo', None)
+    if photo is not None and getattr(photo, 'id', None):
+        return f"photo:{photo.id}"
+    document = getattr(media, 'document', None)
+    if document is not None and getattr(document, 'id', None):
+        return f"document:{document.id}"
+    return None
+
+
+def media_size(message) -> int:
+    """Размер медиа сообщения в байтах (0, если неизвестен)"""
+    file = getattr(message, 'file', None)
+    return getattr(file, 'size', None) or 0
+
+
+class MediaPipeline:
+    """Пул фоновых загрузок медиа с приоритетами и бюджетами по объему
+
+    Задачи (message, media_type, chat_id) ставятся в очередь с приоритетом,
+    рабочие задачи вызывают `download` с ограничением параллельности.
+    Бюджеты задаются в байтах за окно `budget_window` секунд (0 - без ограничения):
+    глобальный и на каждый чат. Файлы сверх бюджета не загружаются.
+    """
+
+    def __init__(self, download, workers: int = 3, max_concurrent: int = 2,
+                 global_budget: int = 0, chat_budget: int = 0,
+                 budget_window: float = 3600.0, max_queue: int = 1000):
+        self.download = download  # async (message, media_type, chat_id) -> Optional[str]
+        self.workers = workers
+        self.global_budget = global_budget
+        self.chat_budget = chat_budget
+        self.budget_window = budget_window
+        self.queue: asyncio.PriorityQueue = asyncio.PriorityQueue(maxsize=max_queue)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._max_concurrent = max_concurrent
+        self._tasks = []
+        self._counter = itertools.count()  # Порядок постановки при равном приоритете
+        self._window_started = time.monotonic()
+        self._global_used = 0
+        self._chat_used = {}
+        self.active = 0
+        self.stats = {
+            'downloaded': 0,
+            'bytes': 0,
+            'failed': 0,
+            'skipped_budget': 0,
+            'dropped': 0
+        }
+
+    def start(self):
+        """Запуск рабочих задач"""
+        if self._tasks:
+            return
+        self._semaphore = asyncio.Semaphore(self._max_concurrent)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def _item(self, message, media_type: str, chat_id: int, on_done) -> tuple:
+        """Элемент очереди с приоритетом"""
+        size = media_size(message)
+        priority = MEDIA_PRIORITY.get(media_type, len(MEDIA_PRIORITY))
+        return priority, size, next(self._counter), (message, media_type, chat_id, size, on_done)
+
+    def submit(self, message, media_type: str, chat_id: int, on_done=None) -> bool:
+        """Постановка загрузки в очередь; после загрузки вызывается on_done(message, chat_id, path)"""
+        try:
+            self.queue.put_nowait(self._item(message, media_type, chat_id, on_done))
+            return True
+        except asyncio.QueueFull:
+            self.stats['dropped'] += 1
+            logger.warning(f"Очередь загрузки медиа переполнена, файл сообщения {message.id} пропущен")
+            return False
+
+    async def put(self, message, media_type: str, chat_id: int, on_done=None):
+        """Постановка загрузки в очередь с ожиданием свободного места"""
+        await self.queue.put(self._item(message, media_type, chat_id, on_done))
+
+    def _reserve_budget(self, chat_id: int, size: int) -> bool:
+        """Проверка и резервирование бюджета на загрузку"""
+        now = time.monotonic()
+        if now - self._window_started >= self.budget_window:
+            self._window_started = now
+            self._global_used = 0
+            self._chat_used.clear()
+
+        chat_used = self._chat_used.get(chat_id, 0)
+        if self.global_budget and self._global_used + size > self.global_budget:
+            return False
+        if self.chat_budget and chat_used + size > self.chat_budget:
+            return False
+
+        self._global_used += size
+        self._chat_used[chat_id] = chat_used + size
+        return True
+
+    async def _worker(self):
+        """Рабочая задача загрузки"""
+        while True:
+            _, _, _, job = await self.queue.get()
+            message, media_type, chat_id, size, on_done = job
+            try:
+                if not self._reserve_budget(chat_id, size):
+                    self.stats['skipped_budget'] += 1
+                    continue
+                async with self._semaphore:
+                    self.active += 1
+                    try:
+                        path = await self.download(message, media_type, chat_id)
+                    finally:
+                        self.active -= 1
+                if path:
+                    self.stats['downloaded'] += 1
+                    self.stats['bytes'] += size
+                    if on_done:
+                        await on_done(message, chat_id, path)
+                else:
+                    self.stats['failed'] += 1
+            except Exception as e:
+                self.stats['failed'] += 1
+                logger.error(f"Ошибка загрузки медиа: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def close(self, timeout: float = 0):
+        """Остановка рабочих задач
+
+        Очередь дозагружается не дольше timeout секунд, оставшиеся и
+        прерванные загрузки отбрасываются.
+        """
+        if timeout and self._tasks:
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        pending = self.queue.qsize() + self.active
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        while not self.queue.empty():
+            self.queue.get_nowait()
+            self.queue.task_done()
+        if pending:
+            self.stats['dropped'] += pending
+            logger.warning(f"Остановка загрузки медиа: пропущено файлов в очереди: {pending}")
+
+    def get_stats(self) -> dict:
+        """Получение статистики загрузок"""
+        stats = self.stats.copy()
+        stats['queued'] = self.queue.qsize()
+        stats['active'] = self.active
+        return stats
+
+
+class MediaStore:
+    """Хранилище медиа с адресацией по содержимому
+
+    Файл хранится один раз под ключом `<sha256><расширение>` в каталоге
+    `blobs/<ab>/<cd>/`. Индекс "ID файла Telegram -> ключ" хранится в
+    дописываемом JSONL файле и позволяет не скачивать повторно пересланные
+    файлы; после загрузки дубликаты отсеиваются по хэшу содержимого.
+    Одновременные запросы одного файла (`fetch`) ждут одну загрузку, индекс
+    обновляется под блокировкой: `commit` выполняется в рабочих потоках.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.tmp_dir = self.root / 'tmp'
+        self.index_path = self.root / 'index.jsonl'
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        # Недокачанные файлы прошлого запуска
+        self.clear_temp()
+        self._by_file_id = {}  # ID файла Telegram -> (ключ, размер)
+        self._sizes = {}  # ключ -> размер
+        self._lock = threading.Lock()  # Индекс и перенос файлов из рабочих потоков
+        self._in_flight = {}  # ID файла Telegram -> Future с (ключ, размер) текущей загрузки
+        self.stats = {
+            'hits_file_id': 0,
+            'hits_hash': 0,
+            'stored': 0,
+            'bytes_saved': 0
+        }
+        self._load_index()
+
+    def _load_index(self):
+        """Загрузка индекса хранилища"""
+        if not self.index_path.exists():
+            return
+        with open(self.index_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                self._sizes[entry['key']] = entry['size']
+                if entry.get('file_id'):
+                    self._by_file_id[entry['file_id']] = (entry['key'], entry['size'])
+
+    def blob_path(self, key: str) -> Path:
+        """Путь к файлу по ключу"""
+        return self.root / key[:2] / key[2:4] / key
+
+    def temp_path(self) -> Path:
+        """Временный путь для загрузки"""
+        return self.tmp_dir / uuid.uuid4().hex
+
+    def discard_temp(self, temp_path: Path):
+        """Удаление временного файла загрузки (Telethon может дописать к имени расширение)"""
+        for path in self.tmp_dir.glob(f"{Path(temp_path).name}*"):
+            path.unlink(missing_ok=True)
+
+    def clear_temp(self) -> int:
+        """Удаление всех временных файлов; возвращает их число"""
+        removed = 0
+        for path in self.tmp_dir.iterdir():
+            if path.is_file():
+                path.unlink(missing_ok=True)
+                removed += 1
+        return removed
+
+    def lookup(self, file_id: Optional[str]) -> Optional[Tuple[str, int]]:
+        """Поиск уже сохраненного файла по ID Telegram: (ключ, размер) или None"""
+        if not file_id:
+            return None
+        with self._lock:
+            found = self._by_file_id.get(file_id)
+            if found and not self.blob_path(found[0]).exists():
+                # Файл удален с диска - загружается заново
+                del self._by_file_id[file_id]
+                found = None
+            if found:
+                self.stats['hits_file_id'] += 1
+                self.stats['bytes_saved'] += found[1]
+        return found
+
+    async def fetch(self, file_id: Optional[str], download) -> Optional[Tuple[str, int]]:
+        """Сохраненный файл по ID Telegram или его загрузка: (ключ, размер) или None
+
+        download(temp_path) -> (путь загруженного файла, расширение) или None.
+        Запросы того же file_id во время загрузки ждут ее результат.
+        """
+        found = self.lookup(file_id)
+        if found:
+            return found
+        pending = self._in_flight.get(file_id) if file_id else None
+        if pending is not None:
+            found = await asyncio.shield(pending)
+            if found:
+                with self._lock:
+                    self.stats['hits_file_id'] += 1
+                    self.stats['bytes_saved'] += found[1]
+            return found
+
+        future = asyncio.get_running_loop().create_future()
+        if file_id:
+            self._in_flight[file_id] = future
+        result = None
+        try:
+            temp_path = self.temp_path()
+            try:
+                downloaded = await download(temp_path)
+            except BaseException:
+                self.discard_temp(temp_path)
+                raise
+            if not downloaded:
+                self.discard_temp(temp_path)
+                return None
+            path, extension = downloaded
+            result = await asyncio.to_thread(self.commit, Path(path), extension, file_id)
+            return result
+        finally:
+            # Ожидающие получают None при ошибке или отмене загрузки
+            future.set_result(result)
+            if file_id:
+                self._in_flight.pop(file_id, None)
+
+    def commit(self, downloaded: Path, extension: str, file_id: Optional[str]) -> Tuple[str, int]:
+        """Перенос загруженного файла в хранилище; возвращает (ключ, размер)
+
+        Выполняет файловый ввод-вывод, вызывается через asyncio.to_thread.
+        """
+        digest = hashlib.sha256()
+        with open(downloaded, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        key = digest.hexdigest() + extension
+        size = downloaded.stat().st_size
+
+        target = self.blob_path(key)
+        with self._lock:
+            if target.exists():
+                # Такое содержимое уже есть - временный файл не нужен
+                os.remove(downloaded)
+                self.stats['hits_hash'] += 1
+                self.stats['bytes_saved'] += size
+            else:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(downloaded, target)
+                self.stats['stored'] += 1
+
+            is_new_file_id = bool(file_id) and self._by_file_id.get(file_id) != (key, size)
+            if key not in self._sizes or is_new_file_id:
+                with open(self.index_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps({'key': key, 'size': size, 'file_id': file_id}) + '\n')
+            self._sizes[key] = size
+            if file_id:
+                self._by_file_id[file_id] = (key, size)
+        return key, size
+
+    def get_stats(self) -> dict:
+        """Получение статистики хранилища"""
+        with self._lock:
+            stats = self.stats.copy()
+            stats['blobs'] = len(self._sizes)
+        return stats
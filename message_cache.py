@@ -0,0 +1,80 @@
+"""
+Модуль локального кэша сообщений
+"""
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from chats import ChatInfo
+
+
+class CachedMessage(NamedTuple):
+    """Содержимое увиденного сообщения, нужное для записи об удалении"""
+    chat: ChatInfo
+    sender_id: Optional[int]
+    sender_username: Optional[str]
+    sender_first_name: Optional[str]
+    sender_last_name: Optional[str]
+    text: str
+    media_type: Optional[str]
+    is_outgoing: bool
+
+
+class MessageCache:
+    """Ограниченный LRU кэш сообщений по ключу (chat_id, message_id)
+
+    В личных чатах и обычных группах ID сообщений сквозные для аккаунта,
+    а события удаления приходят без чата - для них ведется дополнительный
+    индекс message_id -> chat_id.
+    """
+
+    def __init__(self, max_entries: int = 200000):
+        self.max_entries = max_entries
+        self._messages: OrderedDict = OrderedDict()  # (chat_id, message_id) -> CachedMessage
+        self._chat_by_message_id = {}  # message_id -> chat_id (только личные чаты и группы)
+        self.hits = 0
+        self.misses = 0
+
+    def put(self, message_id: int, message: CachedMessage):
+        """Сохранение сообщения"""
+        key = (message.chat.id, message_id)
+        self._messages[key] = message
+        self._messages.move_to_end(key)
+        if message.chat.type in ('private', 'group'):
+            self._chat_by_message_id[message_id] = message.chat.id
+        while len(self._messages) > self.max_entries:
+            (chat_id, old_id), _ = self._messages.popitem(last=False)
+            if self._chat_by_message_id.get(old_id) == chat_id:
+                del self._chat_by_message_id[old_id]
+
+    def get(self, chat_id: int, message_id: int) -> Optional[CachedMessage]:
+        """Получение сообщения по чату и ID"""
+        message = self._messages.get((chat_id, message_id))
+        if message is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return message
+
+    def pop(self, chat_id: Optional[int], message_id: int) -> Optional[CachedMessage]:
+        """Извлечение сообщения из кэша; без chat_id чат ищется по ID сообщения"""
+        if chat_id is None:
+            chat_id = self._chat_by_message_id.get(message_id)
+        message = self._messages.pop((chat_id, message_id), None)
+        if message is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if self._chat_by_message_id.get(message_id) == chat_id:
+            del self._chat_by_message_id[message_id]
+        return message
+
+    def __len__(self):
+        return len(self._messages)
+
+    def get_stats(self) -> dict:
+        """Получение статистики кэша"""
+        return {
+            'size': len(self._messages),
+            'hits': self.hits,
+            'misses': self.misses
+        }
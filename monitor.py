@@ -2,20 +2,37 @@
 Модуль мониторинга Telegram
 """
 import asyncio
+import time
+from collections import deque
 from datetime import datetime
 from typing import Optional
 from telethon import TelegramClient, events
 from telethon.tl.types import (
     MessageService, MessageMediaPhoto, MessageMediaDocument,
-    UserStatusOnline, UserStatusOffline, UserStatusRecently,
-    User, Chat, Channel
+    UserStatusOnline, UserStatusOffline, UserStatusRecently
 )
 from pathlib import Path
-import aiofiles
 
 from config import config, MEDIA_DIR
 from database import Database
 from logger import app_logger, logger
+from writer import WriteBehindQueue
+from entity_cache import EntityCache, MISSING
+from chats import ChatTable, ChatInfo, classify_chat
+from reactions import ReactionTracker, extract_reactions
+from media import MediaPipeline, MediaStore, telegram_file_id
+from search import SearchIndex
+from message_cache import MessageCache, CachedMessage
+from revisions import RevisionStore
+from retention import RetentionManager
+from coldstore import ColdStore, COLD_TABLES
+from catchup import CatchupEngine
+from stats import StatsStore
+from backpressure import BackpressureController, LEVEL_DEFER_MEDIA
+from perf import PerfRegistry
+from eventlog import EventLogWriter
+from filters import ALL_FILTERS, event_allowed
+from records import MessageRecord, EditRecord, ReactionRecord, EventRecord, MediaRecord
 
 class TelegramMonitor:
     """Класс для мониторинга Telegram"""
@@ -23,8 +40,23 @@ class TelegramMonitor:
     def __init__(self, client: TelegramClient, db: Database, event_callback=None):
         self.client = client
         self.db = db
-        self.logger = app_logger
-        self.event_callback = event_callback  # Callback для передачи событий в GUI
+        # Журнал событий пишется в фоне: вызовы log_* только ставят запись в очередь.
+        # Передача в app_logger (прежние логи) удваивает запись и включается config.event_log_forward
+        self.event_log = EventLogWriter(
+            getattr(config, 'event_log_path', None) or Path(config.db_path).with_name('events.jsonl'),
+            max_bytes=getattr(config, 'event_log_max_bytes', 50 * 1024 * 1024),
+            max_age=getattr(config, 'event_log_max_age', 86400),
+            backups=getattr(config, 'event_log_backups', 10),
+            compress=getattr(config, 'event_log_compress', True),
+            forward=app_logger if getattr(config, 'event_log_forward', False) else None
+        )
+        self.logger = self.event_log
+        # Замеры задержек этапов обработки
+        self.perf = PerfRegistry()
+        # Callback для передачи событий в GUI
+        self.event_callback = self.perf.wrap('gui.callback', event_callback) if event_callback else None
+        # Маска фильтров отображения: отфильтрованные события не доходят до callback
+        self.event_filter = ALL_FILTERS
         self.stats = {
             'messages': 0,
             'reactions': 0,
@@ -33,12 +65,159 @@ class TelegramMonitor:
             'contacts': 0,
             'groups': 0
         }
+        # Хранилище медиа с дедупликацией по содержимому
+        self.media_store = MediaStore(getattr(config, 'media_store_path', None) or MEDIA_DIR / 'blobs')
+        # Фоновая загрузка медиа
+        self.media = MediaPipeline(
+            self.perf.wrap_async('media.save', self._save_media),
+            workers=getattr(config, 'media_workers', 3),
+            max_concurrent=getattr(config, 'media_max_concurrent', 2),
+            global_budget=getattr(config, 'media_global_budget', 0),
+            chat_budget=getattr(config, 'media_chat_budget', 0),
+            budget_window=getattr(config, 'media_budget_window', 3600)
+        )
         self.running = False
         self.me = None  # Информация о себе
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        # Отложенная пакетная запись в БД
+        self.writer = WriteBehindQueue(
+            db,
+            batch_size=getattr(config, 'db_batch_size', 500),
+            max_age=getattr(config, 'db_flush_interval', 0.5),
+            perf=self.perf,
+            dead_letter_path=getattr(config, 'db_dead_letter_path', None) or Path(config.db_path).with_name('failed_rows.jsonl')
+        )
+        # Локальные хранилища, пополняемые очередью записи (открываются в _open_stores)
+        self.search_index: Optional[SearchIndex] = None
+        self.aggregates: Optional[StatsStore] = None
+        self.revisions: Optional[RevisionStore] = None
+        self.catchup: Optional[CatchupEngine] = None
+        # Зарегистрированные обработчики событий: (обработчик, построитель)
+        self._handlers = []
+        # Кэш чатов и отправителей, чтобы не ходить в сеть на каждое событие
+        self.entity_cache = EntityCache(
+            max_size=getattr(config, 'entity_cache_size', 5000),
+            ttl=getattr(config, 'entity_cache_ttl', 600)
+        )
+        # Описания чатов (ID, тип, название, иконка), вычисляются один раз на чат
+        self.chats = ChatTable()
+        # Локальный кэш сообщений для записей об удалении
+        self.message_cache = MessageCache(max_entries=getattr(config, 'message_cache_size', 200000))
+        # Снимки реакций для записи только реальных изменений
+        self.reactions = ReactionTracker(
+            max_age=getattr(config, 'reaction_snapshot_max_age', 3 * 24 * 3600)
+        )
+        # Снижение нагрузки при потоке обновлений
+        self.backpressure = BackpressureController(
+            backlog_thresholds=getattr(config, 'load_backlog_thresholds', (200, 500, 1000)),
+            lag_thresholds=getattr(config, 'load_lag_thresholds', (0.1, 0.25, 0.5)),
+            calm_period=getattr(config, 'load_calm_period', 5.0),
+            sample_rate=getattr(config, 'load_reaction_sample_rate', 10),
+            on_change=self._on_load_level_changed,
+            on_lag=lambda lag: self.perf.observe('loop.lag', lag)
+        )
+        self._metrics_task: Optional[asyncio.Task] = None
+        # Медиа, отложенное на время перегрузки (сами сообщения пишутся сразу)
+        self._deferred_media = deque(maxlen=getattr(config, 'media_deferred_limit', 10000))
+        self._deferred_media_dropped = 0
+        # Холодное хранилище старой истории: читается всегда, перенос - при config.cold_after_days
+        self.cold_store = ColdStore(
+            getattr(config, 'cold_path', None) or Path(config.db_path).with_name('cold'),
+            getattr(db, 'paths', None) or [config.db_path],
+            tables=getattr(config, 'cold_tables', COLD_TABLES),
+            after_days=getattr(config, 'cold_after_days', None),
+            interval=getattr(config, 'cold_interval', 6 * 3600)
+        )
+        # Очистка по срокам хранения (включается политиками config.retention): база и холодное хранилище
+        self.retention: Optional[RetentionManager] = None
+        policies = getattr(config, 'retention', None)
+        if policies:
+            self.retention = RetentionManager(
+                getattr(db, 'paths', None) or [config.db_path],
+                Path(config.db_path).with_name('retention.db'),
+                policies,
+                chats=self.chats,
+                rollup=getattr(config, 'retention_rollup', False),
+                interval=getattr(config, 'retention_interval', 3600),
+                on_dropped=self._on_partition_dropped,
+                cold=self.cold_store
+            )
+        # Хранилища открываются после холодного: при первом построении они учитывают его строки
+        self._stores_open = False
+        self._open_stores()
+    
+    def _open_stores(self):
+        """Открытие локальных хранилищ и подписка их на очередь записи"""
+        # Поисковый индекс пополняется строками, записанными в БД
+        self.search_index = SearchIndex(
+            Path(config.db_path).with_name('search_index.db'),
+            getattr(self.db, 'paths', None) or [config.db_path],
+            cold=self.cold_store
+        )
+        self.writer.add_sink(self.search_index.on_rows)
+        # Накопительная статистика обновляется теми же пакетами записи
+        self.aggregates = StatsStore(
+            Path(config.db_path).with_name('stats.db'),
+            getattr(self.db, 'paths', None) or [config.db_path],
+            cold=self.cold_store
+        )
+        self.writer.add_sink(self.aggregates.on_rows)
+        # История правок хранится дельтами отдельно от строк сообщений
+        self.revisions = RevisionStore(Path(config.db_path).with_name('revisions.db'))
+        self.writer.register('record_edit', self.revisions.on_edits)
+        # Догрузка сообщений, пропущенных за время остановки или разрыва соединения
+        if getattr(config, 'catchup', True):
+            self.catchup = CatchupEngine(
+                self.client,
+                Path(config.db_path).with_name('catchup.db'),
+                lambda event: self._dispatch(self._handle_message, event),
+                getattr(self.db, 'paths', None) or [config.db_path],
+                concurrency=getattr(config, 'catchup_concurrency', 4),
+                batch_size=getattr(config, 'catchup_batch_size', 100),
+                max_per_chat=getattr(config, 'catchup_max_per_chat', 5000)
+            )
+            self.writer.add_sink(self.catchup.on_rows)
+        self._stores_open = True
+    
+    def _sync_stores(self):
+        """Досчет статистики и дозаполнение поиска по базе данных (в отдельном потоке)"""
+        self.aggregates.sync()
+        self.search_index.backfill()
+    
+    def _close_stores(self):
+        """Отписка локальных хранилищ от очереди записи и закрытие их файлов"""
+        self.writer.remove_sink(self.search_index.on_rows)
+        self.writer.remove_sink(self.aggregates.on_rows)
+        self.writer.unregister('record_edit')
+        self.search_index.close()
+        self.aggregates.close()
+        self.revisions.close()
+        if self.catchup:
+            self.writer.remove_sink(self.catchup.on_rows)
+            self.catchup.close()
+        self._stores_open = False
     
     async def start(self):
         """Запуск мониторинга"""
         self.running = True
+        # После остановки хранилища закрыты - при повторном запуске открываются заново
+        if not self._stores_open:
+            self._open_stores()
+        # Строки, записанные в базу, но не попавшие в статистику и поиск (сбой, новое хранилище)
+        try:
+            await asyncio.to_thread(self._sync_stores)
+        except Exception as e:
+            logger.error(f"Ошибка досчета локальных хранилищ: {e}")
+        self.loop = asyncio.get_running_loop()
+        self.writer.start()
+        self.event_log.start()
+        self.media.start()
+        self.backpressure.start()
+        if getattr(config, 'perf_export_path', None):
+            self._metrics_task = asyncio.create_task(self._export_metrics())
+        if self.retention:
+            self.retention.start()
+        self.cold_store.start()
         logger.info("Мониторинг запущен")
         
         # Получение информации о себе
@@ -51,6 +230,10 @@ class TelegramMonitor:
         # Регистрация обработчиков
         self._register_handlers()
         
+        # Догрузка пропущенного идет параллельно с приемом новых событий
+        if self.catchup and config.monitor_messages:
+            self.catchup.start()
+        
         # Запуск мониторинга статусов
         asyncio.create_task(self._monitor_user_statuses())
     
@@ -58,67 +241,128 @@ class TelegramMonitor:
         """Регистрация всех обработчиков событий"""
         
         # Обработчик новых сообщений
-        @self.client.on(events.NewMessage())
+        @self._on(events.NewMessage())
         async def handle_new_message(event):
             if config.monitor_messages:
-                await self._handle_message(event)
+                if self.catchup:
+                    self.catchup.observe(event.chat_id, event.message.id)
+                await self._dispatch(self._handle_message, event)
         
         # Обработчик редактированных сообщений
-        @self.client.on(events.MessageEdited())
+        @self._on(events.MessageEdited())
         async def handle_edited_message(event):
             if config.monitor_messages:
-                await self._handle_edited_message(event)
+                await self._dispatch(self._handle_edited_message, event)
         
         # Обработчик удаленных сообщений
-        @self.client.on(events.MessageDeleted())
+        @self._on(events.MessageDeleted())
         async def handle_deleted_message(event):
             if config.monitor_messages:
-                await self._handle_deleted_message(event)
+                await self._dispatch(self._handle_deleted_message, event)
         
-        # Обработчик реакций
-        @self.client.on(events.MessageReactions())
-        async def handle_reactions(event):
-            if config.monitor_reactions:
-                await self._handle_reactions(event)
+        # Обработчик реакций (построителя событий реакций есть не во всех версиях Telethon)
+        if hasattr(events, 'MessageReactions'):
+            @self._on(events.MessageReactions())
+            async def handle_reactions(event):
+                if config.monitor_reactions:
+                    await self._dispatch(self._handle_reactions, event)
+        else:
+            logger.warning("Версия Telethon не поддерживает события реакций")
         
         # Обработчик изменений в чатах
-        @self.client.on(events.ChatAction())
+        @self._on(events.ChatAction())
         async def handle_chat_action(event):
             if config.monitor_events:
-                await self._handle_chat_action(event)
+                await self._dispatch(self._handle_chat_action, event)
         
         # Обработчик изменений пользователей
-        @self.client.on(events.UserUpdate())
+        @self._on(events.UserUpdate())
         async def handle_user_update(event):
             if config.monitor_contacts:
-                await self._handle_user_update(event)
+                await self._dispatch(self._handle_user_update, event)
         
         logger.info("Все обработчики зарегистрированы")
     
+    def _on(self, builder):
+        """Регистрация обработчика в клиенте с запоминанием для снятия при остановке"""
+        def decorator(handler):
+            self.client.on(builder)(handler)
+            self._handlers.append((handler, builder))
+            return handler
+        return decorator
+    
+    def _unregister_handlers(self):
+        """Снятие всех обработчиков, зарегистрированных в клиенте"""
+        for handler, builder in self._handlers:
+            self.client.remove_event_handler(handler, builder)
+        self._handlers.clear()
+    
+    async def _dispatch(self, handler, event):
+        """Вызов обработчика с учетом нагрузки и замером длительности"""
+        self.backpressure.enter()
+        try:
+            with self.perf.track('handler.' + handler.__name__[len('_handle_'):]):
+                await handler(event)
+        finally:
+            self.backpressure.exit()
+    
+    def set_event_filter(self, mask: int):
+        """Установка маски фильтров отображения (filters.py) из GUI или фонового режима"""
+        self.event_filter = mask
+    
+    def _should_render(self, event_type: str, chat_type=None, outgoing: bool = False) -> bool:
+        """Отправлять ли событие в GUI
+
+        Отфильтрованные события и события при перегрузке не форматируются.
+        """
+        return (self.event_callback is not None
+                and event_allowed(self.event_filter, event_type, chat_type, outgoing)
+                and self.backpressure.allow_gui())
+    
+    def _on_load_level_changed(self, previous: int, level: int):
+        """Возврат отложенного медиа в очередь загрузки после спада нагрузки"""
+        if level < LEVEL_DEFER_MEDIA <= previous:
+            self._resume_media()
+    
+    def _resume_media(self):
+        """Передача отложенного медиа в конвейер загрузки"""
+        while self._deferred_media:
+            message, media_type, chat_id = self._deferred_media.popleft()
+            self.media.submit(message, media_type, chat_id, on_done=self._on_media_saved)
+    
+    async def _close_media(self):
+        """Дозагрузка очереди и отложенного медиа при остановке (не дольше media_drain_timeout)"""
+        timeout = getattr(config, 'media_drain_timeout', 30)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            # Отложенное медиа ждет места в очереди, а не отбрасывается при ее переполнении
+            while self._deferred_media and loop.time() - started < timeout:
+                message, media_type, chat_id = self._deferred_media[0]
+                await asyncio.wait_for(
+                    self.media.put(message, media_type, chat_id, on_done=self._on_media_saved),
+                    timeout - (loop.time() - started)
+                )
+                self._deferred_media.popleft()
+        except asyncio.TimeoutError:
+            pass
+        if self._deferred_media:
+            logger.warning(f"Остановка загрузки медиа: не поставлено отложенных файлов: {len(self._deferred_media)}")
+            self._deferred_media.clear()
+        await self.media.close(timeout=max(0.0, timeout - (loop.time() - started)))
+        removed = await asyncio.to_thread(self.media_store.clear_temp)
+        if removed:
+            logger.info(f"Удалено недокачанных временных файлов медиа: {removed}")
+    
     async def _handle_message(self, event):
         """Обработка нового сообщения"""
         try:
             message = event.message
-            chat = await event.get_chat()
-            sender = await event.get_sender()
+            chat_info = await self._get_chat_info(event)
+            sender = await self._get_sender(event)
             
             # Получение информации о чате
-            chat_id = chat.id
-            chat_title = getattr(chat, 'title', None) or getattr(chat, 'first_name', 'Unknown')
-            
-            # Определение типа чата
-            chat_type = None
-            if isinstance(chat, User):
-                chat_type = 'private'
-            elif isinstance(chat, Chat):
-                chat_type = 'group'
-            elif isinstance(chat, Channel):
-                if chat.broadcast:
-                    chat_type = 'channel'
-                else:
-                    chat_type = 'supergroup'
-            else:
-                chat_type = 'unknown'
+            chat_id, chat_type, chat_title, chat_type_icon = chat_info
             
             # Получение информации об отправителе
             sender_id = sender.id if sender else None
@@ -136,8 +380,6 @@ class TelegramMonitor:
             if message.media:
                 if isinstance(message.media, MessageMediaPhoto):
                     media_type = "photo"
-                    if config.save_media and config.monitor_media:
-                        media_path = await self._save_media(message, "photo")
                 elif isinstance(message.media, MessageMediaDocument):
                     doc = message.media.document
                     if doc:
@@ -150,45 +392,56 @@ class TelegramMonitor:
                             media_type = "image"
                         else:
                             media_type = "document"
-                        
-                        if config.save_media and config.monitor_media:
-                            media_path = await self._save_media(message, media_type)
             
             # Проверка на пересылку
             is_forwarded = message.fwd_from is not None
             forward_from_id = message.fwd_from.from_id.user_id if is_forwarded and message.fwd_from.from_id else None
             
-            data = {
-                'message_id': message.id,
-                'chat_id': chat_id,
-                'chat_title': chat_title,
-                'chat_type': chat_type,
-                'sender_id': sender_id,
-                'sender_username': sender_username,
-                'sender_first_name': sender_first_name,
-                'sender_last_name': sender_last_name,
-                'text': text,
-                'is_outgoing': message.out,
-                'is_edited': False,
-                'is_deleted': False,
-                'is_forwarded': is_forwarded,
-                'forward_from_id': forward_from_id,
-                'media_type': media_type,
-                'media_path': media_path,
-                'date': datetime.fromtimestamp(message.date.timestamp())
-            }
+            data = MessageRecord(
+                message_id=message.id,
+                chat_id=chat_id,
+                chat_title=chat_title,
+                chat_type=chat_type,
+                sender_id=sender_id,
+                sender_username=sender_username,
+                sender_first_name=sender_first_name,
+                sender_last_name=sender_last_name,
+                text=text,
+                is_outgoing=message.out,
+                is_edited=False,
+                is_deleted=False,
+                is_forwarded=is_forwarded,
+                forward_from_id=forward_from_id,
+                media_type=media_type,
+                media_path=media_path,
+                date=int(message.date.timestamp())
+            )
             
-            await self.db.insert_message(data)
+            await self.writer.put('insert_message', data)
             self.logger.log_message(data)
             self.stats['messages'] += 1
             
+            # Содержимое сохраняется локально, чтобы запись об удалении не была пустой
+            self.message_cache.put(message.id, CachedMessage(
+                chat_info, sender_id, sender_username, sender_first_name, sender_last_name,
+                text, media_type, message.out
+            ))
+            
+            # Медиа загружается в фоне, путь дописывается после загрузки
+            if media_type and config.save_media and config.monitor_media:
+                if self.backpressure.should_defer_media():
+                    if len(self._deferred_media) == self._deferred_media.maxlen:
+                        self._deferred_media_dropped += 1
+                    self._deferred_media.append((message, media_type, chat_id))
+                else:
+                    self.media.submit(message, media_type, chat_id, on_done=self._on_media_saved)
+            
             # Отправка в GUI
-            if self.event_callback:
+            if self._should_render('message', chat_type, message.out):
                 direction = "➡️ ИСХОДЯЩЕЕ" if message.out else "⬅️ ВХОДЯЩЕЕ"
                 media_info = f" [{media_type}]" if media_type else ""
                 sender_name = sender_first_name or sender_username or 'Unknown'
                 text_preview = text[:50] if text else '[без текста]'
-                chat_type_icon = {'private': '👤', 'group': '👥', 'supergroup': '👥', 'channel': '📢'}.get(chat_type, '❓')
                 display_text = f"{direction} | {chat_type_icon} {chat_title} | {sender_name}: {text_preview}{media_info}"
                 self.event_callback({
                     'type': 'message',
@@ -198,65 +451,78 @@ class TelegramMonitor:
                 })
             
         except Exception as e:
+            self.perf.error('handler.message')
             logger.error(f"Ошибка обработки сообщения: {e}")
     
     async def _handle_edited_message(self, event):
         """Обработка отредактированного сообщения"""
         try:
             message = event.message
-            chat = await event.get_chat()
-            sender = await event.get_sender()
+            chat_info = await self._get_chat_info(event)
+            sender = await self._get_sender(event)
             
-            chat_id = chat.id
-            chat_title = getattr(chat, 'title', None) or getattr(chat, 'first_name', 'Unknown')
-            
-            # Определение типа чата
-            chat_type = None
-            if isinstance(chat, User):
-                chat_type = 'private'
-            elif isinstance(chat, Chat):
-                chat_type = 'group'
-            elif isinstance(chat, Channel):
-                if chat.broadcast:
-                    chat_type = 'channel'
-                else:
-                    chat_type = 'supergroup'
-            else:
-                chat_type = 'unknown'
+            chat_id, chat_type, chat_title, chat_type_icon = chat_info
             
             sender_id = sender.id if sender else None
             sender_username = getattr(sender, 'username', None) if sender else None
             sender_first_name = getattr(sender, 'first_name', None) if sender else None
             sender_last_name = getattr(sender, 'last_name', None) if sender else None
             
-            data = {
-                'message_id': message.id,
-                'chat_id': chat_id,
-                'chat_title': chat_title,
-                'chat_type': chat_type,
-                'sender_id': sender_id,
-                'sender_username': sender_username,
-                'sender_first_name': sender_first_name,
-                'sender_last_name': sender_last_name,
-                'text': message.message or "",
-                'is_outgoing': message.out,
-                'is_edited': True,
-                'is_deleted': False,
-                'is_forwarded': message.fwd_from is not None,
-                'forward_from_id': None,
-                'media_type': None,
-                'media_path': None,
-                'date': datetime.fromtimestamp(message.date.timestamp())
-            }
+            text = message.message or ""
+            cached = self.message_cache.get(chat_id, message.id)
+            
+            data = MessageRecord(
+                message_id=message.id,
+                chat_id=chat_id,
+                chat_title=chat_title,
+                chat_type=chat_type,
+                sender_id=sender_id,
+                sender_username=sender_username,
+                sender_first_name=sender_first_name,
+                sender_last_name=sender_last_name,
+                text=text,
+                is_outgoing=message.out,
+                is_edited=True,
+                is_deleted=False,
+                is_forwarded=message.fwd_from is not None,
+                media_type=cached.media_type if cached else None,
+                date=int(message.date.timestamp())
+            )
             
-            await self.db.insert_message(data)
+            # Исходная строка сообщения не дублируется: правка сохраняется
+            # дельтой в хранилище ревизий, а текст строки обновляется на месте
+            await self.writer.put('record_edit', EditRecord(
+                message_id=message.id,
+                chat_id=chat_id,
+                chat_title=chat_title,
+                sender_id=sender_id,
+                sender_username=sender_username,
+                sender_first_name=sender_first_name,
+                text=text,
+                previous_text=cached.text if cached else None,
+                date=int(message.edit_date.timestamp()) if message.edit_date else int(time.time())
+            ))
+            if hasattr(self.db, 'update_message_text'):
+                await self.writer.put('update_message_text', {
+                    'message_id': message.id,
+                    'chat_id': chat_id,
+                    'text': text,
+                    'is_edited': True
+                })
+            else:
+                # Database без обновления на месте - правка пишется строкой, как раньше
+                await self.writer.put('insert_message', data)
             self.logger.log_message(data)
             self.stats['messages'] += 1
             
+            self.message_cache.put(message.id, CachedMessage(
+                chat_info, sender_id, sender_username, sender_first_name, sender_last_name,
+                text, data.media_type, message.out
+            ))
+            
             # Отправка в GUI
-            if self.event_callback:
+            if self._should_render('message_edited', chat_type):
                 direction = "➡️ ИСХОДЯЩЕЕ" if message.out else "⬅️ ВХОДЯЩЕЕ"
-                chat_type_icon = {'private': '👤', 'group': '👥', 'supergroup': '👥', 'channel': '📢'}.get(chat_type, '❓')
                 display_text = f"✏️ РЕДАКТИРОВАНО | {direction} | {chat_type_icon} {chat_title} | {sender_first_name or sender_username or 'Unknown'}: {message.message[:50] if message.message else '[без текста]'}"
                 self.event_callback({
                     'type': 'message_edited',
@@ -266,151 +532,167 @@ class TelegramMonitor:
                 })
             
         except Exception as e:
+            self.perf.error('handler.edited_message')
             logger.error(f"Ошибка обработки отредактированного сообщения: {e}")
     
     async def _handle_deleted_message(self, event):
-        """Обработка удаленного сообщения"""
+        """Обработка удаленных сообщений (одно событие может содержать сотни ID)"""
         try:
-            chat = await event.get_chat()
-            chat_id = chat.id
-            chat_title = getattr(chat, 'title', None) or getattr(chat, 'first_name', 'Unknown')
-            
-            # Определение типа чата
-            chat_type = None
-            if isinstance(chat, User):
-                chat_type = 'private'
-            elif isinstance(chat, Chat):
-                chat_type = 'group'
-            elif isinstance(chat, Channel):
-                if chat.broadcast:
-                    chat_type = 'channel'
-                else:
-                    chat_type = 'supergroup'
+            now = datetime.now()
+            # В личных чатах и группах событие удаления приходит без чата
+            event_chat = await self._get_chat_info(event) if event.chat_id is not None else None
+            
+            # Группировка ID по чатам; содержимое берется из локального кэша, без запросов в сеть
+            groups = {}
+            for msg_id in event.deleted_ids:
+                cached = self.message_cache.pop(event_chat.id if event_chat else None, msg_id)
+                chat_info = event_chat or (cached.chat if cached else None)
+                key = chat_info.id if chat_info else None
+                groups.setdefault(key, (chat_info, []))[1].append((msg_id, cached))
+            
+            for chat_info, items in groups.values():
+                await self._record_deletions(chat_info, items, now)
+                
+        except Exception as e:
+            self.perf.error('handler.deleted_message')
+            logger.error(f"Ошибка обработки удаленного сообщения: {e}")
+    
+    async def _record_deletions(self, chat_info: Optional[ChatInfo], items: list, now: datetime):
+        """Запись удалений одного чата одной операцией"""
+        chat_id, chat_type, chat_title, chat_type_icon = chat_info or (None, None, None, '❓')
+        message_ids = [msg_id for msg_id, _ in items]
+        timestamp = int(now.timestamp())
+        
+        if hasattr(self.db, 'mark_messages_deleted'):
+            # Одно массовое обновление is_deleted у уже сохраненных строк
+            await self.writer.put('mark_messages_deleted', {
+                'chat_id': chat_id,
+                'message_ids': message_ids,
+                'date': now
+            })
+        else:
+            # Строки-отметки об удалении уходят в БД одним пакетом очереди записи
+            for msg_id, cached in items:
+                await self.writer.put('insert_message', MessageRecord(
+                    message_id=msg_id,
+                    chat_id=chat_id,
+                    chat_title=chat_title,
+                    chat_type=chat_type,
+                    sender_id=cached.sender_id if cached else None,
+                    sender_username=cached.sender_username if cached else None,
+                    sender_first_name=cached.sender_first_name if cached else None,
+                    sender_last_name=cached.sender_last_name if cached else None,
+                    text=cached.text if cached else f'[УДАЛЕНО - ID: {msg_id}]',
+                    is_outgoing=cached.is_outgoing if cached else False,
+                    is_edited=False,
+                    is_deleted=True,
+                    is_forwarded=False,
+                    media_type=cached.media_type if cached else None,
+                    date=timestamp
+                ))
+        
+        data = EventRecord(
+            event_type='messages_deleted',
+            chat_id=chat_id,
+            chat_title=chat_title,
+            details={'count': len(message_ids), 'message_ids': message_ids},
+            date=timestamp
+        )
+        self.logger.log_event(data)
+        self.stats['messages'] += len(message_ids)
+        
+        # Отправка в GUI - одна строка на чат
+        if self._should_render('message_deleted', chat_type):
+            if len(items) == 1 and items[0][1]:
+                cached = items[0][1]
+                sender_name = cached.sender_first_name or cached.sender_username or 'Unknown'
+                content = f"{sender_name}: {cached.text[:50] if cached.text else '[без текста]'}"
+            elif len(items) == 1:
+                content = f"ID сообщения: {message_ids[0]}"
             else:
-                chat_type = 'unknown'
+                known = sum(1 for _, cached in items if cached)
+                content = f"сообщений: {len(items)} (известно содержимое: {known}), ID {min(message_ids)}…{max(message_ids)}"
+            display_text = f"🗑️ УДАЛЕНО | {chat_type_icon} {chat_title or 'Неизвестный чат'} | {content} | Время: {now.strftime('%H:%M:%S')}"
+            self.event_callback({
+                'type': 'message_deleted',
+                'data': data,
+                'display': display_text,
+                'chat_type': chat_type
+            })
+    
+    async def _handle_reactions(self, event):
+        """Обработка реакций"""
+        try:
+            # При перегрузке реакции каналов обрабатываются выборочно: пропущенные
+            # изменения попадут в следующий сравниваемый снимок
+            known_chat = self.chats.get(event.chat_id)
+            if known_chat and not self.backpressure.allow_reaction(known_chat.type):
+                return
+            message = event.message
+            chat_info = await self._get_chat_info(event)
+            chat_id, chat_type, chat_title, chat_type_icon = chat_info
             
-            # Попытка получить информацию об удаленных сообщениях
-            deleted_count = len(event.deleted_ids)
+            if not message.reactions:
+                return
             
-            for msg_id in event.deleted_ids:
-                # Попытка получить информацию о сообщении из истории
+            # Сравнение с последним известным состоянием реакций сообщения
+            pairs, counts = extract_reactions(message.reactions)
+            added, removed = self.reactions.diff(
+                chat_id, message.id, message.date.timestamp(), pairs, counts
+            )
+            changes = [(pair, 'added') for pair in sorted(added)] + [(pair, 'removed') for pair in sorted(removed)]
+            
+            for (user_id, reaction_emoji), action in changes:
                 try:
-                    # Получаем информацию о чате
-                    messages = await self.client.get_messages(chat, limit=1)
-                    # Пытаемся найти информацию о сообщении
+                    user = await self._get_entity(user_id)
+                    user_username = getattr(user, 'username', None) if user else None
                 except:
-                    pass
+                    user_username = None
                 
-                data = {
-                    'message_id': msg_id,
-                    'chat_id': chat_id,
-                    'chat_title': chat_title,
-                    'chat_type': chat_type,
-                    'sender_id': None,
-                    'sender_username': None,
-                    'sender_first_name': None,
-                    'sender_last_name': None,
-                    'text': f'[УДАЛЕНО - ID: {msg_id}]',
-                    'is_outgoing': False,
-                    'is_edited': False,
-                    'is_deleted': True,
-                    'is_forwarded': False,
-                    'forward_from_id': None,
-                    'media_type': None,
-                    'media_path': None,
-                    'date': datetime.now()
-                }
+                data = ReactionRecord(
+                    message_id=message.id,
+                    chat_id=chat_id,
+                    user_id=user_id,
+                    user_username=user_username,
+                    reaction=reaction_emoji,
+                    action=action,
+                    date=int(time.time())
+                )
                 
-                await self.db.insert_message(data)
-                self.logger.log_message(data)
-                self.stats['messages'] += 1
+                await self.writer.put('insert_reaction', data)
+                self.logger.log_reaction(data)
+                self.stats['reactions'] += 1
                 
                 # Отправка в GUI
-                if self.event_callback:
-                    chat_type_icon = {'private': '👤', 'group': '👥', 'supergroup': '👥', 'channel': '📢'}.get(chat_type, '❓')
-                    display_text = f"🗑️ УДАЛЕНО | {chat_type_icon} {chat_title} | ID сообщения: {msg_id} | Время: {datetime.now().strftime('%H:%M:%S')}"
+                if self._should_render('reaction', chat_type):
+                    title = "👍 РЕАКЦИЯ" if action == 'added' else "👎 РЕАКЦИЯ СНЯТА"
+                    display_text = f"{title} | {chat_type_icon} {chat_title} | {reaction_emoji} от {user_username or 'Unknown'} | Сообщение ID: {message.id}"
                     self.event_callback({
-                        'type': 'message_deleted',
+                        'type': 'reaction',
                         'data': data,
                         'display': display_text,
                         'chat_type': chat_type
                     })
-                
-        except Exception as e:
-            logger.error(f"Ошибка обработки удаленного сообщения: {e}")
-    
-    async def _handle_reactions(self, event):
-        """Обработка реакций"""
-        try:
-            message = event.message
-            chat = await event.get_chat()
-            chat_id = chat.id
-            
-            # Определение типа чата
-            chat_type = None
-            if isinstance(chat, User):
-                chat_type = 'private'
-            elif isinstance(chat, Chat):
-                chat_type = 'group'
-            elif isinstance(chat, Channel):
-                if chat.broadcast:
-                    chat_type = 'channel'
-                else:
-                    chat_type = 'supergroup'
-            else:
-                chat_type = 'unknown'
-            
-            if message.reactions:
-                for reaction in message.reactions.results:
-                    user_ids = reaction.recent_reactions or []
-                    reaction_emoji = reaction.reaction.emoticon if hasattr(reaction.reaction, 'emoticon') else str(reaction.reaction)
-                    
-                    for recent in user_ids:
-                        user_id = recent.peer_id.user_id if hasattr(recent.peer_id, 'user_id') else None
-                        
-                        try:
-                            user = await self.client.get_entity(user_id) if user_id else None
-                            user_username = getattr(user, 'username', None) if user else None
-                        except:
-                            user_username = None
-                        
-                        data = {
-                            'message_id': message.id,
-                            'chat_id': chat_id,
-                            'user_id': user_id,
-                            'user_username': user_username,
-                            'reaction': reaction_emoji,
-                            'action': 'added',
-                            'date': datetime.now()
-                        }
-                        
-                        await self.db.insert_reaction(data)
-                        self.logger.log_reaction(data)
-                        self.stats['reactions'] += 1
-                        
-                        # Отправка в GUI
-                        if self.event_callback:
-                            chat_type_icon = {'private': '👤', 'group': '👥', 'supergroup': '👥', 'channel': '📢'}.get(chat_type, '❓')
-                            chat_title = getattr(chat, 'title', None) or getattr(chat, 'first_name', 'Unknown')
-                            display_text = f"👍 РЕАКЦИЯ | {chat_type_icon} {chat_title} | {reaction_emoji} от {user_username or 'Unknown'} | Сообщение ID: {message.id}"
-                            self.event_callback({
-                                'type': 'reaction',
-                                'data': data,
-                                'display': display_text,
-                                'chat_type': chat_type
-                            })
-                        
+            
         except Exception as e:
+            self.perf.error('handler.reactions')
             logger.error(f"Ошибка обработки реакций: {e}")
     
     async def _handle_chat_action(self, event):
         """Обработка действий в чате"""
         try:
-            chat = await event.get_chat()
-            user = await event.get_user()
+            # Состав или оформление чата изменились - сбрасываем кэш
+            self.entity_cache.invalidate(event.chat_id)
+            if event.user_id:
+                self.entity_cache.invalidate(event.user_id)
+            
+            if event.chat_title_changed:
+                self.chats.update_title(event.chat_id, event.new_title)
+            
+            chat_info = await self._get_chat_info(event)
+            user = await self._get_user(event)
             
-            chat_id = chat.id
-            chat_title = getattr(chat, 'title', None) or getattr(chat, 'first_name', 'Unknown')
+            chat_id, chat_type, chat_title, chat_type_icon = chat_info
             user_id = user.id if user else None
             user_username = getattr(user, 'username', None) if user else None
             user_first_name = getattr(user, 'first_name', None) if user else None
@@ -438,23 +720,23 @@ class TelegramMonitor:
                 details['message_id'] = event.pinned_message.id
             
             if event_type:
-                data = {
-                    'event_type': event_type,
-                    'chat_id': chat_id,
-                    'chat_title': chat_title,
-                    'user_id': user_id,
-                    'user_username': user_username,
-                    'user_first_name': user_first_name,
-                    'details': details,
-                    'date': datetime.now()
-                }
+                data = EventRecord(
+                    event_type=event_type,
+                    chat_id=chat_id,
+                    chat_title=chat_title,
+                    user_id=user_id,
+                    user_username=user_username,
+                    user_first_name=user_first_name,
+                    details=details,
+                    date=int(time.time())
+                )
                 
-                await self.db.insert_event(data)
+                await self.writer.put('insert_event', data)
                 self.logger.log_event(data)
                 self.stats['events'] += 1
                 
                 # Отправка в GUI
-                if self.event_callback:
+                if self._should_render('chat_event', chat_type):
                     event_icons = {
                         'user_joined': '👋',
                         'user_left': '👋',
@@ -466,7 +748,6 @@ class TelegramMonitor:
                         'message_pinned': '📌'
                     }
                     icon = event_icons.get(event_type, '📢')
-                    chat_type_icon = {'private': '👤', 'group': '👥', 'supergroup': '👥', 'channel': '📢'}.get(chat_type, '❓')
                     display_text = f"{icon} {event_type.upper()} | {chat_type_icon} {chat_title} | {user_first_name or user_username or 'Unknown'}"
                     self.event_callback({
                         'type': 'chat_event',
@@ -476,11 +757,16 @@ class TelegramMonitor:
                     })
                 
         except Exception as e:
+            self.perf.error('handler.chat_action')
             logger.error(f"Ошибка обработки действия в чате: {e}")
     
     async def _handle_user_update(self, event):
         """Обработка обновлений пользователя"""
         try:
+            # Данные пользователя изменились - сбрасываем кэш
+            if event.user_id:
+                self.entity_cache.invalidate(event.user_id)
+            
             user = event.user
             if not user:
                 return
@@ -500,67 +786,149 @@ class TelegramMonitor:
                 'phone': phone
             }
             
-            data = {
-                'event_type': event_type,
-                'chat_id': None,
-                'chat_title': None,
-                'user_id': user_id,
-                'user_username': username,
-                'user_first_name': first_name,
-                'details': details,
-                'date': datetime.now()
-            }
+            data = EventRecord(
+                event_type=event_type,
+                user_id=user_id,
+                user_username=username,
+                user_first_name=first_name,
+                details=details,
+                date=int(time.time())
+            )
             
-            await self.db.insert_event(data)
+            await self.writer.put('insert_event', data)
             self.logger.log_event(data)
             self.stats['events'] += 1
             
         except Exception as e:
+            self.perf.error('handler.user_update')
             logger.error(f"Ошибка обработки обновления пользователя: {e}")
     
-    async def _save_media(self, message, media_type: str) -> Optional[str]:
+    async def _get_chat_info(self, event) -> ChatInfo:
+        """Получение описания чата события"""
+        chat_info = self.chats.get(event.chat_id)
+        if chat_info is None:
+            chat = await self._get_chat(event)
+            if event.chat_id is None:
+                return classify_chat(chat)
+            chat_info = self.chats.add(event.chat_id, chat)
+        return chat_info
+    
+    async def _get_chat(self, event):
+        """Получение чата события через кэш"""
+        if event.chat_id is None:
+            return await event.get_chat()
+        chat = self.entity_cache.get(event.chat_id)
+        if chat is MISSING:
+            chat = await event.get_chat()
+            self.entity_cache.put(event.chat_id, chat)
+        return chat
+    
+    async def _get_sender(self, event):
+        """Получение отправителя события через кэш"""
+        if event.sender_id is None:
+            return await event.get_sender()
+        sender = self.entity_cache.get(event.sender_id)
+        if sender is MISSING:
+            sender = await event.get_sender()
+            self.entity_cache.put(event.sender_id, sender)
+        return sender
+    
+    async def _get_user(self, event):
+        """Получение пользователя действия в чате через кэш"""
+        if event.user_id is None:
+            return await event.get_user()
+        user = self.entity_cache.get(event.user_id)
+        if user is MISSING:
+            user = await event.get_user()
+            self.entity_cache.put(event.user_id, user)
+        return user
+    
+    async def _get_entity(self, peer_id: int):
+        """Получение сущности по ID через кэш"""
+        entity = self.entity_cache.get(peer_id)
+        if entity is MISSING:
+            entity = await self.client.get_entity(peer_id)
+            self.entity_cache.put(peer_id, entity)
+        return entity
+    
+    async def _save_media(self, message, media_type: str, chat_id: int) -> Optional[str]:
         """Сохранение медиа файла"""
         try:
-            file_name = f"{message.id}_{media_type}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-            
-            if media_type == "photo":
-                file_path = MEDIA_DIR / f"{file_name}.jpg"
-            else:
-                file_path = MEDIA_DIR / f"{file_name}"
-            
-            await message.download_media(file=str(file_path))
-            
-            # Получение chat_id
-            chat_id = None
-            if hasattr(message.peer_id, 'channel_id'):
-                chat_id = message.peer_id.channel_id
-            elif hasattr(message.peer_id, 'user_id'):
-                chat_id = message.peer_id.user_id
-            elif hasattr(message.peer_id, 'chat_id'):
-                chat_id = message.peer_id.chat_id
+            async def download(temp_path):
+                downloaded = await message.download_media(file=str(temp_path))
+                if not downloaded:
+                    return None
+                if media_type == "photo":
+                    extension = ".jpg"
+                else:
+                    extension = getattr(message.file, 'ext', None) or ""
+                return downloaded, extension
+
+            # Файл, уже лежащий в хранилище или загружаемый сейчас, повторно не скачивается
+            found = await self.media_store.fetch(telegram_file_id(message), download)
+            if not found:
+                return None
+            blob_key, file_size = found
+            file_path = self.media_store.blob_path(blob_key)
             
             # Сохранение информации о медиа в БД
-            media_data = {
-                'message_id': message.id,
-                'chat_id': chat_id,
-                'media_type': media_type,
-                'file_name': file_path.name,
-                'file_path': str(file_path),
-                'file_size': file_path.stat().st_size if file_path.exists() else 0,
-                'mime_type': None,
-                'date': datetime.fromtimestamp(message.date.timestamp())
-            }
+            media_data = MediaRecord(
+                message_id=message.id,
+                chat_id=chat_id,
+                media_type=media_type,
+                file_name=file_path.name,
+                file_path=str(file_path),
+                file_size=file_size,
+                mime_type=getattr(message.file, 'mime_type', None),
+                blob_key=blob_key,
+                date=int(message.date.timestamp())
+            )
             
-            await self.db.insert_media(media_data)
+            await self.writer.put('insert_media', media_data)
             self.logger.log_media(media_data)
             self.stats['media'] += 1
             
             return str(file_path)
             
         except Exception as e:
+            self.perf.error('media.save')
             logger.error(f"Ошибка сохранения медиа: {e}")
             return None
     
+    async def _on_media_saved(self, message, chat_id: int, media_path: str):
+        """Дописывание пути к медиа в строку сообщения после загрузки"""
+        # Связь медиа с сообщением уже есть в insert_media; путь в строке
+        # сообщения обновляется, если Database это поддерживает
+        if hasattr(self.db, 'update_message_media_path'):
+            await self.writer.put('update_message_media_path', {
+                'message_id': message.id,
+                'chat_id': chat_id,
+                'media_path': media_path
+            })
+    
+    def _on_partition_dropped(self, table: str, chat_ids: list, since: datetime, until: datetime):
+        """Удаление из поискового индекса записей очищенной партиции"""
+        kinds = {
+            'messages': ('message', 'edited', 'deleted'),
+            'reactions': ('reaction',),
+            'events': ('event',)
+        }.get(table)
+        if kinds:
+            self.search_index.drop(kinds, chat_ids, since, until)
+    
+    def export_metrics(self, path):
+        """Запись замеров и статистики в файл формата Prometheus"""
+        self.perf.write_prometheus(path, extra=self.get_stats())
+    
+    async def _export_metrics(self):
+        """Периодическая запись файла метрик для Prometheus"""
+        while self.running:
+            try:
+                await asyncio.to_thread(self.export_metrics, config.perf_export_path)
+            except Exception as e:
+                logger.error(f"Ошибка записи метрик: {e}")
+            await asyncio.sleep(getattr(config, 'perf_export_interval', 15))
+    
     async def _monitor_user_statuses(self):
         """Мониторинг статусов пользователей"""
         # Эта функция может быть расширена для отслеживания статусов
@@ -568,10 +936,129 @@ class TelegramMonitor:
     
     def get_stats(self):
         """Получение статистики"""
-        return self.stats.copy()
+        # Итоги за все время из накопительной статистики, счетчики сеанса - с префиксом
+        stats = self.aggregates.totals()
+        stats.update({f'session_{key}': value for key, value in self.stats.items()})
+        writer_stats = self.writer.get_stats()
+        stats['db_queue_depth'] = writer_stats['depth']
+        stats['db_written'] = writer_stats['written']
+        stats['db_batches'] = writer_stats['batches']
+        stats['db_errors'] = writer_stats['errors']
+        stats['db_retries'] = writer_stats['retries']
+        stats['db_flush_ms_last'] = writer_stats['last_flush_ms']
+        stats['db_flush_ms_avg'] = writer_stats['avg_flush_ms']
+        stats['db_flush_ms_max'] = writer_stats['max_flush_ms']
+        log_stats = self.event_log.get_stats()
+        stats['log_queue_depth'] = log_stats['depth']
+        stats['log_written'] = log_stats['written']
+        stats['log_dropped'] = log_stats['dropped']
+        stats['log_errors'] = log_stats['errors']
+        stats['log_rotations'] = log_stats['rotations']
+        media_stats = self.media.get_stats()
+        stats['media_queued'] = media_stats['queued']
+        stats['media_active'] = media_stats['active']
+        stats['media_bytes'] = media_stats['bytes']
+        stats['media_failed'] = media_stats['failed']
+        stats['media_skipped_budget'] = media_stats['skipped_budget']
+        stats['media_dropped'] = media_stats['dropped']
+        store_stats = self.media_store.get_stats()
+        stats['media_blobs'] = store_stats['blobs']
+        stats['media_dedup_hits'] = store_stats['hits_file_id'] + store_stats['hits_hash']
+        stats['media_bytes_saved'] = store_stats['bytes_saved']
+        stats['revisions'] = self.revisions.written
+        load_stats = self.backpressure.get_stats()
+        stats['load_level'] = load_stats['level_name']
+        stats['load_max_level'] = load_stats['max_level']
+        stats['load_in_flight'] = load_stats['in_flight']
+        stats['load_peak_in_flight'] = load_stats['peak_in_flight']
+        stats['load_lag_ms'] = load_stats['lag_ms']
+        stats['load_max_lag_ms'] = load_stats['max_lag_ms']
+        stats['load_gui_skipped'] = load_stats['gui_skipped']
+        stats['load_media_deferred'] = load_stats['media_deferred']
+        stats['load_media_deferred_pending'] = len(self._deferred_media)
+        stats['load_media_deferred_dropped'] = self._deferred_media_dropped
+        stats['load_reactions_sampled_out'] = load_stats['reactions_sampled_out']
+        if self.retention:
+            retention_stats = self.retention.get_stats()
+            stats['retention_dropped'] = retention_stats['dropped']
+            stats['retention_partitions'] = retention_stats['partitions']
+            stats['retention_rolled_up'] = retention_stats['rolled_up']
+        if self.catchup:
+            catchup_stats = self.catchup.get_stats()
+            stats['catchup_tracked'] = catchup_stats['tracked']
+            stats['catchup_active'] = catchup_stats['active']
+            stats['catchup_backfilled'] = catchup_stats['backfilled']
+            stats['catchup_skipped'] = catchup_stats['skipped']
+            stats['catchup_requests'] = catchup_stats['requests']
+        cold_stats = self.cold_store.get_stats()
+        stats['cold_moved'] = cold_stats['moved']
+        stats['cold_segments'] = cold_stats['segments']
+        stats['cold_bytes'] = cold_stats['bytes']
+        if hasattr(self.db, 'routed'):
+            stats['db_shard_rows'] = list(self.db.routed)
+        message_cache_stats = self.message_cache.get_stats()
+        stats['message_cache_size'] = message_cache_stats['size']
+        stats['message_cache_hits'] = message_cache_stats['hits']
+        stats['message_cache_misses'] = message_cache_stats['misses']
+        cache_stats = self.entity_cache.get_stats()
+        stats['entity_cache_size'] = cache_stats['size']
+        stats['entity_cache_hits'] = cache_stats['hits']
+        stats['entity_cache_misses'] = cache_stats['misses']
+        stats['entity_cache_hit_rate'] = cache_stats['hit_rate']
+        return stats
     
-    def stop(self):
-        """Остановка мониторинга"""
+    async def shutdown(self):
+        """Остановка мониторинга со сбросом очереди записи и закрытием хранилищ"""
         self.running = False
+        # Сначала новые события перестают поступать, затем дожидаемся уже начатых
+        self._unregister_handlers()
+        if self._metrics_task:
+            self._metrics_task.cancel()
+            self._metrics_task = None
+        if self.catchup:
+            await self.catchup.stop()
+        await self._wait_handlers(getattr(config, 'handler_drain_timeout', 10))
+        await self.backpressure.close()
+        if self.retention:
+            await self.retention.close()
+        await self.cold_store.close()
+        await self._close_media()
+        await self.writer.close()
+        await self.event_log.close()
+        # Хранилища закрываются после сброса очереди: последние пакеты еще доходят до них
+        if self._stores_open:
+            self._close_stores()
         logger.info("Мониторинг остановлен")
+    
+    async def _wait_handlers(self, timeout: float):
+        """Ожидание завершения обработчиков, начатых до остановки"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self.backpressure.in_flight and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+        if self.backpressure.in_flight:
+            logger.warning(f"Остановка не дождалась обработчиков: {self.backpressure.in_flight}")
+    
+    def stop(self):
+        """Остановка мониторинга"""
+        if not self.loop or not self.loop.is_running():
+            self.running = False
+            logger.info("Мониторинг остановлен")
+            return
+        
+        try:
+            current_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            current_loop = None
+        
+        if current_loop is self.loop:
+            # Вызов из потока event loop - ждать нельзя, сброс идет в фоне
+            self.loop.create_task(self.shutdown())
+        else:
+            # Вызов из другого потока (GUI) - дожидаемся полного сброса очереди
+            future = asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop)
+            try:
+                future.result(timeout=60)
+            except Exception as e:
+                logger.error(f"Ошибка сброса очереди записи: {e}")
 
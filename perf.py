@@ -0,0 +1,173 @@
+"""
+Модуль замеров производительности
+"""
+import bisect
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# Верхние границы корзин гистограмм задержек (сек): от 0.1 мс до ~60 с
+LATENCY_BUCKETS = tuple(round(0.0001 * 1.6 ** i, 6) for i in range(29))
+
+# Префикс имен метрик в формате Prometheus
+METRIC_PREFIX = 'tgmon'
+
+
+class LatencyHistogram:
+    """Гистограмма задержек с фиксированными корзинами
+
+    Квантили оцениваются линейной интерполяцией внутри корзины, поэтому
+    память и время записи не зависят от числа замеров.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Последняя корзина - сверх верхней границы
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        """Добавление замера (сек)"""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля (сек)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.max
+                value = lower + (upper - lower) * (rank - cumulative) / bucket_count
+                return min(value, self.max)
+            cumulative += bucket_count
+        return self.max
+
+
+class PerfRegistry:
+    """Реестр замеров: гистограммы задержек и счетчики ошибок по этапам
+
+    Этап - строка вида 'handler.message', 'db.insert_message', 'media.save',
+    'gui.callback'. Задержка цикла событий пишется в этап 'loop.lag'.
+    Запись идет из потока event loop, чтение - из потока GUI.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}  # Этап -> LatencyHistogram
+        self.errors = {}  # Этап -> число ошибок
+        self.started = time.time()
+
+    def observe(self, stage: str, seconds: float):
+        """Запись длительности этапа"""
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    def error(self, stage: str, count: int = 1):
+        """Учет ошибки этапа"""
+        with self._lock:
+            self.errors[stage] = self.errors.get(stage, 0) + count
+
+    @contextmanager
+    def track(self, stage: str):
+        """Замер блока кода (в том числе с await внутри); исключение - ошибка этапа"""
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.error(stage)
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def wrap(self, stage: str, func):
+        """Обертка синхронной функции с замером"""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.track(stage):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def wrap_async(self, stage: str, func):
+        """Обертка корутинной функции с замером"""
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with self.track(stage):
+                return await func(*args, **kwargs)
+        return wrapper
+
+    def reset(self):
+        """Сброс всех замеров"""
+        with self._lock:
+            self.histograms.clear()
+            self.errors.clear()
+            self.started = time.time()
+
+    def snapshot(self) -> list:
+        """Сводка по этапам: список словарей, задержки в мс"""
+        with self._lock:
+            stages = sorted(set(self.histograms) | set(self.errors))
+            rows = []
+            for stage in stages:
+                histogram = self.histograms.get(stage) or LatencyHistogram()
+                rows.append({
+                    'stage': stage,
+                    'count': histogram.count,
+                    'errors': self.errors.get(stage, 0),
+                    'p50_ms': round(histogram.quantile(0.5) * 1000, 2),
+                    'p95_ms': round(histogram.quantile(0.95) * 1000, 2),
+                    'p99_ms': round(histogram.quantile(0.99) * 1000, 2),
+                    'max_ms': round(histogram.max * 1000, 2),
+                    'avg_ms': round(histogram.sum / histogram.count * 1000, 2) if histogram.count else 0.0
+                })
+        return rows
+
+    def to_prometheus(self) -> str:
+        """Замеры в текстовом формате Prometheus"""
+        lines = []
+        with self._lock:
+            latency = f"{METRIC_PREFIX}_stage_latency_seconds"
+            lines.append(f"# HELP {latency} Длительность этапов обработки")
+            lines.append(f"# TYPE {latency} histogram")
+            for stage, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(histogram.buckets, histogram.counts):
+                    cumulative += bucket_count
+                    lines.append(f'{latency}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{latency}_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{latency}_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+                lines.append(f'{latency}_count{{stage="{stage}"}} {histogram.count}')
+            errors = f"{METRIC_PREFIX}_stage_errors_total"
+            lines.append(f"# HELP {errors} Ошибки этапов обработки")
+            lines.append(f"# TYPE {errors} counter")
+            for stage, count in sorted(self.errors.items()):
+                lines.append(f'{errors}{{stage="{stage}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path, extra: dict = None):
+        """Атомарная запись файла для textfile-коллектора Prometheus
+
+        extra - дополнительные числовые показатели (gauge), например из get_stats().
+        """
+        text = self.to_prometheus()
+        for name, value in (extra or {}).items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                metric = f"{METRIC_PREFIX}_{name}"
+                text += f"# TYPE {metric} gauge\n{metric} {value}\n"
+        path = Path(path)
+        temp_path = path.with_name(path.name + '.tmp')
+        temp_path.write_text(text, encoding='utf-8')
+        os.replace(temp_path, path)
@@ -0,0 +1,95 @@
+"""
+Модуль отслеживания изменений реакций
+"""
+import heapq
+import time
+
+
+def reaction_emoji(reaction) -> str:
+    """Текстовое представление реакции"""
+    return reaction.emoticon if hasattr(reaction, 'emoticon') else str(reaction)
+
+
+def extract_reactions(reactions):
+    """Разбор MessageReactions в набор пар (user_id, реакция) и счетчики по реакциям"""
+    pairs = set()
+    counts = {}
+    for result in reactions.results or []:
+        emoji = reaction_emoji(result.reaction)
+        counts[emoji] = getattr(result, 'count', 0)
+        # Старый формат: последние реакции внутри каждого результата
+        for recent in getattr(result, 'recent_reactions', None) or []:
+            user_id = getattr(recent.peer_id, 'user_id', None)
+            if user_id:
+                pairs.add((user_id, emoji))
+    # Актуальный формат: общий список последних реакций сообщения
+    for recent in getattr(reactions, 'recent_reactions', None) or []:
+        user_id = getattr(recent.peer_id, 'user_id', None)
+        if user_id:
+            pairs.add((user_id, reaction_emoji(recent.reaction)))
+    return pairs, counts
+
+
+class ReactionTracker:
+    """Снимки реакций по сообщениям для вычисления реальных изменений
+
+    Telegram присылает только последние реакции, поэтому пара, пропавшая из
+    списка, считается снятой лишь когда счетчик этой реакции уменьшился.
+    Снимки сообщений старше max_age секунд вытесняются по дате сообщения
+    (самые старые первыми), общее число снимков ограничено max_messages.
+    """
+
+    def __init__(self, max_age: float = 3 * 24 * 3600, max_messages: int = 100000):
+        self.max_age = max_age
+        self.max_messages = max_messages
+        # (chat_id, message_id) -> (дата сообщения, frozenset пар, счетчики)
+        self._snapshots = {}
+        # Куча (дата сообщения, ключ) для вытеснения самых старых снимков
+        self._by_date = []
+
+    def diff(self, chat_id: int, message_id: int, message_ts: float, pairs: set, counts: dict):
+        """Сравнение новых реакций со снимком; возвращает (добавленные, снятые)"""
+        key = (chat_id, message_id)
+        snapshot = self._snapshots.get(key)
+        old_pairs, old_counts = (snapshot[1], snapshot[2]) if snapshot else (frozenset(), {})
+
+        added = pairs - old_pairs
+        removed = set()
+        # Снятыми считаем не больше пар, чем уменьшился счетчик реакции
+        decreased = {
+            emoji: old_count - counts.get(emoji, 0)
+            for emoji, old_count in old_counts.items()
+            if counts.get(emoji, 0) < old_count
+        }
+        if decreased:
+            for pair in sorted(old_pairs - pairs):
+                emoji = pair[1]
+                if decreased.get(emoji, 0) > 0:
+                    removed.add(pair)
+                    decreased[emoji] -= 1
+
+        # Вытесненные из списка последних, но не снятые пары остаются в снимке
+        new_pairs = frozenset((old_pairs - removed) | pairs)
+        if snapshot is None or snapshot[0] != message_ts:
+            self._prune()
+            heapq.heappush(self._by_date, (message_ts, key))
+        self._snapshots[key] = (message_ts, new_pairs, counts)
+        return added, removed
+
+    def _prune(self):
+        """Удаление снимков старых сообщений"""
+        cutoff = time.time() - self.max_age
+        while self._by_date:
+            message_ts, key = self._by_date[0]
+            snapshot = self._snapshots.get(key)
+            if snapshot is None or snapshot[0] != message_ts:
+                # Устаревшая запись кучи: дата снимка сменилась
+                heapq.heappop(self._by_date)
+                continue
+            if message_ts >= cutoff and len(self._snapshots) < self.max_messages:
+                break
+            heapq.heappop(self._by_date)
+            del self._snapshots[key]
+
+    def __len__(self):
+        return len(self._snapshots)
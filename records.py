@@ -0,0 +1,250 @@
+"""
+Модуль компактных записей событий
+"""
+import sqlite3
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+
+
+class Record:
+    """Базовая запись со слотами вместо словаря
+
+    Поля задаются по порядку слотов или именами, незаданные поля равны None.
+    Время хранится как целое Unix-время; словарь с datetime строится только
+    на границе с Database через `as_dict()`.
+    """
+
+    __slots__ = ()
+    _time_fields = ('date',)
+
+    def fields(self) -> dict:
+        """Поля записи как есть (время - Unix-время)"""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def as_dict(self) -> dict:
+        """Словарь в формате строк Database (время - datetime)"""
+        data = {}
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if value is not None and name in self._time_fields:
+                value = datetime.fromtimestamp(value)
+            data[name] = value
+        return data
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class MessageRecord(Record):
+    """Сообщение (новое, отредактированное или отметка об удалении)"""
+    __slots__ = ('message_id', 'chat_id', 'chat_title', 'chat_type', 'sender_id', 'sender_username',
+                 'sender_first_name', 'sender_last_name', 'text', 'is_outgoing', 'is_edited', 'is_deleted',
+                 'is_forwarded', 'forward_from_id', 'media_type', 'media_path', 'date')
+
+    def __init__(self, message_id=None, chat_id=None, chat_title=None, chat_type=None, sender_id=None,
+                 sender_username=None, sender_first_name=None, sender_last_name=None, text=None,
+                 is_outgoing=None, is_edited=None, is_deleted=None, is_forwarded=None, forward_from_id=None,
+                 media_type=None, media_path=None, date=None):
+        self.message_id = message_id
+        self.chat_id = chat_id
+        self.chat_title = chat_title
+        self.chat_type = chat_type
+        self.sender_id = sender_id
+        self.sender_username = sender_username
+        self.sender_first_name = sender_first_name
+        self.sender_last_name = sender_last_name
+        self.text = text
+        self.is_outgoing = is_outgoing
+        self.is_edited = is_edited
+        self.is_deleted = is_deleted
+        self.is_forwarded = is_forwarded
+        self.forward_from_id = forward_from_id
+        self.media_type = media_type
+        self.media_path = media_path
+        self.date = date
+
+
+class EditRecord(Record):
+    """Правка сообщения для хранилища ревизий"""
+    __slots__ = ('message_id', 'chat_id', 'chat_title', 'sender_id', 'sender_username', 'sender_first_name',
+                 'text', 'previous_text', 'date')
+
+    def __init__(self, message_id=None, chat_id=None, chat_title=None, sender_id=None, sender_username=None,
+                 sender_first_name=None, text=None, previous_text=None, date=None):
+        self.message_id = message_id
+        self.chat_id = chat_id
+        self.chat_title = chat_title
+        self.sender_id = sender_id
+        self.sender_username = sender_username
+        self.sender_first_name = sender_first_name
+        self.text = text
+        self.previous_text = previous_text
+        self.date = date
+
+
+class ReactionRecord(Record):
+    """Добавление или снятие реакции"""
+    __slots__ = ('message_id', 'chat_id', 'user_id', 'user_username', 'reaction', 'action', 'date')
+
+    def __init__(self, message_id=None, chat_id=None, user_id=None, user_username=None, reaction=None,
+                 action=None, date=None):
+        self.message_id = message_id
+        self.chat_id = chat_id
+        self.user_id = user_id
+        self.user_username = user_username
+        self.reaction = reaction
+        self.action = action
+        self.date = date
+
+
+class EventRecord(Record):
+    """Событие чата или пользователя"""
+    __slots__ = ('event_type', 'chat_id', 'chat_title', 'user_id', 'user_username', 'user_first_name',
+                 'details', 'date')
+
+    def __init__(self, event_type=None, chat_id=None, chat_title=None, user_id=None, user_username=None,
+                 user_first_name=None, details=None, date=None):
+        self.event_type = event_type
+        self.chat_id = chat_id
+        self.chat_title = chat_title
+        self.user_id = user_id
+        self.user_username = user_username
+        self.user_first_name = user_first_name
+        self.details = details
+        self.date = date
+
+
+class MediaRecord(Record):
+    """Сохраненный медиафайл"""
+    __slots__ = ('message_id', 'chat_id', 'media_type', 'file_name', 'file_path', 'file_size', 'mime_type',
+                 'blob_key', 'date')
+
+    def __init__(self, message_id=None, chat_id=None, media_type=None, file_name=None, file_path=None,
+                 file_size=None, mime_type=None, blob_key=None, date=None):
+        self.message_id = message_id
+        self.chat_id = chat_id
+        self.media_type = media_type
+        self.file_name = file_name
+        self.file_path = file_path
+        self.file_size = file_size
+        self.mime_type = mime_type
+        self.blob_key = blob_key
+        self.date = date
+
+
+def as_row(row):
+    """Строка для Database: словарь из записи или исходный словарь"""
+    return row.as_dict() if isinstance(row, Record) else row
+
+
+# Таблица Database -> (метод очереди записи, тип записи)
+TABLE_RECORDS = {
+    'messages': ('insert_message', MessageRecord),
+    'reactions': ('insert_reaction', ReactionRecord),
+    'events': ('insert_event', EventRecord),
+    'media': ('insert_media', MediaRecord)
+}
+
+
+def _unix_time(value):
+    """Unix-время из значения колонки даты (число, datetime или строка ISO)"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    try:
+        return int(datetime.fromisoformat(str(value)).timestamp())
+    except ValueError:
+        return None
+
+
+def record_from_row(table: str, row: dict) -> Record:
+    """Запись из строки таблицы Database (обратное as_dict; лишние колонки отбрасываются)"""
+    record_type = TABLE_RECORDS[table][1]
+    record = record_type(**{name: row[name] for name in record_type.__slots__ if name in row})
+    for name in record._time_fields:
+        setattr(record, name, _unix_time(getattr(record, name)))
+    return record
+
+
+def read_table(db_path, table: str, after: int = 0, limit: int = 5000) -> list:
+    """Строки таблицы Database с rowid больше after: список (rowid, запись)
+
+    База открывается только на чтение; если файла или таблицы нет -
+    пустой список.
+    """
+    path = Path(db_path)
+    if not path.exists():
+        return []
+    conn = sqlite3.connect(f"file:{path.as_posix()}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    try:
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone() is None:
+            return []
+        rows = conn.execute(
+            f"SELECT rowid AS _rowid, * FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?", (after, limit)
+        ).fetchall()
+    finally:
+        conn.close()
+    return [(row['_rowid'], record_from_row(table, dict(row))) for row in rows]
+
+
+# Источник отметок для строк холодного хранилища (отметка - число учтенных строк)
+COLD_SOURCE = 'cold'
+
+
+def cold_batches(cold, table: str, db_paths, marks: dict, size: int):
+    """Пакеты (записи, отметки) строк таблицы из холодного хранилища
+
+    Архив учитывается один раз - пока у хранилища нет отметок баз по таблице;
+    отметка (COLD_SOURCE, table) позволяет продолжить после сбоя, а последний
+    пакет создает нулевые отметки баз, после чего архив больше не читается.
+    """
+    if cold is None or any(source == table and path != COLD_SOURCE for path, source in marks):
+        return
+    done = marks.get((COLD_SOURCE, table), 0)
+    records = cold.records(table, skip=done)
+    while True:
+        batch = list(islice(records, size))
+        done += len(batch)
+        batch_marks = {(COLD_SOURCE, table): done}
+        if len(batch) < size:
+            batch_marks.update({(str(db_path), table): 0 for db_path in db_paths})
+            yield batch, batch_marks
+            return
+        yield batch, batch_marks
+
+
+class RowidSources:
+    """Отметки rowid таблиц баз Database для хранилищ, пополняемых очередью записи
+
+    Хранилище сохраняет отметку в той же транзакции, что и строки, поэтому
+    после сбоя досчитываются ровно строки выше отметки. Соединения только
+    для чтения открываются один раз на базу.
+    """
+
+    def __init__(self, db_paths=()):
+        self.db_paths = [Path(db_path) for db_path in db_paths]
+        self._conns = {}
+
+    def marks(self, table: str) -> dict:
+        """(путь базы, таблица) -> наибольший rowid таблицы в каждой базе"""
+        marks = {}
+        for db_path in self.db_paths:
+            conn = self._conns.get(db_path)
+            if conn is None:
+                if not db_path.exists():
+                    continue
+                conn = sqlite3.connect(f"file:{db_path.as_posix()}?mode=ro", uri=True, check_same_thread=False)
+                self._conns[db_path] = conn
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone():
+                marks[(str(db_path), table)] = conn.execute(f"SELECT MAX(rowid) FROM {table}").fetchone()[0] or 0
+        return marks
+
+    def close(self):
+        """Закрытие соединений"""
+        for conn in self._conns.values():
+            conn.close()
+        self._conns.clear()
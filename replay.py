@@ -0,0 +1,449 @@
+"""
+Модуль воспроизведения событий Telegram без подключения к аккаунту
+"""
+import asyncio
+import gzip
+import json
+import os
+import random
+from collections import deque
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Optional
+
+from telethon.tl.types import User, Chat, Channel, MessageMediaPhoto, MessageMediaDocument
+
+# Виды событий и обработчики TelegramMonitor, в которые они передаются
+REPLAY_HANDLERS = {
+    'message': '_handle_message',
+    'edited': '_handle_edited_message',
+    'deleted': '_handle_deleted_message',
+    'reaction': '_handle_reactions',
+    'chat_action': '_handle_chat_action',
+    'user_update': '_handle_user_update'
+}
+
+# Доли видов событий в синтетическом потоке по умолчанию
+DEFAULT_MIX = {
+    'message': 70,
+    'edited': 8,
+    'deleted': 5,
+    'reaction': 12,
+    'chat_action': 3,
+    'user_update': 2
+}
+
+REACTION_EMOJI = ('👍', '❤️', '🔥', '😁', '😢', '👎')
+CHAT_ACTIONS = ('user_joined', 'user_left', 'chat_title_changed', 'pinned_message')
+WORDS = ('привет', 'как', 'дела', 'сегодня', 'встреча', 'отчет', 'файл', 'ссылка', 'новости', 'готово',
+         'hello', 'update', 'release', 'test', 'канал', 'группа', 'фото', 'видео', 'завтра', 'спасибо')
+
+
+def _tl(cls, **fields):
+    """Объект типа Telethon без вызова конструктора (набор аргументов зависит от версии)"""
+    obj = cls.__new__(cls)
+    for name, value in fields.items():
+        setattr(obj, name, value)
+    return obj
+
+
+class FakeMessage:
+    """Сообщение с полями, которые читает TelegramMonitor"""
+
+    def __init__(self, message_id: int, text: str, out: bool = False, media=None, file=None,
+                 reactions=None, date: Optional[datetime] = None, edit_date: Optional[datetime] = None,
+                 sender_id: Optional[int] = None):
+        self.id = message_id
+        self.sender_id = sender_id
+        self.message = text
+        self.out = out
+        self.media = media
+        self.file = file
+        self.reactions = reactions
+        self.fwd_from = None
+        self.date = date or datetime.now(timezone.utc)
+        self.edit_date = edit_date
+
+    async def download_media(self, file: str) -> str:
+        """Имитация загрузки: запись случайных байт размера файла"""
+        size = getattr(self.file, 'size', None) or 1024
+        await asyncio.to_thread(Path(file).write_bytes, os.urandom(size))
+        return file
+
+
+class FakeEvent:
+    """Событие с полями и корутинами событий Telethon"""
+
+    def __init__(self, client, chat_id=None, sender_id=None, user_id=None, message=None, **fields):
+        self._client = client
+        self.chat_id = chat_id
+        self.sender_id = sender_id
+        self.user_id = user_id
+        self.message = message
+        # Флаги ChatAction по умолчанию выключены
+        for flag in ('user_joined', 'user_left', 'user_added', 'user_kicked', 'user_banned',
+                     'chat_title_changed', 'chat_photo_changed'):
+            setattr(self, flag, False)
+        self.pinned_message = None
+        self.new_title = None
+        self.deleted_ids = []
+        self.user = None
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+    async def get_chat(self):
+        return await self._client.get_entity(self.chat_id)
+
+    async def get_sender(self):
+        return await self._client.get_entity(self.sender_id)
+
+    async def get_user(self):
+        return await self._client.get_entity(self.user_id)
+
+
+class FakeClient:
+    """Клиент без сети: регистрирует обработчики и отдает сущности мира
+
+    network_delay - задержка каждого запроса сущности (сек), чтобы
+    имитировать походы в сеть при промахах кэша.
+    """
+
+    def __init__(self, world, network_delay: float = 0.0):
+        self.world = world
+        self.network_delay = network_delay
+        self.handlers = []  # (построитель события, обработчик)
+        self.requests = 0
+
+    def on(self, builder):
+        """Декоратор регистрации обработчика, как TelegramClient.on"""
+        def decorator(handler):
+            self.handlers.append((builder, handler))
+            return handler
+        return decorator
+
+    def remove_event_handler(self, callback, event=None):
+        """Снятие обработчика, как TelegramClient.remove_event_handler"""
+        self.handlers = [
+            (builder, handler) for builder, handler in self.handlers
+            if handler is not callback or (event is not None and builder is not event)
+        ]
+
+    async def get_me(self):
+        return self.world.me
+
+    async def get_entity(self, peer_id):
+        self.requests += 1
+        if self.network_delay:
+            await asyncio.sleep(self.network_delay)
+        return self.world.entity(peer_id)
+
+    def is_connected(self) -> bool:
+        return True
+
+    async def get_dialogs(self, limit=None):
+        """Диалоги мира с последним сообщением каждого чата"""
+        self.requests += 1
+        if self.network_delay:
+            await asyncio.sleep(self.network_delay)
+        return [SimpleNamespace(id=chat_id, message=history[-1] if history else None)
+                for chat_id, history in self.world.history.items()][:limit]
+
+    async def get_messages(self, entity, limit: int = 100, min_id: int = 0, reverse: bool = False):
+        """История чата: сообщения с ID больше min_id (reverse - от старых к новым)"""
+        self.requests += 1
+        if self.network_delay:
+            await asyncio.sleep(self.network_delay)
+        history = self.world.history[self.world.chat_id(entity)]
+        # ID сообщений в чате идут подряд с 1, поэтому сообщение N лежит по индексу N - 1
+        if reverse:
+            return history[min_id:min_id + limit]
+        return history[max(min_id, len(history) - limit):][::-1]
+
+
+class SyntheticWorld:
+    """Набор пользователей и чатов и генератор событий по ним
+
+    Чаты делятся на личные, группы, супергруппы и каналы; ID чатов событий
+    помечены как в Telethon (группы - отрицательные, каналы - с -100).
+    Для правок, удалений и реакций выбираются недавно отправленные сообщения.
+    """
+
+    def __init__(self, chats: int = 50, users: int = 500, media_ratio: float = 0.05, seed: int = 1):
+        self.random = random.Random(seed)
+        self.media_ratio = media_ratio
+        self.me = _tl(User, id=1, is_self=True, username='me', first_name='Me', last_name=None, phone=None)
+        self._entities = {1: self.me}
+        self.users = []
+        self.chats = []  # (ID чата события, тип)
+        self._recent = {}  # ID чата -> deque недавних (message_id, sender_id)
+        self._next_id = {}  # ID чата -> следующий message_id
+        self.history = {}  # ID чата -> все сообщения чата по порядку (для догрузки)
+        self._chat_ids = {}  # id() сущности -> ID чата события
+        self._media_id = 0
+        for index in range(users):
+            self.ensure_user(1000 + index, f"user{index}", f"Имя{index}")
+        kinds = ('private', 'group', 'supergroup', 'channel')
+        for index in range(chats):
+            kind = kinds[index % len(kinds)]
+            if kind == 'private':
+                chat_id = self.users[index % len(self.users)].id
+            elif kind == 'group':
+                chat_id = -(5000 + index)
+            else:
+                chat_id = -(1000000000000 + 5000 + index)
+            self.ensure_chat(chat_id, kind, f"Чат {index}")
+
+    def ensure_user(self, user_id: int, username: Optional[str] = None, first_name: Optional[str] = None):
+        """Пользователь по ID (создается при первом обращении)"""
+        user = self._entities.get(user_id)
+        if user is None:
+            user = _tl(User, id=user_id, is_self=False, username=username, first_name=first_name or f"Имя{user_id}",
+                       last_name=None, phone=None, bot=False)
+            self._entities[user_id] = user
+            self.users.append(user)
+        return user
+
+    def ensure_chat(self, chat_id: int, kind: str, title: Optional[str] = None):
+        """Чат по ID события (создается при первом обращении)"""
+        if chat_id in self._recent:
+            return self._entities[chat_id]
+        if kind == 'private' and chat_id > 0:
+            chat = self.ensure_user(chat_id)
+        elif kind == 'group':
+            chat = _tl(Chat, id=abs(chat_id), title=title or str(chat_id))
+        else:
+            raw_id = int(str(abs(chat_id))[3:]) if str(chat_id).startswith('-100') else abs(chat_id)
+            chat = _tl(Channel, id=raw_id, title=title or str(chat_id), broadcast=kind == 'channel',
+                       megagroup=kind != 'channel', username=None)
+        self._entities[chat_id] = chat
+        self._chat_ids[id(chat)] = chat_id
+        self.chats.append((chat_id, kind))
+        self._recent[chat_id] = deque(maxlen=200)
+        self._next_id[chat_id] = 1
+        self.history[chat_id] = []
+        return chat
+
+    def chat_id(self, entity) -> int:
+        """ID чата события по сущности чата"""
+        return self._chat_ids[id(entity)]
+
+    def entity(self, peer_id):
+        """Сущность по ID (неизвестные ID становятся пользователями)"""
+        entity = self._entities.get(peer_id)
+        if entity is None and peer_id is not None:
+            entity = self.ensure_user(peer_id)
+        return entity
+
+    def _text(self) -> str:
+        return ' '.join(self.random.choice(WORDS) for _ in range(self.random.randint(2, 25)))
+
+    def _media(self):
+        """Случайное медиа: (media, file)"""
+        self._media_id += 1
+        if self.random.random() < 0.6:
+            media = _tl(MessageMediaPhoto, photo=SimpleNamespace(id=self._media_id))
+            file = SimpleNamespace(ext='.jpg', mime_type='image/jpeg', size=self.random.randint(20000, 300000))
+        else:
+            mime_type = self.random.choice(('video/mp4', 'audio/ogg', 'application/pdf'))
+            media = _tl(MessageMediaDocument, document=SimpleNamespace(id=self._media_id, mime_type=mime_type))
+            file = SimpleNamespace(ext='.bin', mime_type=mime_type, size=self.random.randint(50000, 2000000))
+        return media, file
+
+    def _pick_recent(self):
+        """Случайное недавнее сообщение: (chat_id, kind, message_id, sender_id) или None"""
+        for _ in range(5):
+            chat_id, kind = self.random.choice(self.chats)
+            recent = self._recent[chat_id]
+            if recent:
+                message_id, sender_id = self.random.choice(recent)
+                return chat_id, kind, message_id, sender_id
+        return None
+
+    def make(self, client, kind: str) -> tuple:
+        """Синтетическое событие вида kind: (вид, событие)
+
+        Если для вида еще нет подходящих сообщений или чатов, вместо него
+        генерируется новое сообщение.
+        """
+        if kind == 'message':
+            chat_id, message = self._new_message()
+            return kind, FakeEvent(client, chat_id=chat_id, sender_id=message.sender_id, message=message)
+
+        picked = self._pick_recent()
+        if kind in ('edited', 'deleted', 'reaction') and picked is None:
+            return self.make(client, 'message')
+        if kind == 'edited':
+            chat_id, _, message_id, sender_id = picked
+            message = FakeMessage(message_id, self._text(), edit_date=datetime.now(timezone.utc))
+            return kind, FakeEvent(client, chat_id=chat_id, sender_id=sender_id, message=message)
+        if kind == 'deleted':
+            chat_id, chat_kind, message_id, _ = picked
+            recent = self._recent[chat_id]
+            ids = [message_id] + [self.random.choice(recent)[0] for _ in range(self.random.randint(0, 3))]
+            # В личных чатах и группах Telegram не сообщает чат удаления
+            event_chat_id = chat_id if chat_kind in ('supergroup', 'channel') else None
+            return kind, FakeEvent(client, chat_id=event_chat_id, deleted_ids=sorted(set(ids)))
+        if kind == 'reaction':
+            chat_id, _, message_id, sender_id = picked
+            return kind, FakeEvent(client, chat_id=chat_id, sender_id=sender_id, message=FakeMessage(
+                message_id, '', reactions=self._reactions()
+            ))
+        if kind == 'chat_action':
+            chat_id, chat_kind = self.random.choice(self.chats)
+            if chat_kind == 'private':
+                return self.make(client, 'message')
+            action = self.random.choice(CHAT_ACTIONS)
+            user_id = self.random.choice(self.users).id
+            fields = {action: True} if action != 'pinned_message' else {
+                'pinned_message': SimpleNamespace(id=max(1, self._next_id[chat_id] - 1))
+            }
+            if action == 'chat_title_changed':
+                fields['new_title'] = f"Чат {chat_id} ({self.random.randint(1, 99)})"
+            return kind, FakeEvent(client, chat_id=chat_id, user_id=user_id, **fields)
+        if kind == 'user_update':
+            user = self.random.choice(self.users)
+            return kind, FakeEvent(client, user_id=user.id, user=user)
+        raise ValueError(f"Неизвестный вид события: {kind}")
+
+    def _new_message(self) -> tuple:
+        """Новое сообщение в случайном чате: (chat_id, сообщение)"""
+        chat_id, chat_kind = self.random.choice(self.chats)
+        sender_id = chat_id if chat_kind == 'private' else self.random.choice(self.users).id
+        message_id = self._next_id[chat_id]
+        self._next_id[chat_id] += 1
+        media, file = self._media() if self.random.random() < self.media_ratio else (None, None)
+        self._recent[chat_id].append((message_id, sender_id))
+        message = FakeMessage(message_id, self._text(), out=self.random.random() < 0.1, media=media, file=file,
+                              sender_id=sender_id)
+        self.history[chat_id].append(message)
+        return chat_id, message
+
+    def offline(self, count: int) -> int:
+        """Сообщения, пришедшие, пока монитор не работал: только в истории чатов, без событий"""
+        for _ in range(count):
+            self._new_message()
+        return count
+
+    def _reactions(self):
+        """Случайный набор реакций в формате MessageReactions"""
+        results = []
+        recent = []
+        for emoji in self.random.sample(REACTION_EMOJI, self.random.randint(1, 3)):
+            reaction = SimpleNamespace(emoticon=emoji)
+            count = self.random.randint(1, 20)
+            results.append(SimpleNamespace(reaction=reaction, count=count))
+            for user in self.random.sample(self.users, min(count, 3)):
+                recent.append(SimpleNamespace(peer_id=SimpleNamespace(user_id=user.id), reaction=reaction))
+        return SimpleNamespace(results=results, recent_reactions=recent)
+
+    def synthetic(self, client, count: int, mix: Optional[dict] = None):
+        """Поток из count синтетических событий: пары (вид, событие)"""
+        mix = mix or DEFAULT_MIX
+        kinds = list(mix)
+        weights = [mix[kind] for kind in kinds]
+        for _ in range(count):
+            yield self.make(client, self.random.choices(kinds, weights)[0])
+
+    def recorded(self, client, path):
+        """Поток событий из NDJSON выгрузки команды export"""
+        path = Path(path)
+        opener = gzip.open if path.suffix == '.gz' else open
+        with opener(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                row = json.loads(line)
+                event = self._from_row(client, row)
+                if event is not None:
+                    yield event
+
+    def _from_row(self, client, row: dict):
+        """Событие по строке выгрузки: (вид, событие) или None"""
+        table = row.get('table')
+        chat_id = row.get('chat_id')
+        if chat_id is not None:
+            self.ensure_chat(chat_id, row.get('chat_type') or _kind_by_id(chat_id), row.get('chat_title'))
+        if table == 'messages':
+            sender_id = row.get('sender_id')
+            if sender_id is not None:
+                self.ensure_user(sender_id, row.get('sender_username'), row.get('sender_first_name'))
+            if row.get('is_deleted'):
+                return 'deleted', FakeEvent(client, chat_id=chat_id, deleted_ids=[row.get('message_id')])
+            message = FakeMessage(row.get('message_id'), row.get('text') or '', out=bool(row.get('is_outgoing')),
+                                  edit_date=datetime.now(timezone.utc) if row.get('is_edited') else None)
+            kind = 'edited' if row.get('is_edited') else 'message'
+            return kind, FakeEvent(client, chat_id=chat_id, sender_id=sender_id, message=message)
+        if table == 'reactions':
+            user_id = row.get('user_id')
+            self.ensure_user(user_id, row.get('user_username'))
+            reaction = SimpleNamespace(emoticon=row.get('reaction') or '👍')
+            reactions = SimpleNamespace(
+                results=[SimpleNamespace(reaction=reaction, count=1)],
+                recent_reactions=[SimpleNamespace(peer_id=SimpleNamespace(user_id=user_id), reaction=reaction)]
+            )
+            return 'reaction', FakeEvent(client, chat_id=chat_id, message=FakeMessage(
+                row.get('message_id'), '', reactions=reactions
+            ))
+        if table == 'events':
+            user_id = row.get('user_id')
+            if user_id is not None:
+                self.ensure_user(user_id, row.get('user_username'), row.get('user_first_name'))
+            if chat_id is None:
+                return 'user_update', FakeEvent(client, user_id=user_id, user=self.entity(user_id))
+            event_type = row.get('event_type')
+            if event_type in ('user_joined', 'user_left', 'user_added', 'user_kicked', 'user_banned',
+                              'chat_title_changed', 'chat_photo_changed'):
+                return 'chat_action', FakeEvent(client, chat_id=chat_id, user_id=user_id, **{event_type: True})
+        return None
+
+
+def _kind_by_id(chat_id: int) -> str:
+    """Тип чата по помеченному ID"""
+    if chat_id > 0:
+        return 'private'
+    return 'supergroup' if str(chat_id).startswith('-100') else 'group'
+
+
+class NullLogger:
+    """Замена файлового логгера приложения, чтобы замеры не засоряли логи"""
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+async def replay(monitor, events, rate: float = 0.0, max_pending: int = 100000) -> dict:
+    """Подача событий в обработчики монитора с заданной частотой
+
+    Каждое событие обрабатывается отдельной задачей через monitor._dispatch,
+    как при параллельной обработке обновлений в Telethon. rate - событий в
+    секунду (0 - без ограничения). Возвращает число событий по видам и
+    длительности подачи и обработки.
+    """
+    loop = asyncio.get_running_loop()
+    pending = set()
+    counts = {}
+    started = loop.time()
+    sent = 0
+    for kind, event in events:
+        if rate:
+            delay = started + sent / rate - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        while len(pending) >= max_pending:
+            _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        handler = getattr(monitor, REPLAY_HANDLERS[kind])
+        if kind == 'message' and getattr(monitor, 'catchup', None):
+            # Как обработчик NewMessage клиента: живое сообщение - граница догрузки
+            monitor.catchup.observe(event.chat_id, event.message.id)
+        task = loop.create_task(monitor._dispatch(handler, event))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+        counts[kind] = counts.get(kind, 0) + 1
+        sent += 1
+        if sent % 256 == 0:
+            # Даем обработчикам выполняться во время подачи
+            await asyncio.sleep(0)
+    fed = loop.time() - started
+    if pending:
+        await asyncio.gather(*pending)
+    handled = loop.time() - started
+    return {'events': sent, 'counts': counts, 'feed_seconds': fed, 'handle_seconds': handled}
@@ -0,0 +1,302 @@
+"""
+Модуль хранения по срокам: удаление устаревших данных по дням
+"""
+import asyncio
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Optional
+
+from logger import logger
+
+# Таблицы с политиками хранения и колонка-ключ агрегатов (None - без агрегатов)
+RETENTION_TABLES = {
+    'messages': None,
+    'reactions': 'reaction',
+    'events': 'event_type',
+    'media': None
+}
+
+# Размер списка chat_id в одном DELETE
+CHUNK_SIZE = 500
+
+# Тип чата, который не удалось определить
+UNKNOWN_TYPE = 'unknown'
+
+
+class RetentionManager:
+    """Фоновое удаление данных старше срока хранения
+
+    Политики задаются по таблицам и типам чатов в днях, None - хранить
+    всегда, '*' - для остальных типов:
+    `{'messages': {'channel': 30, 'private': None, '*': 365}}`.
+    Тип чата берется из таблицы чатов сеанса, из сохраненных типов или из
+    колонки chat_type его сообщений. Чаты, тип которых определить не
+    удалось, под '*' не попадают - только под явный ключ 'unknown'.
+    Данные удаляются целыми дневными партициями: за проход одного дня и типа
+    чатов выполняется один DELETE по диапазону дат в короткой транзакции,
+    а обработанные дни запоминаются, чтобы не просматривать их повторно.
+    Перед удалением реакции и события можно свернуть в счетчики по дню,
+    чату и ключу (реакция или тип события) - таблица `rollups`.
+    Те же политики применяются к дневным сегментам холодного хранилища
+    `cold` (ColdStore): устаревшие сегменты удаляются целиком.
+    """
+
+    def __init__(self, db_paths: list, state_path: Path, policies: dict, chats=None,
+                 rollup: bool = False, interval: float = 3600, on_dropped=None, cold=None):
+        self.db_paths = [Path(path) for path in db_paths]
+        self.state_path = Path(state_path)
+        self.policies = policies
+        self.chats = chats  # ChatTable текущего сеанса
+        self.rollup = rollup
+        self.interval = interval
+        self.on_dropped = on_dropped  # Вызывается как (таблица, chat_ids, начало, конец)
+        self.cold = cold  # ColdStore со строками, перенесенными из базы
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._types = {}  # chat_id -> тип чата, сохраненный в прошлых сеансах или найденный в базе
+        self.stats = {
+            'runs': 0,
+            'partitions': 0,
+            'dropped': 0,
+            'rolled_up': 0,
+            'last_run_ms': 0.0
+        }
+
+        with sqlite3.connect(str(self.state_path)) as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS retention_state (
+                    db_path TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    chat_type TEXT NOT NULL,
+                    next_day TEXT NOT NULL,
+                    PRIMARY KEY (db_path, source, chat_type)
+                );
+                CREATE TABLE IF NOT EXISTS chat_types (
+                    chat_id INTEGER PRIMARY KEY,
+                    type TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS rollups (
+                    day TEXT NOT NULL,
+                    chat_id INTEGER,
+                    source TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (day, chat_id, source, key)
+                );
+            """)
+            self._types = dict(conn.execute("SELECT chat_id, type FROM chat_types"))
+        conn.close()
+
+    def start(self):
+        """Запуск фоновой задачи на текущем event loop"""
+        self._stopping = False
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Остановка фоновой задачи"""
+        self._stopping = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        """Периодический запуск очистки"""
+        while True:
+            try:
+                await asyncio.to_thread(self.compact)
+            except Exception as e:
+                logger.error(f"Ошибка очистки устаревших данных: {e}")
+            await asyncio.sleep(self.interval)
+
+    def chat_type(self, chat_id: int, conn=None) -> str:
+        """Тип чата по ID из базы данных: из таблицы чатов сеанса, сохраненный
+        или по колонке chat_type сообщений чата в базе conn"""
+        info = self.chats.by_id(chat_id) if self.chats is not None else None
+        if info is not None and info.type != UNKNOWN_TYPE:
+            return info.type
+        known = self._types.get(chat_id)
+        if known is None and conn is not None:
+            known = self._lookup_type(conn, chat_id)
+        return known or UNKNOWN_TYPE
+
+    def _lookup_type(self, conn, chat_id: int) -> Optional[str]:
+        """Тип чата из его сообщений; найденный тип сохраняется"""
+        columns = {row[1] for row in conn.execute("PRAGMA main.table_info(messages)")}
+        if 'chat_type' not in columns:
+            return None
+        row = conn.execute(
+            "SELECT chat_type FROM main.messages WHERE chat_id = ? AND chat_type IS NOT NULL AND chat_type != ? LIMIT 1",
+            (chat_id, UNKNOWN_TYPE)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute("INSERT OR REPLACE INTO state.chat_types (chat_id, type) VALUES (?, ?)", (chat_id, row[0]))
+        self._types[chat_id] = row[0]
+        return row[0]
+
+    def _save_chat_types(self, conn):
+        """Сохранение типов чатов сеанса для следующих запусков"""
+        if self.chats is None:
+            return
+        known = [(info.id, info.type) for info in self.chats.values()
+                 if info.type != UNKNOWN_TYPE and self._types.get(info.id) != info.type]
+        if known:
+            conn.executemany("INSERT OR REPLACE INTO state.chat_types (chat_id, type) VALUES (?, ?)", known)
+            self._types.update(known)
+
+    def compact(self, now: Optional[datetime] = None) -> int:
+        """Один проход очистки по всем базам; возвращает число удаленных строк"""
+        started = time.perf_counter()
+        today = (now or datetime.now()).date()
+        dropped = 0
+        with self._lock:
+            for db_path in self.db_paths:
+                if not db_path.exists():
+                    continue
+                conn = sqlite3.connect(str(db_path), timeout=30)
+                try:
+                    conn.execute("ATTACH DATABASE ? AS state", (str(self.state_path),))
+                    self._save_chat_types(conn)
+                    conn.commit()
+                    for table, policy in self.policies.items():
+                        columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+                        if table not in RETENTION_TABLES or not {'date', 'chat_id'} <= columns:
+                            continue
+                        for chat_type, days in policy.items():
+                            if days is None or self._stopping:
+                                continue
+                            dropped += self._drop_partitions(
+                                conn, db_path, table, chat_type, policy, today - timedelta(days=days)
+                            )
+                finally:
+                    conn.close()
+            if self.cold is not None and not self._stopping:
+                dropped += self._drop_cold(today)
+        self.stats['runs'] += 1
+        self.stats['last_run_ms'] = (time.perf_counter() - started) * 1000
+        if dropped:
+            logger.info(f"Очистка по срокам хранения: удалено {dropped} строк")
+        return dropped
+
+    def _drop_partitions(self, conn, db_path: Path, table: str, chat_type: str,
+                         policy: dict, cutoff: date) -> int:
+        """Удаление дневных партиций таблицы до cutoff для одного типа чатов"""
+        state_key = (str(db_path), table, chat_type)
+        row = conn.execute(
+            "SELECT next_day FROM state.retention_state WHERE db_path = ? AND source = ? AND chat_type = ?",
+            state_key
+        ).fetchone()
+        oldest = conn.execute(f"SELECT MIN(date) FROM {table}").fetchone()[0]
+        if oldest is None:
+            return 0
+        epoch = isinstance(oldest, (int, float))
+        day = max(date.fromisoformat(row[0]) if row else date.min, _to_date(oldest))
+
+        dropped = 0
+        while day < cutoff and not self._stopping:
+            start = datetime.combine(day, datetime.min.time())
+            end = start + timedelta(days=1)
+            bounds = (start.timestamp(), end.timestamp()) if epoch else (start.isoformat(sep=' '), end.isoformat(sep=' '))
+            chat_ids = [
+                chat_id for (chat_id,) in conn.execute(
+                    f"SELECT DISTINCT chat_id FROM {table} WHERE date >= ? AND date < ?", bounds
+                )
+                if chat_id is not None and self._matches(conn, chat_id, chat_type, policy)
+            ]
+            try:
+                for offset in range(0, len(chat_ids), CHUNK_SIZE):
+                    chunk = chat_ids[offset:offset + CHUNK_SIZE]
+                    condition = f"date >= ? AND date < ? AND chat_id IN ({','.join('?' * len(chunk))})"
+                    params = list(bounds) + chunk
+                    key_column = RETENTION_TABLES[table]
+                    if self.rollup and key_column:
+                        cursor = conn.execute(
+                            f"INSERT INTO state.rollups (day, chat_id, source, key, count) "
+                            f"SELECT ?, chat_id, ?, COALESCE({key_column}, ''), COUNT(*) FROM {table} "
+                            f"WHERE {condition} GROUP BY chat_id, {key_column} "
+                            f"ON CONFLICT (day, chat_id, source, key) DO UPDATE SET count = count + excluded.count",
+                            [day.isoformat(), table] + params
+                        )
+                        self.stats['rolled_up'] += max(cursor.rowcount, 0)
+                    dropped += conn.execute(f"DELETE FROM {table} WHERE {condition}", params).rowcount
+                conn.execute(
+                    "INSERT OR REPLACE INTO state.retention_state (db_path, source, chat_type, next_day) "
+                    "VALUES (?, ?, ?, ?)",
+                    state_key + ((day + timedelta(days=1)).isoformat(),)
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            self.stats['partitions'] += 1
+            if chat_ids and self.on_dropped:
+                try:
+                    self.on_dropped(table, chat_ids, start, end)
+                except Exception as e:
+                    logger.error(f"Ошибка обработки удаленной партиции ({table}): {e}")
+            day += timedelta(days=1)
+        self.stats['dropped'] += dropped
+        return dropped
+
+    def _drop_cold(self, today: date) -> int:
+        """Удаление сегментов холодного хранилища старше срока хранения"""
+        dropped = 0
+        for table, policy in self.policies.items():
+            if table not in RETENTION_TABLES:
+                continue
+            for chat_id in self.cold.chat_ids(table):
+                if self._stopping:
+                    return dropped
+                actual = self.chat_type(chat_id)
+                if actual == UNKNOWN_TYPE:
+                    actual = self.cold.chat_type(chat_id) or UNKNOWN_TYPE
+                if actual in policy:
+                    days = policy[actual]
+                else:
+                    days = policy.get('*') if actual != UNKNOWN_TYPE else None
+                if days is None:
+                    continue
+                for day, rows in self.cold.drop_segments(table, chat_id, today - timedelta(days=days)):
+                    dropped += rows
+                    self.stats['partitions'] += 1
+                    if self.on_dropped:
+                        start = datetime.combine(day, datetime.min.time())
+                        try:
+                            self.on_dropped(table, [chat_id], start, start + timedelta(days=1))
+                        except Exception as e:
+                            logger.error(f"Ошибка обработки удаленного сегмента ({table}): {e}")
+        self.stats['dropped'] += dropped
+        return dropped
+
+    def _matches(self, conn, chat_id: int, chat_type: str, policy: dict) -> bool:
+        """Подпадает ли чат под правило политики"""
+        actual = self.chat_type(chat_id, conn)
+        if chat_type == '*':
+            return actual != UNKNOWN_TYPE and actual not in policy
+        return actual == chat_type
+
+    def get_stats(self) -> dict:
+        """Получение статистики очистки"""
+        return {
+            'runs': self.stats['runs'],
+            'partitions': self.stats['partitions'],
+            'dropped': self.stats['dropped'],
+            'rolled_up': self.stats['rolled_up'],
+            'last_run_ms': round(self.stats['last_run_ms'], 2)
+        }
+
+
+def _to_date(value) -> date:
+    """Дата из значения колонки date (строка ISO или Unix-время)"""
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value).date()
+    return datetime.fromisoformat(str(value)[:19]).date()
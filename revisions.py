@@ -0,0 +1,196 @@
+"""
+Модуль хранения истории редактирования сообщений
+"""
+import asyncio
+import difflib
+import json
+import sqlite3
+import threading
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+# Дельты длиннее этого размера сжимаются zlib
+COMPRESS_THRESHOLD = 256
+
+
+def make_delta(old: str, new: str) -> bytes:
+    """Компактная дельта между версиями текста: список [начало, конец, замена]"""
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    ops = [[i1, i2, new[j1:j2]] for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']
+    raw = json.dumps(ops, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    if len(raw) > COMPRESS_THRESHOLD:
+        return b'z' + zlib.compress(raw)
+    return b'j' + raw
+
+
+def apply_delta(old: str, delta: bytes) -> str:
+    """Применение дельты к предыдущей версии текста"""
+    raw = zlib.decompress(delta[1:]) if delta[:1] == b'z' else delta[1:]
+    parts = []
+    position = 0
+    for start, end, replacement in json.loads(raw.decode('utf-8')):
+        parts.append(old[position:start])
+        parts.append(replacement)
+        position = end
+    parts.append(old[position:])
+    return ''.join(parts)
+
+
+def format_history(versions: list) -> str:
+    """Текст истории правок для консоли: версия, дата правки и текст"""
+    lines = []
+    for revision, date, text in versions:
+        when = datetime.fromtimestamp(date).strftime('%Y-%m-%d %H:%M:%S') if date else 'исходный текст'
+        lines.append(f"#{revision} [{when}] {text}")
+    return '\n'.join(lines)
+
+
+class RevisionStore:
+    """История правок сообщений на SQLite
+
+    Для каждого сообщения хранится базовый текст, последний текст (для
+    быстрого чтения) и цепочка дельт - по одной на правку. Если исходный
+    текст неизвестен (сообщение не попадало в кэш), базой становится первая
+    увиденная правка.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS message_texts (
+                chat_id INTEGER NOT NULL,
+                message_id INTEGER NOT NULL,
+                base_text TEXT NOT NULL,
+                base_is_original INTEGER NOT NULL,
+                latest_text TEXT NOT NULL,
+                revisions INTEGER NOT NULL DEFAULT 0,
+                updated INTEGER,
+                PRIMARY KEY (chat_id, message_id)
+            );
+            CREATE TABLE IF NOT EXISTS revisions (
+                chat_id INTEGER NOT NULL,
+                message_id INTEGER NOT NULL,
+                revision INTEGER NOT NULL,
+                date INTEGER,
+                delta BLOB NOT NULL,
+                PRIMARY KEY (chat_id, message_id, revision)
+            ) WITHOUT ROWID;
+        """)
+        self._conn.commit()
+        self.written = 0  # Правок сохранено за сеанс
+
+    async def on_edits(self, rows: list):
+        """Обработчик очереди записи для строк 'record_edit'"""
+        await asyncio.to_thread(self.add_edits, rows)
+
+    def add_edits(self, rows: list):
+        """Сохранение пакета правок одной транзакцией
+
+        Строка - EditRecord: chat_id, message_id, text, date (Unix-время) и
+        необязательный previous_text - текст до правки, если он известен.
+        """
+        with self._lock:
+            try:
+                for row in rows:
+                    self._add_edit(row)
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+
+    def _add_edit(self, row):
+        """Сохранение одной правки"""
+        chat_id, message_id, text, date = row.chat_id, row.message_id, row.text or '', row.date
+        current = self._conn.execute(
+            "SELECT latest_text, revisions FROM message_texts WHERE chat_id = ? AND message_id = ?",
+            (chat_id, message_id)
+        ).fetchone()
+
+        if current is None:
+            previous = row.previous_text
+            if previous is None:
+                # Исходный текст неизвестен - правка становится базой
+                self._conn.execute(
+                    "INSERT INTO message_texts (chat_id, message_id, base_text, base_is_original, latest_text, revisions, updated) "
+                    "VALUES (?, ?, ?, 0, ?, 0, ?)",
+                    (chat_id, message_id, text, text, date)
+                )
+                return
+            self._conn.execute(
+                "INSERT INTO message_texts (chat_id, message_id, base_text, base_is_original, latest_text, revisions, updated) "
+                "VALUES (?, ?, ?, 1, ?, 0, ?)",
+                (chat_id, message_id, previous, previous, date)
+            )
+            current = (previous, 0)
+
+        latest_text, revision_count = current
+        if latest_text == text:
+            return
+        revision = revision_count + 1
+        self._conn.execute(
+            "INSERT OR REPLACE INTO revisions (chat_id, message_id, revision, date, delta) VALUES (?, ?, ?, ?, ?)",
+            (chat_id, message_id, revision, date, make_delta(latest_text, text))
+        )
+        self._conn.execute(
+            "UPDATE message_texts SET latest_text = ?, revisions = ?, updated = ? WHERE chat_id = ? AND message_id = ?",
+            (text, revision, date, chat_id, message_id)
+        )
+        self.written += 1
+
+    def latest(self, chat_id: int, message_id: int) -> Optional[str]:
+        """Последний текст сообщения"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT latest_text FROM message_texts WHERE chat_id = ? AND message_id = ?",
+                (chat_id, message_id)
+            ).fetchone()
+        return row[0] if row else None
+
+    def version(self, chat_id: int, message_id: int, revision: int) -> Optional[str]:
+        """Текст сообщения после заданной правки (0 - базовый текст)"""
+        with self._lock:
+            base = self._conn.execute(
+                "SELECT base_text, revisions FROM message_texts WHERE chat_id = ? AND message_id = ?",
+                (chat_id, message_id)
+            ).fetchone()
+            if base is None or revision > base[1]:
+                return None
+            deltas = self._conn.execute(
+                "SELECT delta FROM revisions WHERE chat_id = ? AND message_id = ? AND revision <= ? ORDER BY revision",
+                (chat_id, message_id, revision)
+            ).fetchall()
+        text = base[0]
+        for (delta,) in deltas:
+            text = apply_delta(text, delta)
+        return text
+
+    def history(self, chat_id: int, message_id: int) -> list:
+        """Все версии сообщения: список (номер правки, дата, текст)"""
+        with self._lock:
+            base = self._conn.execute(
+                "SELECT base_text FROM message_texts WHERE chat_id = ? AND message_id = ?",
+                (chat_id, message_id)
+            ).fetchone()
+            if base is None:
+                return []
+            deltas = self._conn.execute(
+                "SELECT revision, date, delta FROM revisions WHERE chat_id = ? AND message_id = ? ORDER BY revision",
+                (chat_id, message_id)
+            ).fetchall()
+        text = base[0]
+        versions = [(0, None, text)]
+        for revision, date, delta in deltas:
+            text = apply_delta(text, delta)
+            versions.append((revision, date, text))
+        return versions
+
+    def close(self):
+        """Закрытие хранилища"""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,295 @@
+"""
+Модуль полнотекстового поиска по сохраненным событиям
+"""
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from logger import logger
+from records import TABLE_RECORDS, RowidSources, cold_batches, read_table
+
+# Типы записей индекса
+SEARCH_KINDS = ('message', 'edited', 'deleted', 'reaction', 'event')
+
+# Таблицы Database, строки которых попадают в индекс
+INDEXED_TABLES = ('messages', 'reactions', 'events')
+
+# Строк базы данных за одну транзакцию дозаполнения
+BACKFILL_BATCH = 2000
+
+
+def _timestamp(value) -> Optional[int]:
+    """Преобразование даты в Unix-время"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    return int(value)
+
+
+# Метод очереди записи -> индексируемая таблица Database
+_METHOD_TABLES = {TABLE_RECORDS[table][0]: table for table in INDEXED_TABLES}
+
+
+def _fts_query(text: str) -> str:
+    """Преобразование пользовательского текста в запрос FTS5 (все слова, по префиксу)"""
+    tokens = [token.replace('"', '""') for token in text.split() if token.strip('"')]
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+class SearchIndex:
+    """Индекс событий на SQLite FTS5
+
+    Пополняется из очереди отложенной записи по мере записи строк в базу
+    данных и позволяет искать по тексту, чату, отправителю, типу и периоду.
+    Правки индексируются только по record_edit: строки-правки в messages
+    (Database без update_message_text) пропускаются. Вместе с записями в той
+    же транзакции сохраняется отметка rowid таблиц баз `db_paths`, и
+    `backfill()` дозаполняет индекс строками выше нее - уже накопленным
+    архивом при первом открытии (вместе с сегментами холодного хранилища
+    `cold`) и строками, не дошедшими до индекса при сбое.
+    """
+
+    def __init__(self, path: Path, db_paths=(), cold=None):
+        self.path = Path(path)
+        self.cold = cold  # ColdStore со строками, перенесенными из базы
+        self.db_paths = [Path(db_path) for db_path in db_paths]
+        self._sources = RowidSources(self.db_paths)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                id INTEGER PRIMARY KEY,
+                kind TEXT NOT NULL,
+                chat_id INTEGER,
+                chat_title TEXT,
+                sender_id INTEGER,
+                sender TEXT,
+                message_id INTEGER,
+                date INTEGER,
+                text TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_entries_date ON entries(date);
+            CREATE INDEX IF NOT EXISTS idx_entries_chat_date ON entries(chat_id, date);
+            CREATE INDEX IF NOT EXISTS idx_entries_sender_date ON entries(sender_id, date);
+            CREATE INDEX IF NOT EXISTS idx_entries_kind_date ON entries(kind, date);
+            CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+                text, content='entries', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            );
+            CREATE TABLE IF NOT EXISTS sources (
+                db_path TEXT NOT NULL,
+                source TEXT NOT NULL,
+                last_rowid INTEGER NOT NULL,
+                PRIMARY KEY (db_path, source)
+            );
+        """)
+        self._conn.commit()
+
+    async def on_rows(self, method: str, rows: list):
+        """Приемник очереди записи: индексирование записанных строк"""
+        if method == 'mark_messages_deleted':
+            await asyncio.to_thread(self.mark_deleted, rows)
+            return
+        entries = [entry for entry in (self._to_entry(method, row) for row in rows) if entry]
+        table = _METHOD_TABLES.get(method)
+        if entries or (table and self.db_paths):
+            await asyncio.to_thread(self._add_written, entries, table)
+
+    def _add_written(self, entries: list, table: Optional[str]):
+        """Добавление записей пакета вместе с отметками таблицы (в отдельном потоке)"""
+        self.add_entries(entries, self._sources.marks(table) if table else None)
+
+    def backfill(self) -> int:
+        """Дозаполнение индекса строками архива и баз данных выше отметок; возвращает число строк"""
+        with self._lock:
+            marks = {(db_path, source): rowid for db_path, source, rowid
+                     in self._conn.execute("SELECT db_path, source, last_rowid FROM sources")}
+        added = 0
+        for table in INDEXED_TABLES:
+            method = TABLE_RECORDS[table][0]
+            # Новый индекс: сначала строки, уже перенесенные в архив
+            for records, batch_marks in cold_batches(self.cold, table, self.db_paths, marks, BACKFILL_BATCH):
+                entries = [entry for entry in (self._to_entry(method, record) for record in records) if entry]
+                if not self.add_entries(entries, batch_marks):
+                    return added
+                added += len(records)
+            for db_path in self.db_paths:
+                key = (str(db_path), table)
+                after = marks.get(key, 0)
+                while True:
+                    rows = read_table(db_path, table, after, BACKFILL_BATCH)
+                    if not rows:
+                        break
+                    entries = [entry for entry in (self._to_entry(method, record) for _, record in rows) if entry]
+                    after = rows[-1][0]
+                    if not self.add_entries(entries, {key: after}):
+                        return added
+                    added += len(rows)
+        if added:
+            logger.info(f"Поисковый индекс дозаполнен по базе данных: {added} строк")
+        return added
+
+    @staticmethod
+    def _to_entry(method: str, row) -> Optional[tuple]:
+        """Преобразование записи (records.py) в запись индекса"""
+        if method in ('insert_message', 'record_edit'):
+            if method == 'record_edit':
+                kind = 'edited'
+            elif row.is_deleted:
+                kind = 'deleted'
+            elif row.is_edited:
+                # Строка-правка (Database без update_message_text) - правка уже проиндексирована по record_edit
+                return None
+            else:
+                kind = 'message'
+            sender = row.sender_username or row.sender_first_name
+            return (kind, row.chat_id, row.chat_title, row.sender_id, sender,
+                    row.message_id, row.date, row.text or '')
+        if method == 'insert_reaction':
+            return ('reaction', row.chat_id, None, row.user_id, row.user_username,
+                    row.message_id, row.date, f"{row.reaction} {row.action}")
+        if method == 'insert_event':
+            details = row.details if isinstance(row.details, str) else json.dumps(row.details or {}, ensure_ascii=False)
+            text = f"{row.event_type} {details}"
+            sender = row.user_username or row.user_first_name
+            return ('event', row.chat_id, row.chat_title, row.user_id, sender,
+                    None, row.date, text)
+        return None
+
+    def add_entries(self, entries: list, marks: Optional[dict] = None) -> bool:
+        """Добавление записей в индекс одной транзакцией
+
+        marks - (база, таблица) -> rowid, до которого строки проиндексированы.
+        Возвращает False при ошибке.
+        """
+        with self._lock:
+            try:
+                cursor = self._conn.cursor()
+                for entry in entries:
+                    cursor.execute(
+                        "INSERT INTO entries (kind, chat_id, chat_title, sender_id, sender, message_id, date, text) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        entry
+                    )
+                    cursor.execute(
+                        "INSERT INTO entries_fts (rowid, text) VALUES (?, ?)",
+                        (cursor.lastrowid, entry[7])
+                    )
+                cursor.executemany(
+                    "INSERT INTO sources (db_path, source, last_rowid) VALUES (?, ?, ?) "
+                    "ON CONFLICT (db_path, source) DO UPDATE SET last_rowid = MAX(last_rowid, excluded.last_rowid)",
+                    [(db_path, source, rowid) for (db_path, source), rowid in (marks or {}).items()]
+                )
+                self._conn.commit()
+            except Exception as e:
+                self._conn.rollback()
+                logger.error(f"Ошибка индексирования для поиска: {e}")
+                return False
+        return True
+
+    def mark_deleted(self, rows: list):
+        """Пометка сообщений удаленными (строки вида chat_id + message_ids)"""
+        with self._lock:
+            try:
+                for row in rows:
+                    ids = row['message_ids']
+                    for start in range(0, len(ids), 500):
+                        chunk = ids[start:start + 500]
+                        self._conn.execute(
+                            f"UPDATE entries SET kind = 'deleted' WHERE kind IN ('message', 'edited') "
+                            f"AND chat_id IS ? AND message_id IN ({','.join('?' * len(chunk))})",
+                            [row['chat_id']] + chunk
+                        )
+                self._conn.commit()
+            except Exception as e:
+                self._conn.rollback()
+                logger.error(f"Ошибка пометки удаленных сообщений в индексе: {e}")
+
+    def drop(self, kinds: tuple, chat_ids: list, since: datetime, until: datetime):
+        """Удаление записей чатов за период (после очистки по срокам хранения)"""
+        with self._lock:
+            try:
+                for start in range(0, len(chat_ids), 500):
+                    chunk = chat_ids[start:start + 500]
+                    condition = (
+                        f"kind IN ({','.join('?' * len(kinds))}) AND date >= ? AND date < ? "
+                        f"AND chat_id IN ({','.join('?' * len(chunk))})"
+                    )
+                    params = list(kinds) + [_timestamp(since), _timestamp(until)] + chunk
+                    # Внешнее содержимое FTS удаляется командой 'delete' со старым текстом
+                    self._conn.execute(
+                        f"INSERT INTO entries_fts (entries_fts, rowid, text) "
+                        f"SELECT 'delete', id, text FROM entries WHERE {condition}",
+                        params
+                    )
+                    self._conn.execute(f"DELETE FROM entries WHERE {condition}", params)
+                self._conn.commit()
+            except Exception as e:
+                self._conn.rollback()
+                logger.error(f"Ошибка удаления записей из индекса: {e}")
+
+    def search(self, text: Optional[str] = None, chat=None, sender=None, kind: Optional[str] = None,
+               since: Optional[datetime] = None, until: Optional[datetime] = None, limit: int = 50):
+        """Поиск записей; возвращает (список словарей, время поиска в мс)"""
+        started = time.perf_counter()
+        sql = "SELECT e.kind, e.chat_id, e.chat_title, e.sender_id, e.sender, e.message_id, e.date, e.text FROM entries e"
+        conditions = []
+        params = []
+        query = _fts_query(text) if text else ''
+        if query:
+            # Подзапрос к FTS позволяет планировщику совместить его с индексами по чату и дате
+            conditions.append("e.id IN (SELECT rowid FROM entries_fts WHERE entries_fts MATCH ?)")
+            params.append(query)
+        if chat is not None:
+            if isinstance(chat, int) or str(chat).lstrip('-').isdigit():
+                conditions.append("e.chat_id = ?")
+                params.append(int(chat))
+            else:
+                conditions.append("e.chat_title LIKE ?")
+                params.append(f"%{chat}%")
+        if sender is not None:
+            if isinstance(sender, int) or str(sender).isdigit():
+                conditions.append("e.sender_id = ?")
+                params.append(int(sender))
+            else:
+                conditions.append("e.sender LIKE ?")
+                params.append(f"{str(sender).lstrip('@')}%")
+        if kind:
+            conditions.append("e.kind = ?")
+            params.append(kind)
+        if since:
+            conditions.append("e.date >= ?")
+            params.append(_timestamp(since))
+        if until:
+            conditions.append("e.date < ?")
+            params.append(_timestamp(until))
+
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY e.date DESC, e.id DESC LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        columns = ('kind', 'chat_id', 'chat_title', 'sender_id', 'sender', 'message_id', 'date', 'text')
+        results = [dict(zip(columns, row)) for row in rows]
+        return results, (time.perf_counter() - started) * 1000
+
+    def count(self) -> int:
+        """Количество записей в индексе"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def close(self):
+        """Закрытие индекса"""
+        with self._lock:
+            self._sources.close()
+            self._conn.close()
@@ -0,0 +1,177 @@
+"""
+Модуль шардированного хранения архива по чатам
+"""
+import asyncio
+import inspect
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from config import config
+from database import Database
+from writer import PartialWriteError
+
+# Методы записи Database, которые маршрутизируются в шард по chat_id строки
+WRITE_METHODS = ('insert_message', 'insert_reaction', 'insert_event', 'insert_media',
+                 'mark_messages_deleted', 'update_message_text', 'update_message_media_path')
+
+
+def shard_paths(db_path, shards: int) -> list:
+    """Пути файлов шардов рядом с основной базой: `<имя>_shardNN<расширение>`"""
+    path = Path(db_path)
+    return [path.with_name(f"{path.stem}_shard{index:02d}{path.suffix}") for index in range(shards)]
+
+
+def open_database(db_path):
+    """Открытие хранилища: одна база или шарды по config.db_shards"""
+    shards = getattr(config, 'db_shards', 0)
+    if shards and shards > 1:
+        return ShardedDatabase(db_path, shards)
+    return Database(db_path)
+
+
+class ShardedDatabase:
+    """Набор баз Database, разделенных по chat_id
+
+    Строка уходит в шард `abs(chat_id) % shards` (строки без чата - в шард 0),
+    поэтому история одного чата целиком лежит в одном файле, а записи в чаты
+    разных шардов не делят ни файл, ни блокировку SQLite. Интерфейс записи
+    совпадает с Database для методов WRITE_METHODS: `insert_message(row)` и
+    пакетные варианты `insert_message_many(rows)`, при этом пакет делится по
+    шардам и шарды пишутся параллельно. Если часть шардов отказала, строки
+    исправных шардов остаются записанными, а PartialWriteError сообщает
+    позиции остальных. Чтение (статистика, последние события) опрашивает все
+    шарды и объединяет результаты; прочие методы Database не проксируются.
+    """
+
+    def __init__(self, db_path, shards: int, factory=Database):
+        self.db_path = Path(db_path)
+        self.paths = shard_paths(db_path, shards)
+        self.shards = [factory(str(path)) for path in self.paths]
+        self.routed = [0] * shards  # Строк направлено в каждый шард
+
+    def shard_index(self, chat_id: Optional[int]) -> int:
+        """Номер шарда для чата"""
+        if chat_id is None:
+            return 0
+        return abs(int(chat_id)) % len(self.shards)
+
+    def for_chat(self, chat_id: Optional[int]) -> Database:
+        """База шарда, в котором хранится чат (для запросов по одному чату)"""
+        return self.shards[self.shard_index(chat_id)]
+
+    def __getattr__(self, name: str):
+        # Проксируются только методы записи из WRITE_METHODS, которые
+        # поддерживает Database; чтение реализовано явно ниже
+        method = name[:-len('_many')] if name.endswith('_many') else name
+        if method not in WRITE_METHODS or not self.shards:
+            raise AttributeError(name)
+        first = self.shards[0]
+        if name != method and (hasattr(first, name) or hasattr(first, method)):
+            return self._make_many(method)
+        if name == method and hasattr(first, name):
+            return self._make_single(name)
+        raise AttributeError(name)
+
+    def _make_single(self, method: str):
+        """Маршрутизация одиночной записи в шард по chat_id строки"""
+        async def route(row, *args, **kwargs):
+            index = self.shard_index(row.get('chat_id'))
+            self.routed[index] += 1
+            return await getattr(self.shards[index], method)(row, *args, **kwargs)
+        return route
+
+    def _make_many(self, method: str):
+        """Маршрутизация пакета: деление по шардам и параллельная запись
+
+        Каждый шард пишется своей транзакцией; при отказе части шардов
+        поднимается PartialWriteError с позициями строк отказавших шардов.
+        """
+        async def route(rows):
+            by_shard = {}
+            for position, row in enumerate(rows):
+                by_shard.setdefault(self.shard_index(row.get('chat_id')), []).append(position)
+            shards = list(by_shard.items())
+            results = await asyncio.gather(*(
+                self._write_shard(index, method, [rows[position] for position in positions])
+                for index, positions in shards
+            ), return_exceptions=True)
+            failed = {}
+            for (index, positions), result in zip(shards, results):
+                if isinstance(result, BaseException):
+                    if not isinstance(result, Exception):
+                        raise result
+                    failed.update((position, result) for position in positions)
+            if failed:
+                raise PartialWriteError(failed)
+        return route
+
+    async def _write_shard(self, index: int, method: str, rows: list):
+        """Запись строк в один шард (пакетом, если Database это поддерживает)"""
+        shard = self.shards[index]
+        bulk = getattr(shard, f"{method}_many", None)
+        if bulk is not None:
+            await bulk(rows)
+        else:
+            single = getattr(shard, method)
+            for row in rows:
+                await single(row)
+        self.routed[index] += len(rows)
+
+    def get_statistics(self) -> dict:
+        """Статистика по всем шардам: числовые значения суммируются
+
+        Счетчики по чатам точны, так как чат живет в одном шарде; счетчики
+        по пользователям могут учитывать одного пользователя в нескольких
+        шардах.
+        """
+        return _merge_statistics([shard.get_statistics() for shard in self.shards]) or {}
+
+    def get_recent_events(self, limit: int = 100, *args, **kwargs) -> list:
+        """Последние события всех шардов: по `limit` из каждого, новые первыми"""
+        events = []
+        for shard in self.shards:
+            events.extend(shard.get_recent_events(limit, *args, **kwargs) or [])
+        events.sort(key=_event_date, reverse=True)
+        return events[:limit]
+
+    async def close(self):
+        """Закрытие всех шардов"""
+        for shard in self.shards:
+            close = getattr(shard, 'close', None)
+            if close is None:
+                continue
+            result = close()
+            if inspect.isawaitable(result):
+                await result
+
+
+def _event_date(event) -> tuple:
+    """Ключ сортировки события по дате (словарь или строка sqlite3.Row)"""
+    try:
+        value = event['date']
+    except (KeyError, IndexError, TypeError):
+        value = None
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, datetime):
+        return (1, value.timestamp())
+    return (2, str(value))
+
+
+def _merge_statistics(parts: list):
+    """Слияние статистики шардов"""
+    parts = [part for part in parts if part is not None]
+    if not parts:
+        return None
+    first = parts[0]
+    if isinstance(first, dict):
+        keys = []
+        for part in parts:
+            keys.extend(key for key in part if key not in keys)
+        return {key: _merge_statistics([part.get(key) for part in parts if isinstance(part, dict)]) for key in keys}
+    if isinstance(first, (int, float)) and not isinstance(first, bool):
+        return sum(part for part in parts if isinstance(part, (int, float)))
+    return first
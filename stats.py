@@ -0,0 +1,269 @@
+"""
+Модуль накопительной статистики
+"""
+import asyncio
+import sqlite3
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from logger import logger
+from records import TABLE_RECORDS, RowidSources, cold_batches, read_table
+
+# Разрезы агрегатов: общий итог, чат, отправитель, тип события, час, день
+STATS_SCOPES = ('total', 'chat', 'sender', 'event', 'hour', 'day')
+
+# Счетчики итогов, которые показывает статистика мониторинга
+STATS_KINDS = ('messages', 'edited', 'deleted', 'reactions', 'events', 'media')
+
+# Методы очереди записи, строки которых - записи records.py
+_COUNTED_METHODS = ('insert_message', 'record_edit', 'insert_reaction', 'insert_event', 'insert_media')
+
+# Метод очереди записи -> таблица Database, в которую он добавляет строки
+_METHOD_TABLES = {method: table for table, (method, _) in TABLE_RECORDS.items()}
+
+# Строк базы данных за одну транзакцию досчета
+SYNC_BATCH = 5000
+
+
+class StatsStore:
+    """Постоянные агрегаты, обновляемые по мере записи строк
+
+    Пополняется из очереди отложенной записи: каждый записанный пакет
+    превращается в приращения счетчиков, которые применяются одним
+    UPSERT-пакетом в отдельной транзакции. Итоги держатся в памяти и
+    читаются за O(1), разрезы по чату, отправителю, типу события, часу и
+    дню читаются по первичному ключу. Данные переживают перезапуск.
+
+    Вместе с приращениями в той же транзакции сохраняется отметка -
+    наибольший rowid таблицы каждой базы `db_paths`, до которого строки
+    учтены. `sync()` при запуске досчитывает строки выше отметки, поэтому
+    сбой между записью в базу и обновлением агрегатов их не рассинхронизирует,
+    а новое хранилище строится по уже накопленному архиву, включая сегменты
+    холодного хранилища `cold` (они учитываются один раз - до первой
+    отметки базы по таблице; дальше перенос строк в архив счетчики не
+    меняет). Правки считаются
+    только по record_edit (строки-правки в messages пропускаются), а
+    массовые пометки удаления - только из очереди.
+    """
+
+    def __init__(self, path: Path, db_paths=(), cold=None):
+        self.path = Path(path)
+        self.cold = cold  # ColdStore со строками, перенесенными из базы
+        self.db_paths = [Path(db_path) for db_path in db_paths]
+        self._sources = RowidSources(self.db_paths)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS aggregates (
+                scope TEXT NOT NULL,
+                key TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (scope, key, kind)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_aggregates_top ON aggregates(scope, kind, count);
+            CREATE TABLE IF NOT EXISTS chats (
+                chat_id INTEGER PRIMARY KEY,
+                type TEXT NOT NULL,
+                title TEXT
+            );
+            CREATE TABLE IF NOT EXISTS sources (
+                db_path TEXT NOT NULL,
+                source TEXT NOT NULL,
+                last_rowid INTEGER NOT NULL,
+                PRIMARY KEY (db_path, source)
+            );
+        """)
+        # Хранилища, созданные до появления названий чатов
+        if 'title' not in {row[1] for row in self._conn.execute("PRAGMA table_info(chats)")}:
+            self._conn.execute("ALTER TABLE chats ADD COLUMN title TEXT")
+        self._conn.commit()
+        self._totals = Counter(dict(self._conn.execute(
+            "SELECT kind, count FROM aggregates WHERE scope = 'total'"
+        )))
+        self._chat_types = Counter(dict(self._conn.execute(
+            "SELECT type, COUNT(*) FROM chats GROUP BY type"
+        )))
+
+    async def on_rows(self, method: str, rows: list):
+        """Приемник очереди записи: учет записанных строк"""
+        deltas = Counter()
+        chats = {}
+        for row in rows:
+            self._count(method, row, deltas, chats)
+        table = _METHOD_TABLES.get(method)
+        if deltas or chats or (table and self.db_paths):
+            await asyncio.to_thread(self._apply_written, deltas, chats, table)
+
+    def _apply_written(self, deltas: Counter, chats: dict, table: Optional[str]):
+        """Применение приращений пакета вместе с отметками таблицы (в отдельном потоке)"""
+        self.apply(deltas, chats, self._sources.marks(table) if table else None)
+
+    def sync(self) -> int:
+        """Досчет строк архива и баз данных выше сохраненных отметок; возвращает число строк"""
+        with self._lock:
+            marks = {(db_path, source): rowid for db_path, source, rowid
+                     in self._conn.execute("SELECT db_path, source, last_rowid FROM sources")}
+        counted = 0
+        for table, (method, _) in TABLE_RECORDS.items():
+            # Новое хранилище: сначала строки, уже перенесенные в архив
+            for records, batch_marks in cold_batches(self.cold, table, self.db_paths, marks, SYNC_BATCH):
+                if not self._apply_records(method, records, batch_marks):
+                    return counted
+                counted += len(records)
+            for db_path in self.db_paths:
+                key = (str(db_path), table)
+                after = marks.get(key, 0)
+                while True:
+                    rows = read_table(db_path, table, after, SYNC_BATCH)
+                    if not rows:
+                        break
+                    after = rows[-1][0]
+                    if not self._apply_records(method, [record for _, record in rows], {key: after}):
+                        return counted
+                    counted += len(rows)
+        if counted:
+            logger.info(f"Статистика досчитана по базе данных: {counted} строк")
+        return counted
+
+    def _apply_records(self, method: str, records: list, marks: dict) -> bool:
+        """Учет записей одной транзакцией вместе с отметками"""
+        deltas = Counter()
+        chats = {}
+        for record in records:
+            self._count(method, record, deltas, chats)
+        return self.apply(deltas, chats, marks)
+
+    @staticmethod
+    def _count(method: str, row, deltas: Counter, chats: dict):
+        """Приращения счетчиков для одной записи (records.py)"""
+        sender_id = None
+        amount = 1
+        if method == 'mark_messages_deleted':
+            # Служебная строка-словарь: chat_id + message_ids, без даты события
+            chat_id = row.get('chat_id')
+            kind = 'deleted'
+            amount = len(row.get('message_ids') or ())
+            date = row.get('date')
+            date = int(date.timestamp()) if isinstance(date, datetime) else date
+        elif method in _COUNTED_METHODS:
+            chat_id = row.chat_id
+            date = row.date
+            if method == 'insert_message':
+                if chat_id is not None and row.chat_type:
+                    chats[chat_id] = (row.chat_type, row.chat_title)
+                if row.is_deleted:
+                    kind = 'deleted'
+                elif row.is_edited:
+                    # Строка-правка (Database без update_message_text) - правка уже учтена по record_edit
+                    return
+                else:
+                    kind = 'messages'
+                sender_id = row.sender_id
+            elif method == 'record_edit':
+                kind = 'edited'
+                sender_id = row.sender_id
+            elif method == 'insert_reaction':
+                kind = 'reactions'
+                sender_id = row.user_id
+            elif method == 'insert_event':
+                kind = 'events'
+                sender_id = row.user_id
+                deltas[('event', row.event_type or '', kind)] += amount
+            else:
+                kind = 'media'
+        else:
+            return
+
+        deltas[('total', '', kind)] += amount
+        if chat_id is not None:
+            deltas[('chat', str(chat_id), kind)] += amount
+        if sender_id is not None:
+            deltas[('sender', str(sender_id), kind)] += amount
+        if date is not None:
+            hour = time.strftime('%Y-%m-%d %H', time.localtime(date))
+            deltas[('hour', hour, kind)] += amount
+            deltas[('day', hour[:10], kind)] += amount
+
+    def apply(self, deltas: Counter, chats: Optional[dict] = None, marks: Optional[dict] = None) -> bool:
+        """Применение приращений одной транзакцией
+
+        chats - chat_id -> (тип, название), marks - (база, таблица) -> rowid,
+        до которого строки учтены. Возвращает False при ошибке.
+        """
+        with self._lock:
+            try:
+                self._conn.executemany(
+                    "INSERT INTO aggregates (scope, key, kind, count) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (scope, key, kind) DO UPDATE SET count = count + excluded.count",
+                    [(scope, key, kind, amount) for (scope, key, kind), amount in deltas.items()]
+                )
+                new_chats = []
+                for chat_id, (chat_type, title) in (chats or {}).items():
+                    cursor = self._conn.execute(
+                        "INSERT OR IGNORE INTO chats (chat_id, type, title) VALUES (?, ?, ?)",
+                        (chat_id, chat_type, title)
+                    )
+                    if cursor.rowcount:
+                        new_chats.append(chat_type)
+                    elif title:
+                        self._conn.execute(
+                            "UPDATE chats SET title = ? WHERE chat_id = ? AND title IS NOT ?", (title, chat_id, title)
+                        )
+                self._conn.executemany(
+                    "INSERT INTO sources (db_path, source, last_rowid) VALUES (?, ?, ?) "
+                    "ON CONFLICT (db_path, source) DO UPDATE SET last_rowid = MAX(last_rowid, excluded.last_rowid)",
+                    [(db_path, source, rowid) for (db_path, source), rowid in (marks or {}).items()]
+                )
+                self._conn.commit()
+            except Exception as e:
+                self._conn.rollback()
+                logger.error(f"Ошибка обновления статистики: {e}")
+                return False
+            for (scope, _, kind), amount in deltas.items():
+                if scope == 'total':
+                    self._totals[kind] += amount
+            self._chat_types.update(new_chats)
+        return True
+
+    def totals(self) -> dict:
+        """Итоги за все время (из памяти)"""
+        totals = {kind: self._totals.get(kind, 0) for kind in STATS_KINDS}
+        totals['contacts'] = self._chat_types.get('private', 0)
+        totals['groups'] = self._chat_types.get('group', 0) + self._chat_types.get('supergroup', 0)
+        totals['channels'] = self._chat_types.get('channel', 0)
+        return totals
+
+    def chat_title(self, chat_id: int) -> Optional[str]:
+        """Последнее известное название чата по ID из базы данных"""
+        with self._lock:
+            row = self._conn.execute("SELECT title FROM chats WHERE chat_id = ?", (chat_id,)).fetchone()
+        return row[0] if row else None
+
+    def get(self, scope: str, key) -> dict:
+        """Счетчики одного среза, например ('chat', chat_id) или ('day', 'ГГГГ-ММ-ДД')"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT kind, count FROM aggregates WHERE scope = ? AND key = ?", (scope, str(key))
+            ).fetchall()
+        return dict(rows)
+
+    def top(self, scope: str, kind: str = 'messages', limit: int = 10) -> list:
+        """Крупнейшие срезы по счетчику: список (ключ, значение)"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT key, count FROM aggregates WHERE scope = ? AND kind = ? ORDER BY count DESC LIMIT ?",
+                (scope, kind, limit)
+            ).fetchall()
+
+    def close(self):
+        """Закрытие хранилища"""
+        with self._lock:
+            self._sources.close()
+            self._conn.close()
@@ -0,0 +1,101 @@
+import importlib.util
+import logging
+import sqlite3
+import sys
+import tempfile
+import types
+from pathlib import Path
+
+# Модули проекта лежат в корне репозитория
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# logger.py, config.py, database.py и auth.py не входят в репозиторий (локальные модули
+# установки); без них тестам достаточно минимальных заглушек
+_STUB_ROOT = Path(tempfile.mkdtemp(prefix='tgmon-tests-'))
+
+
+def _stub(name: str, **attrs):
+    if name in sys.modules or importlib.util.find_spec(name) is not None:
+        return
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    sys.modules[name] = module
+
+
+class _AppLogger:
+    """Заглушка app_logger: методы log_* ничего не делают"""
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+class _Config:
+    db_path = str(_STUB_ROOT / 'monitor.db')
+    session_path = str(_STUB_ROOT / 'session')
+    api_id = 0
+    api_hash = ''
+    phone = ''
+    monitor_messages = True
+    monitor_reactions = True
+    monitor_events = True
+    monitor_contacts = True
+    monitor_media = False
+    save_media = False
+
+
+class _Database:
+    """Заглушка Database: строки таблиц в SQLite рядом с db_path"""
+
+    TABLES = {
+        'messages': ('message_id', 'chat_id', 'chat_title', 'chat_type', 'sender_id', 'sender_username',
+                     'sender_first_name', 'sender_last_name', 'text', 'is_outgoing', 'is_edited', 'is_deleted',
+                     'is_forwarded', 'forward_from_id', 'media_type', 'media_path', 'date'),
+        'reactions': ('message_id', 'chat_id', 'user_id', 'user_username', 'reaction', 'action', 'date'),
+        'events': ('event_type', 'chat_id', 'chat_title', 'user_id', 'user_username', 'user_first_name',
+                   'details', 'date'),
+        'media': ('message_id', 'chat_id', 'media_type', 'file_name', 'file_path', 'file_size', 'mime_type',
+                  'date')
+    }
+
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        for table, columns in self.TABLES.items():
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY, {', '.join(columns)})")
+        self.conn.commit()
+
+    def _insert(self, table: str, data: dict):
+        columns = [name for name in self.TABLES[table] if name in data]
+        self.conn.execute(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            [data[name] if not isinstance(data[name], dict) else str(data[name]) for name in columns]
+        )
+        self.conn.commit()
+
+    async def insert_message(self, data):
+        self._insert('messages', data)
+
+    async def insert_reaction(self, data):
+        self._insert('reactions', data)
+
+    async def insert_event(self, data):
+        self._insert('events', data)
+
+    async def insert_media(self, data):
+        self._insert('media', data)
+
+    def get_statistics(self) -> dict:
+        return {table: self.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in self.TABLES}
+
+
+class _TelegramAuth:
+    """Заглушка TelegramAuth: тестам нужен только импорт"""
+
+    def __init__(self, *args, **kwargs):
+        raise RuntimeError("Авторизация недоступна в тестах")
+
+
+_stub('logger', logger=logging.getLogger('tgmon-tests'), app_logger=_AppLogger())
+_stub('config', config=_Config(), MEDIA_DIR=_STUB_ROOT / 'media')
+_stub('database', Database=_Database)
+_stub('auth', TelegramAuth=_TelegramAuth)
@@ -0,0 +1,109 @@
+import asyncio
+import sqlite3
+from datetime import datetime
+from types import SimpleNamespace
+
+from catchup import CatchupEngine, peer_id
+from records import MessageRecord
+
+CHAT = 1001  # ID канала в базе данных
+PEER = peer_id(CHAT, 'channel')
+
+
+class HistoryClient:
+    def __init__(self, last_id):
+        self.history = [SimpleNamespace(id=message_id, date=datetime(2024, 6, 1), sender_id=10)
+                        for message_id in range(1, last_id + 1)]
+
+    def is_connected(self):
+        return True
+
+    async def get_dialogs(self, limit=None):
+        return [SimpleNamespace(id=PEER, message=self.history[-1])]
+
+    async def get_entity(self, peer):
+        return peer
+
+    async def get_messages(self, entity, limit, min_id, reverse):
+        return [message for message in self.history if message.id > min_id][:limit]
+
+
+def make_engine(tmp_path, last_id, stored):
+    db_path = tmp_path / 'monitor.db'
+    with sqlite3.connect(str(db_path)) as conn:
+        conn.execute("CREATE TABLE messages (message_id INTEGER, chat_id INTEGER)")
+        conn.executemany("INSERT INTO messages VALUES (?, ?)", [(message_id, CHAT) for message_id in stored])
+    handled = []
+
+    async def handle(event):
+        assert event.chat_id == PEER
+        handled.append(event.message.id)
+
+    engine = CatchupEngine(HistoryClient(last_id), tmp_path / 'catchup.db', handle, [db_path], batch_size=2)
+    engine._save_marks({CHAT: (2, None, PEER)})
+    return engine, handled
+
+
+def row(message_id):
+    return MessageRecord(message_id=message_id, chat_id=CHAT, chat_type='channel', is_edited=False,
+                         is_deleted=False, date=1717236000)
+
+
+def test_skips_messages_already_in_database(tmp_path):
+    engine, handled = make_engine(tmp_path, 6, stored=[1, 2, 3, 4])
+    try:
+        assert asyncio.run(engine.catch_up()) == 2
+        assert handled == [5, 6]
+        assert engine.stats['skipped'] == 2
+        assert engine.marks[CHAT] == 6
+    finally:
+        engine.close()
+
+
+def test_marks_are_held_until_catchup_finishes(tmp_path):
+    engine, handled = make_engine(tmp_path, 8, stored=[1, 2])
+    try:
+        async def run():
+            engine._pending = True
+            # Сообщение 6 пришло вживую: догрузка останавливается перед ним,
+            # а его отметка не применяется, пока дыра 3..5 не закрыта
+            engine.observe(PEER, 6)
+            await engine.on_rows('insert_message', [row(6)])
+            assert engine.marks[CHAT] == 2
+            return await engine.catch_up()
+
+        assert asyncio.run(run()) == 3
+        assert handled == [3, 4, 5]
+        assert engine.marks[CHAT] == 6
+        # После догрузки отметки сдвигаются сразу
+        asyncio.run(engine.on_rows('insert_message', [row(7)]))
+        assert engine.marks[CHAT] == 7
+    finally:
+        engine.close()
+
+
+def test_quick_reconnect_triggers_catchup(tmp_path):
+    engine, handled = make_engine(tmp_path, 4, [1, 2])
+    sender_calls = []
+
+    async def telethon_callback():
+        sender_calls.append('reconnected')
+
+    engine.client._sender = SimpleNamespace(_auto_reconnect_callback=telethon_callback)
+    engine.interval = 3600
+
+    async def run():
+        engine.start()
+        await engine.wait()
+        # Соединение восстановлено между проверками: is_connected() все время True
+        engine.client.history.append(SimpleNamespace(id=5, date=datetime(2024, 6, 1), sender_id=10))
+        await engine.client._sender._auto_reconnect_callback()
+        while engine.stats['runs'] < 2:
+            await asyncio.sleep(0.01)
+        await engine.stop()
+
+    asyncio.run(run())
+    assert handled == [3, 4, 5]
+    assert sender_calls == ['reconnected'] and engine.stats['reconnects'] == 1
+    # Остановка возвращает обратный вызов Telethon
+    assert engine.client._sender._auto_reconnect_callback is telethon_callback
@@ -0,0 +1,121 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+from coldstore import ColdStore, Segment, write_segment
+from retention import RetentionManager
+from search import SearchIndex
+from stats import StatsStore
+
+NOW = datetime(2024, 6, 1, 12, 0)
+
+
+def test_segment_round_trip(tmp_path):
+    columns = ['message_id', 'chat_id', 'text', 'ratio', 'thumb', 'same_blob', 'flag']
+    rows = [
+        (1, 1001, 'привет', 0.5, b'\x00\xffdata', b'\x01', None),
+        (2, 1001, None, 1.25, None, b'\x01', None),
+        (5, 1001, '{"$b": 1}', 2.0, b'', b'\x01', None),
+    ]
+    path = tmp_path / 'segment.tgc'
+    write_segment(path, {'table': 'messages'}, columns, rows)
+    segment = Segment(path)
+    assert segment.columns['message_id']['encoding'] == 'delta'
+    assert segment.columns['same_blob']['encoding'] == 'const'
+    assert segment.columns['thumb']['encoding'] == 'json'
+    assert [tuple(row[name] for name in columns) for row in segment.read()] == rows
+    assert segment.column('missing') == [None] * 3
+
+
+def make_db(path, rows):
+    conn = sqlite3.connect(str(path))
+    conn.execute("CREATE TABLE messages (message_id INTEGER, chat_id INTEGER, chat_type TEXT, text TEXT, "
+                 "thumb BLOB, date TEXT)")
+    conn.executemany("INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+
+def test_tier_keeps_blobs_and_retention_drops_cold_days(tmp_path):
+    old = (NOW - timedelta(days=400)).isoformat(sep=' ')
+    recent = (NOW - timedelta(days=100)).isoformat(sep=' ')
+    db_path = tmp_path / 'monitor.db'
+    make_db(db_path, [
+        (1, 1001, 'channel', 'старое', b'\x89PNG', old),
+        (2, 1001, 'channel', 'новее', None, recent),
+        (3, 2002, 'group', 'группа', None, old),
+    ])
+    cold = ColdStore(tmp_path / 'cold', [db_path], after_days=30)
+    assert cold.tier(NOW) == 3
+    assert [row['thumb'] for row in cold.iter_rows('messages', chat_id=1001)] == [b'\x89PNG', None]
+
+    # Тип чата берется из колонки chat_type сегментов: чатов нет ни в сеансе, ни в базе
+    dropped = []
+    manager = RetentionManager([db_path], tmp_path / 'retention.db', {'messages': {'channel': 365, 'group': None}},
+                               cold=cold, on_dropped=lambda *args: dropped.append(args[:2]))
+    assert manager.compact(NOW) == 1
+    assert [row['message_id'] for row in cold.iter_rows('messages')] == [2, 3]
+    assert dropped == [('messages', [1001])]
+
+
+def make_reactions(path, rows):
+    conn = sqlite3.connect(str(path))
+    conn.execute("CREATE TABLE IF NOT EXISTS reactions (message_id INTEGER, chat_id INTEGER, user_id INTEGER, "
+                 "reaction TEXT, action TEXT, date TEXT)")
+    conn.executemany("INSERT INTO reactions VALUES (?, ?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+
+def test_tier_dedupes_by_rowid_not_content(tmp_path):
+    old = (NOW - timedelta(days=400)).isoformat(sep=' ')
+    db_path = tmp_path / 'monitor.db'
+    # Одинаковые по содержимому строки: одна и та же реакция поставлена дважды
+    make_reactions(db_path, [(1, 1001, 7, '👍', 'added', old)] * 2)
+    cold = ColdStore(tmp_path / 'cold', [db_path], tables=('reactions',), after_days=30)
+    assert cold.tier(NOW) == 2
+    assert cold.count('reactions') == 2
+
+    # Повторный перенос после сбоя (строки уже в сегменте, но остались в базе) не дублирует их
+    conn = sqlite3.connect(str(db_path))
+    conn.executemany("INSERT INTO reactions (rowid, message_id, chat_id, user_id, reaction, action, date) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?)", [(1, 1, 1001, 7, '👍', 'added', old), (3, 1, 1001, 7, '👍', 'added', old)])
+    conn.commit()
+    conn.close()
+    assert cold.tier(NOW) == 2
+    assert cold.count('reactions') == 3
+    assert all('_rowid' not in row for row in cold.iter_rows('reactions'))
+
+
+def test_new_stats_and_search_count_cold_rows_once(tmp_path):
+    old = (NOW - timedelta(days=400)).isoformat(sep=' ')
+    recent = (NOW - timedelta(days=20)).isoformat(sep=' ')
+    db_path = tmp_path / 'monitor.db'
+    make_db(db_path, [
+        (1, 1001, 'channel', 'архивное сообщение', None, old),
+        (2, 1001, 'channel', 'архивное тоже', None, old),
+        (3, 1001, 'channel', 'свежее сообщение', None, recent),
+    ])
+    cold = ColdStore(tmp_path / 'cold', [db_path], tables=('messages',), after_days=30)
+    assert cold.tier(NOW) == 2
+
+    stats = StatsStore(tmp_path / 'stats.db', [db_path], cold=cold)
+    index = SearchIndex(tmp_path / 'search.db', [db_path], cold=cold)
+    try:
+        assert stats.sync() == 3 and index.backfill() == 3
+        assert stats.totals()['messages'] == 3
+        results, _ = index.search(text='архивное')
+        assert len(results) == 2
+        # Архив учитывается только при первом построении
+        assert stats.sync() == 0 and index.backfill() == 0
+    finally:
+        stats.close()
+        index.close()
+
+    # Строки, перенесенные в архив после построения, уже учтены из базы
+    assert cold.tier(NOW + timedelta(days=60)) == 1
+    stats = StatsStore(tmp_path / 'stats.db', [db_path], cold=cold)
+    try:
+        assert stats.sync() == 0
+        assert stats.totals()['messages'] == 3
+    finally:
+        stats.close()
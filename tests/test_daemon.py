@@ -0,0 +1,94 @@
+import asyncio
+import stat
+
+import pytest
+
+from config import config
+from daemon import MonitorDaemon, RESPONSE_END, export_dir, resolve_export_path
+
+
+@pytest.fixture
+def control(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'db_path', str(tmp_path / 'monitor.db'), raising=False)
+    monkeypatch.setattr(config, 'control_token', None, raising=False)
+    monkeypatch.setattr(config, 'export_dir', None, raising=False)
+    return tmp_path
+
+
+async def request(address, *lines):
+    reader, writer = await asyncio.open_unix_connection(address)
+    writer.write(''.join(line + '\n' for line in lines).encode('utf-8'))
+    await writer.drain()
+    response = []
+    while True:
+        line = (await reader.readline()).decode('utf-8').rstrip('\n')
+        if not line or line == RESPONSE_END:
+            break
+        response.append(line)
+    writer.close()
+    return '\n'.join(response)
+
+
+def test_unix_socket_is_private_from_bind(control):
+    async def run():
+        server = MonitorDaemon(str(control / 'monitor.sock'))
+        assert await server._start_control_server()
+        try:
+            mode = stat.S_IMODE((control / 'monitor.sock').stat().st_mode)
+            assert mode & 0o077 == 0
+            assert 'stats' in await request(server.control_address, 'help')
+        finally:
+            await server.shutdown()
+
+    asyncio.run(run())
+
+
+def test_tcp_requires_token(control):
+    async def run():
+        server = MonitorDaemon('127.0.0.1:0')
+        assert not await server._start_control_server()
+        assert server.server is None
+
+    asyncio.run(run())
+
+
+def test_token_is_checked_before_commands(control, monkeypatch):
+    monkeypatch.setattr(config, 'control_token', 'secret', raising=False)
+
+    async def run():
+        server = MonitorDaemon(str(control / 'monitor.sock'))
+        await server._start_control_server()
+        try:
+            assert 'токен' in await request(server.control_address, 'wrong', 'help')
+            assert 'stats' in await request(server.control_address, 'secret', 'help')
+        finally:
+            await server.shutdown()
+
+    asyncio.run(run())
+
+
+def test_export_is_limited_to_export_dir(control):
+    base = export_dir()
+    assert base == (control / 'exports').resolve()
+    assert resolve_export_path('day.ndjson.gz') == base / 'day.ndjson.gz'
+    for path in ('../monitor.db', str(control / 'elsewhere.csv')):
+        with pytest.raises(ValueError):
+            resolve_export_path(path)
+    assert 'только в каталог' in asyncio.run(MonitorDaemon()._export(['../out.csv']))
+
+
+def test_run_shuts_down_after_startup_error(control, monkeypatch):
+    daemon = MonitorDaemon(str(control / 'monitor.sock'))
+    calls = []
+
+    async def connect():
+        raise RuntimeError("сбой подключения")
+
+    async def shutdown():
+        calls.append('shutdown')
+
+    monkeypatch.setattr(daemon, '_connect', connect)
+    monkeypatch.setattr(daemon, 'shutdown', shutdown)
+    with pytest.raises(RuntimeError):
+        asyncio.run(daemon.run())
+    assert calls == ['shutdown']
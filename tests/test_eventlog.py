@@ -0,0 +1,53 @@
+import asyncio
+import json
+from datetime import datetime
+
+from eventlog import EventLogWriter
+from records import MessageRecord, ReactionRecord
+
+DATE = 1717236000  # 2024-06-01
+
+
+class AppLogger:
+    def __init__(self):
+        self.calls = []
+
+    def log_message(self, data):
+        self.calls.append(('message', data))
+
+    def log_reaction(self, data):
+        raise RuntimeError("сбой логгера")
+
+
+def test_forwards_to_app_logger_and_writes_jsonl(tmp_path):
+    app_logger = AppLogger()
+    log = EventLogWriter(tmp_path / 'events.jsonl', forward=app_logger, flush_interval=0.01)
+
+    async def run():
+        log.start()
+        log.log_message(MessageRecord(message_id=1, chat_id=1001, text='привет', date=DATE))
+        log.log_reaction(ReactionRecord(message_id=1, chat_id=1001, reaction='👍', date=DATE))
+        await log.close()
+
+    asyncio.run(run())
+    # app_logger получает словари Database, как до фоновой записи
+    assert len(app_logger.calls) == 1
+    kind, data = app_logger.calls[0]
+    assert kind == 'message' and data['text'] == 'привет' and data['date'] == datetime.fromtimestamp(DATE)
+    # Сбой app_logger не мешает записи журнала
+    lines = [json.loads(line) for line in (tmp_path / 'events.jsonl').read_text(encoding='utf-8').splitlines()]
+    assert [line['kind'] for line in lines] == ['message', 'reaction']
+    assert log.get_stats()['written'] == 2
+
+
+def test_close_writes_queue_without_started_task(tmp_path):
+    log = EventLogWriter(tmp_path / 'events.jsonl')
+
+    async def run():
+        log.log_message(MessageRecord(message_id=1, chat_id=1001, text='привет', date=DATE))
+        await log.close()
+
+    asyncio.run(run())
+    lines = (tmp_path / 'events.jsonl').read_text(encoding='utf-8').splitlines()
+    assert [json.loads(line)['text'] for line in lines] == ['привет']
+    assert log.get_stats() == {'depth': 0, 'written': 1, 'dropped': 0, 'errors': 0, 'rotations': 0}
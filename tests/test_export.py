@@ -0,0 +1,60 @@
+import csv
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from coldstore import ColdStore
+from export import StreamingExporter, export_header, parse_export_filters
+
+
+class StatsDatabase:
+    def get_statistics(self):
+        return {'messages': 3}
+
+
+class BrokenDatabase:
+    def get_statistics(self):
+        raise RuntimeError("database is closed")
+
+
+def test_header_includes_statistics():
+    header = export_header(StatsDatabase())
+    assert header['statistics'] == {'messages': 3}
+    assert 'export_date' in header
+
+
+def test_header_survives_statistics_error():
+    header = export_header(BrokenDatabase())
+    assert 'statistics' not in header
+    assert 'export_date' in header
+
+
+def test_parse_filters():
+    filters = parse_export_filters(['since:2024-01-01', 'until:2024-01-31', 'chat:42'])
+    assert filters == {'since': datetime(2024, 1, 1), 'until': datetime(2024, 2, 1), 'chat_id': 42}
+    with pytest.raises(ValueError):
+        parse_export_filters(['foo:bar'])
+
+
+def test_csv_header_comes_from_table_schema(tmp_path):
+    now = datetime(2024, 6, 1, 12, 0)
+    db_path = tmp_path / 'monitor.db'
+    conn = sqlite3.connect(str(db_path))
+    conn.execute("CREATE TABLE messages (message_id INTEGER, chat_id INTEGER, text TEXT, date TEXT)")
+    conn.execute("INSERT INTO messages VALUES (1, 1001, 'старое', ?)", ((now - timedelta(days=400)).isoformat(sep=' '),))
+    conn.commit()
+    cold = ColdStore(tmp_path / 'cold', [db_path], tables=('messages',), after_days=30)
+    assert cold.tier(now) == 1
+    # Колонка добавлена после переноса: в холодной строке ее нет
+    conn.execute("ALTER TABLE messages ADD COLUMN media_path TEXT")
+    conn.execute("INSERT INTO messages VALUES (2, 1001, 'новое', ?, '/media/2.jpg')", (now.isoformat(sep=' '),))
+    conn.commit()
+    conn.close()
+
+    exporter = StreamingExporter(db_path, tables=('messages',), cold=cold)
+    assert exporter.export(tmp_path / 'out.csv', fmt='csv') == 2
+    with open(tmp_path / 'out_messages.csv', encoding='utf-8', newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert list(rows[0]) == ['message_id', 'chat_id', 'text', 'date', 'media_path']
+    assert [row['media_path'] for row in rows] == ['', '/media/2.jpg']
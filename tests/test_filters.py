@@ -0,0 +1,38 @@
+import pytest
+
+from filters import ALL_FILTERS, FILTER_KEYS, compile_filters, event_allowed, filter_states, set_filter
+
+
+def test_compile_and_states_round_trip():
+    assert compile_filters({}) == ALL_FILTERS
+    mask = compile_filters({'reactions': False, 'channel': False})
+    states = filter_states(mask)
+    assert not states['reactions'] and not states['channel']
+    assert sum(states.values()) == len(FILTER_KEYS) - 2
+    assert compile_filters(states) == mask
+
+
+def test_set_filter():
+    mask = set_filter(ALL_FILTERS, 'media', False)
+    assert not filter_states(mask)['media']
+    assert set_filter(mask, 'media', True) == ALL_FILTERS
+    assert set_filter(mask, 'all', False) == 0
+    assert set_filter(0, 'all', True) == ALL_FILTERS
+    with pytest.raises(ValueError):
+        set_filter(mask, 'unknown', True)
+
+
+def test_event_allowed():
+    assert event_allowed(ALL_FILTERS, 'message', 'channel')
+    assert not event_allowed(set_filter(ALL_FILTERS, 'edited', False), 'message_edited', 'private')
+    # Супергруппы скрываются и фильтром групп, и собственным
+    assert not event_allowed(set_filter(ALL_FILTERS, 'group', False), 'message', 'supergroup')
+    assert not event_allowed(set_filter(ALL_FILTERS, 'supergroup', False), 'message', 'supergroup')
+    assert event_allowed(set_filter(ALL_FILTERS, 'supergroup', False), 'message', 'group')
+    # Свои сообщения требуют дополнительного бита только для новых сообщений
+    mask = set_filter(ALL_FILTERS, 'my_messages', False)
+    assert not event_allowed(mask, 'message', 'private', outgoing=True)
+    assert event_allowed(mask, 'message', 'private')
+    assert event_allowed(mask, 'message_edited', 'private', outgoing=True)
+    # Неизвестные типы событий и чатов ничего не требуют
+    assert event_allowed(0, 'other')
@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+
+import pytest
+
+tk = pytest.importorskip('tkinter')
+
+from logview import LogRecord, LogView, RingBuffer
+
+
+def test_append_below_capacity_keeps_order():
+    buffer = RingBuffer(4)
+    for item in range(3):
+        buffer.append(item)
+    assert len(buffer) == 3
+    assert list(buffer) == [0, 1, 2]
+    assert buffer[-1] == 2
+
+
+def test_wraparound_evicts_oldest():
+    buffer = RingBuffer(3)
+    for item in range(8):
+        buffer.append(item)
+    assert len(buffer) == 3
+    assert list(buffer) == [5, 6, 7]
+    assert buffer[0] == 5 and buffer[-1] == 7
+    assert buffer.slice(1, 10) == [6, 7]
+    assert buffer.slice(-5, 2) == [5, 6]
+    with pytest.raises(IndexError):
+        buffer[3]
+
+
+def test_clear_resets_after_wraparound():
+    buffer = RingBuffer(2)
+    for item in range(5):
+        buffer.append(item)
+    buffer.clear()
+    assert len(buffer) == 0 and list(buffer) == []
+    buffer.append('a')
+    assert list(buffer) == ['a']
+
+
+def test_scrolled_window_stays_on_records_after_eviction():
+    view = SimpleNamespace(records=RingBuffer(10), follow=False, first=4, visible_rows=3, render=lambda: None)
+    for index in range(10):
+        view.records.append(LogRecord('00:00', 'info', str(index)))
+    LogView.append_many(view, [LogRecord('00:00', 'info', 'a\nb'), LogRecord('00:00', 'info', 'c')])
+    # Вытеснены три старые записи: окно по-прежнему начинается с записи "4"
+    assert view.first == 1
+    assert view.records[view.first].text == '4'
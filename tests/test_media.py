@@ -0,0 +1,95 @@
+import asyncio
+from types import SimpleNamespace
+
+from media import MediaPipeline, MediaStore
+
+
+def message(message_id):
+    return SimpleNamespace(id=message_id, file=SimpleNamespace(size=10), media=None)
+
+
+def test_close_drains_queued_downloads():
+    done = []
+
+    async def download(msg, media_type, chat_id):
+        await asyncio.sleep(0.001)
+        done.append(msg.id)
+        return f"/tmp/{msg.id}"
+
+    async def run():
+        pipeline = MediaPipeline(download, workers=2)
+        pipeline.start()
+        for message_id in range(20):
+            pipeline.submit(message(message_id), 'photo', 1)
+        await pipeline.close(timeout=5)
+        return pipeline
+
+    pipeline = asyncio.run(run())
+    assert sorted(done) == list(range(20))
+    assert pipeline.stats['dropped'] == 0
+
+
+def test_close_counts_downloads_left_after_timeout():
+    async def download(msg, media_type, chat_id):
+        await asyncio.sleep(10)
+
+    async def run():
+        pipeline = MediaPipeline(download, workers=1, max_concurrent=1)
+        pipeline.start()
+        for message_id in range(3):
+            pipeline.submit(message(message_id), 'photo', 1)
+        await pipeline.close(timeout=0.05)
+        return pipeline
+
+    pipeline = asyncio.run(run())
+    assert pipeline.stats['dropped'] == 3
+    assert pipeline.get_stats()['queued'] == 0
+
+
+def test_store_removes_orphaned_temp_files(tmp_path):
+    store = MediaStore(tmp_path)
+    leftover = store.temp_path()
+    leftover.write_bytes(b'partial')
+    leftover.with_name(leftover.name + '.jpg').write_bytes(b'partial')
+    store.discard_temp(leftover)
+    assert list(store.tmp_dir.iterdir()) == []
+
+    store.temp_path().write_bytes(b'partial')
+    MediaStore(tmp_path)
+    assert list(store.tmp_dir.iterdir()) == []
+
+
+def test_store_downloads_same_file_once(tmp_path):
+    store = MediaStore(tmp_path)
+    calls = []
+
+    async def download(temp_path):
+        calls.append(temp_path)
+        await asyncio.sleep(0.01)
+        temp_path.write_bytes(b'photo')
+        return temp_path, '.jpg'
+
+    async def run():
+        return await asyncio.gather(*(store.fetch('photo:1', download) for _ in range(3)))
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert len(set(results)) == 1 and results[0][1] == 5
+    assert store.get_stats()['stored'] == 1 and store.get_stats()['hits_file_id'] == 2
+
+
+def test_store_downloads_again_when_blob_is_missing(tmp_path):
+    store = MediaStore(tmp_path)
+
+    async def download(temp_path):
+        temp_path.write_bytes(b'photo')
+        return temp_path, '.jpg'
+
+    key, _ = asyncio.run(store.fetch('photo:1', download))
+    assert store.lookup('photo:1') == (key, 5)
+    store.blob_path(key).unlink()
+    assert store.lookup('photo:1') is None
+    assert asyncio.run(store.fetch('photo:1', download))[0] == key
+    assert store.blob_path(key).exists()
+    # Индекс после перезапуска указывает на тот же файл
+    assert MediaStore(tmp_path).lookup('photo:1') == (key, 5)
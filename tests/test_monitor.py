@@ -0,0 +1,52 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from config import config
+from monitor import TelegramMonitor
+from replay import FakeClient, NullLogger, SyntheticWorld
+from sharding import open_database
+
+
+@pytest.fixture
+def monitor(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'db_path', str(tmp_path / 'monitor.db'), raising=False)
+    monkeypatch.setattr(config, 'retention', None, raising=False)
+    client = FakeClient(SyntheticWorld(chats=4, users=10))
+    monitor = TelegramMonitor(client, open_database(config.db_path))
+    monitor.logger = NullLogger()
+    return monitor
+
+
+def test_shutdown_unregisters_handlers_and_closes_stores(monitor):
+    async def run():
+        await monitor.start()
+        registered = len(monitor.client.handlers)
+        assert registered
+        stores = (monitor.search_index, monitor.aggregates, monitor.revisions, monitor.catchup)
+        await monitor.shutdown()
+        return registered, stores
+
+    registered, stores = asyncio.run(run())
+    assert monitor.client.handlers == []
+    assert monitor.writer.sinks == [] and 'record_edit' not in monitor.writer.handlers
+    for store in stores:
+        with pytest.raises(sqlite3.ProgrammingError):
+            store._conn.execute("SELECT 1")
+
+
+def test_restart_reopens_stores_without_duplicate_handlers(monitor):
+    async def run():
+        await monitor.start()
+        registered = len(monitor.client.handlers)
+        await monitor.shutdown()
+        await monitor.start()
+        try:
+            assert len(monitor.client.handlers) == registered
+            assert len(monitor.writer.sinks) == 3
+            monitor.search_index._conn.execute("SELECT 1")
+        finally:
+            await monitor.shutdown()
+
+    asyncio.run(run())
@@ -0,0 +1,32 @@
+import time
+
+from reactions import ReactionTracker
+
+
+def test_prune_evicts_oldest_message_first():
+    tracker = ReactionTracker(max_messages=2)
+    now = time.time()
+    tracker.diff(1, 10, now - 10, {(100, '👍')}, {'👍': 1})
+    # Реакция на старое сообщение приходит позже остальных
+    tracker.diff(1, 1, now - 1000, {(100, '👍')}, {'👍': 1})
+    tracker.diff(1, 11, now, {(100, '👍')}, {'👍': 1})
+    assert set(tracker._snapshots) == {(1, 10), (1, 11)}
+
+
+def test_prune_drops_expired_snapshots():
+    tracker = ReactionTracker(max_age=60)
+    now = time.time()
+    tracker.diff(1, 1, now - 120, {(100, '👍')}, {'👍': 1})
+    tracker.diff(1, 2, now, {(100, '👍')}, {'👍': 1})
+    assert set(tracker._snapshots) == {(1, 2)}
+
+
+def test_removal_counted_only_when_count_drops():
+    tracker = ReactionTracker()
+    now = time.time()
+    tracker.diff(1, 1, now, {(100, '👍'), (101, '👍')}, {'👍': 2})
+    # 101 вытеснен из списка последних, но счетчик вырос - снятия нет
+    added, removed = tracker.diff(1, 1, now, {(100, '👍'), (102, '👍')}, {'👍': 3})
+    assert added == {(102, '👍')} and removed == set()
+    added, removed = tracker.diff(1, 1, now, {(100, '👍'), (102, '👍')}, {'👍': 2})
+    assert added == set() and removed == {(101, '👍')}
@@ -0,0 +1,24 @@
+from datetime import datetime
+
+import pytest
+
+from records import EditRecord, MessageRecord, ReactionRecord, as_row
+
+DATE = 1717236000  # 2024-06-01
+
+
+def test_positional_and_keyword_fields():
+    record = ReactionRecord(1, 1001, 10, 'user', '👍', 'added', DATE)
+    assert record.fields() == {'message_id': 1, 'chat_id': 1001, 'user_id': 10, 'user_username': 'user',
+                               'reaction': '👍', 'action': 'added', 'date': DATE}
+    assert EditRecord(message_id=2, text='новый').previous_text is None
+    with pytest.raises(TypeError):
+        MessageRecord(message_id=1, unknown=True)
+
+
+def test_as_dict_converts_time_only():
+    row = as_row(MessageRecord(message_id=1, chat_id=1001, text='текст', date=DATE))
+    assert row['date'] == datetime.fromtimestamp(DATE)
+    assert row['text'] == 'текст' and row['media_path'] is None
+    assert list(row) == list(MessageRecord.__slots__)
+    assert as_row({'message_id': 1}) == {'message_id': 1}
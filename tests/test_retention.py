@@ -0,0 +1,90 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from retention import RetentionManager
+
+NOW = datetime(2024, 6, 1, 12, 0)
+OLD = (NOW - timedelta(days=40)).isoformat(sep=' ')
+NEW = (NOW - timedelta(hours=1)).isoformat(sep=' ')
+
+# ID чатов как в строках базы данных (без пометки -100 / -)
+CHANNEL, GROUP, PRIVATE, STRANGER = 1001, 2002, 3003, 4004
+
+
+def make_db(path):
+    conn = sqlite3.connect(str(path))
+    conn.execute("CREATE TABLE messages (message_id INTEGER, chat_id INTEGER, chat_type TEXT, text TEXT, date TEXT)")
+    conn.execute("CREATE TABLE reactions (message_id INTEGER, chat_id INTEGER, reaction TEXT, date TEXT)")
+    for chat_id, chat_type in ((CHANNEL, 'channel'), (GROUP, 'group'), (PRIVATE, 'private')):
+        for message_id, date in ((1, OLD), (2, NEW)):
+            conn.execute("INSERT INTO messages VALUES (?, ?, ?, ?, ?)", (message_id, chat_id, chat_type, 'x', date))
+            conn.execute("INSERT INTO reactions VALUES (?, ?, ?, ?)", (message_id, chat_id, '👍', date))
+    # Чат без сообщений: тип неизвестен
+    conn.execute("INSERT INTO reactions VALUES (?, ?, ?, ?)", (1, STRANGER, '👍', OLD))
+    conn.commit()
+    conn.close()
+
+
+def remaining(path, table):
+    conn = sqlite3.connect(str(path))
+    try:
+        return sorted(conn.execute(f"SELECT chat_id, date FROM {table}").fetchall())
+    finally:
+        conn.close()
+
+
+def run(tmp_path, policies, chats=None):
+    db_path = tmp_path / 'monitor.db'
+    make_db(db_path)
+    manager = RetentionManager([db_path], tmp_path / 'retention.db', policies, chats=chats)
+    dropped = manager.compact(NOW)
+    return db_path, dropped
+
+
+def test_policy_applies_per_chat_type(tmp_path):
+    db_path, dropped = run(tmp_path, {
+        'messages': {'channel': 30, 'group': None, 'private': 30},
+        'reactions': {'channel': 30}
+    })
+    assert dropped == 3
+    assert remaining(db_path, 'messages') == sorted([
+        (CHANNEL, NEW), (GROUP, OLD), (GROUP, NEW), (PRIVATE, NEW)
+    ])
+    # Реакции классифицируются по сообщениям чата; неизвестный чат не тронут
+    assert remaining(db_path, 'reactions') == sorted([
+        (CHANNEL, NEW), (GROUP, OLD), (GROUP, NEW), (PRIVATE, OLD), (PRIVATE, NEW), (STRANGER, OLD)
+    ])
+
+
+def test_wildcard_skips_unknown_chats(tmp_path):
+    db_path, _ = run(tmp_path, {'reactions': {'private': None, '*': 30}})
+    assert remaining(db_path, 'reactions') == sorted([
+        (CHANNEL, NEW), (GROUP, NEW), (PRIVATE, OLD), (PRIVATE, NEW), (STRANGER, OLD)
+    ])
+
+
+def test_session_chat_table_uses_database_ids(tmp_path):
+    types = pytest.importorskip('telethon.tl.types')
+    from chats import ChatTable
+    from replay import _tl
+
+    chats = ChatTable()
+    # Ключи событий помечены, в базе - ID сущностей
+    chats.add(-1000000000000 - CHANNEL, _tl(types.Channel, id=CHANNEL, title='c', broadcast=True, megagroup=False))
+    chats.add(-GROUP, _tl(types.Chat, id=GROUP, title='g'))
+    db_path = tmp_path / 'monitor.db'
+    make_db(db_path)
+    conn = sqlite3.connect(str(db_path))
+    conn.execute("UPDATE messages SET chat_type = NULL")
+    conn.commit()
+    conn.close()
+
+    manager = RetentionManager([db_path], tmp_path / 'retention.db', {'messages': {'channel': 30}}, chats=chats)
+    assert manager.chat_type(CHANNEL) == 'channel'
+    assert manager.chat_type(GROUP) == 'group'
+    manager.compact(NOW)
+    assert (CHANNEL, OLD) not in remaining(db_path, 'messages')
+    assert (GROUP, OLD) in remaining(db_path, 'messages')
+    assert (PRIVATE, OLD) in remaining(db_path, 'messages')
@@ -0,0 +1,45 @@
+from types import SimpleNamespace
+
+import pytest
+
+from revisions import RevisionStore, apply_delta, format_history, make_delta
+
+
+@pytest.mark.parametrize('old, new', [
+    ('', ''),
+    ('hello world', 'hello brave new world'),
+    ('привет мир', 'привет'),
+    ('abc', ''),
+    ('', 'текст с нуля'),
+    ('x' * 1000, 'x' * 500 + 'y' * 600),
+])
+def test_delta_round_trip(old, new):
+    assert apply_delta(old, make_delta(old, new)) == new
+
+
+def test_long_delta_is_compressed():
+    old = 'a' * 2000
+    new = ''.join(chr(0x430 + i % 32) for i in range(2000))
+    assert make_delta(old, new)[:1] == b'z'
+    assert make_delta('abc', 'abd')[:1] == b'j'
+
+
+def edit(message_id, text, date, previous_text=None):
+    return SimpleNamespace(chat_id=1, message_id=message_id, text=text, date=date, previous_text=previous_text)
+
+
+def test_store_history_and_versions(tmp_path):
+    store = RevisionStore(tmp_path / 'revisions.db')
+    try:
+        store.add_edits([edit(5, 'v1', 100, previous_text='v0')])
+        store.add_edits([edit(5, 'v2', 200)])
+        assert store.latest(1, 5) == 'v2'
+        assert store.version(1, 5, 0) == 'v0'
+        assert store.version(1, 5, 1) == 'v1'
+        assert store.version(1, 5, 3) is None
+        history = store.history(1, 5)
+        assert [text for _, _, text in history] == ['v0', 'v1', 'v2']
+        assert format_history(history).splitlines()[0] == '#0 [исходный текст] v0'
+        assert store.history(1, 6) == []
+    finally:
+        store.close()
@@ -0,0 +1,66 @@
+import asyncio
+import sqlite3
+
+from records import EditRecord, MessageRecord
+from search import SearchIndex
+
+DATE = 1717236000  # 2024-06-01
+
+
+def message(message_id, text, **fields):
+    return MessageRecord(message_id=message_id, chat_id=1001, chat_title='Новости', sender_id=10,
+                         text=text, is_edited=False, is_deleted=False, date=DATE, **fields)
+
+
+def kinds(index, text):
+    results, _ = index.search(text=text)
+    return sorted(result['kind'] for result in results)
+
+
+def test_edit_is_indexed_once(tmp_path):
+    index = SearchIndex(tmp_path / 'search.db')
+    try:
+        fallback = message(1, 'исправленный текст')
+        fallback.is_edited = True
+        asyncio.run(index.on_rows('record_edit', [EditRecord(message_id=1, chat_id=1001, sender_id=10,
+                                                            text='исправленный текст', date=DATE)]))
+        asyncio.run(index.on_rows('insert_message', [fallback]))
+        assert kinds(index, 'исправленный') == ['edited']
+    finally:
+        index.close()
+
+
+def add_rows(path, texts):
+    conn = sqlite3.connect(str(path))
+    conn.execute("CREATE TABLE IF NOT EXISTS messages (id INTEGER PRIMARY KEY, message_id INTEGER, chat_id INTEGER, "
+                 "chat_title TEXT, sender_id INTEGER, sender_username TEXT, text TEXT, is_edited INTEGER, "
+                 "is_deleted INTEGER, date TEXT)")
+    conn.execute("CREATE TABLE IF NOT EXISTS events (id INTEGER PRIMARY KEY, event_type TEXT, chat_id INTEGER, "
+                 "details TEXT, date TEXT)")
+    conn.executemany(
+        "INSERT INTO messages (message_id, chat_id, chat_title, sender_id, text, is_edited, is_deleted, date) "
+        "VALUES (?, 1001, 'Новости', 10, ?, 0, 0, '2024-06-01 12:00:00')",
+        list(enumerate(texts))
+    )
+    conn.execute("INSERT INTO events (event_type, chat_id, details, date) "
+                 "VALUES ('user_joined', 1001, '{\"user\": \"архивный\"}', '2024-06-01 12:00:00')")
+    conn.commit()
+    conn.close()
+
+
+def test_backfill_indexes_archive_once(tmp_path):
+    db_path = tmp_path / 'monitor.db'
+    add_rows(db_path, ['архивное сообщение', 'еще одно архивное'])
+    index = SearchIndex(tmp_path / 'search.db', [db_path])
+    try:
+        assert index.backfill() == 3
+        assert kinds(index, 'архивное') == ['message', 'message']
+        assert kinds(index, 'архивный') == ['event']
+        # Строки, проиндексированные из очереди, дозаполнение не повторяет
+        add_rows(db_path, ['живое сообщение'])
+        asyncio.run(index.on_rows('insert_message', [message(5, 'живое сообщение')]))
+        assert index.backfill() == 1  # Событие не дошло до индекса
+        assert kinds(index, 'живое') == ['message']
+        assert index.backfill() == 0
+    finally:
+        index.close()
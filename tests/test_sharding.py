@@ -0,0 +1,104 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from sharding import ShardedDatabase
+from writer import WriteBehindQueue
+
+
+class Shard:
+    """Шард с пакетной записью; locked - сколько вызовов подряд он занят"""
+
+    def __init__(self, path, locked=0, bad=()):
+        self.path = path
+        self.rows = []
+        self.events = []
+        self.locked = locked
+        self.bad = set(bad)
+
+    async def insert_message(self, row):
+        if row['message_id'] in self.bad:
+            raise ValueError("bad row")
+        self.rows.append(row)
+
+    async def insert_message_many(self, rows):
+        if self.locked:
+            self.locked -= 1
+            raise sqlite3.OperationalError("database is locked")
+        if any(row['message_id'] in self.bad for row in rows):
+            raise ValueError("bad row")
+        self.rows.extend(rows)
+
+    def get_statistics(self):
+        return {'messages': len(self.rows)}
+
+    def get_recent_events(self, limit=100):
+        return self.events[:limit]
+
+
+def sharded(tmp_path, **shards):
+    db = ShardedDatabase(tmp_path / 'monitor.db', 2, factory=lambda path: Shard(path))
+    for index, options in shards.items():
+        db.shards[int(index[-1])].__dict__.update(options)
+    return db
+
+
+def write(db, tmp_path, chat_ids, **kwargs):
+    writer = WriteBehindQueue(db, retry_delay=0, dead_letter_path=tmp_path / 'failed.jsonl', **kwargs)
+    seen = []
+
+    async def sink(method, rows):
+        seen.extend(row['message_id'] for row in rows)
+
+    writer.add_sink(sink)
+
+    async def run():
+        for message_id, chat_id in enumerate(chat_ids):
+            await writer.put('insert_message', {'message_id': message_id, 'chat_id': chat_id})
+        await writer.close()
+
+    asyncio.run(run())
+    return writer, seen
+
+
+def ids(shard):
+    return sorted(row['message_id'] for row in shard.rows)
+
+
+def test_retries_only_the_failed_shard(tmp_path):
+    db = sharded(tmp_path, shard1={'locked': 2})
+    writer, seen = write(db, tmp_path, [10, 11, 12, 13])
+    # Исправный шард записан один раз, занятый - повторен без дублей
+    assert ids(db.shards[0]) == [0, 2] and ids(db.shards[1]) == [1, 3]
+    assert sorted(seen) == [0, 1, 2, 3]
+    assert writer.stats['retries'] == 2 and writer.stats['errors'] == 0
+
+
+def test_rejects_only_the_failed_shard(tmp_path):
+    db = sharded(tmp_path, shard1={'locked': 100})
+    writer, seen = write(db, tmp_path, [10, 11, 12, 13], retries=1)
+    assert ids(db.shards[0]) == [0, 2] and ids(db.shards[1]) == []
+    assert sorted(seen) == [0, 2]
+    assert writer.stats['errors'] == 2
+    assert (tmp_path / 'failed.jsonl').read_text(encoding='utf-8').count('\n') == 2
+
+
+def test_bad_row_isolated_within_its_shard(tmp_path):
+    db = sharded(tmp_path, shard1={'bad': {3}})
+    writer, seen = write(db, tmp_path, [10, 11, 12, 13])
+    assert ids(db.shards[0]) == [0, 2] and ids(db.shards[1]) == [1]
+    assert sorted(seen) == [0, 1, 2] and writer.stats['errors'] == 1
+
+
+def test_reads_fan_out_and_other_methods_are_not_proxied(tmp_path):
+    db = sharded(tmp_path)
+    db.shards[0].rows = [{}] * 2
+    db.shards[1].rows = [{}] * 3
+    db.shards[0].events = [{'date': 5}, {'date': 1}]
+    db.shards[1].events = [{'date': 4}, {'date': 3}]
+    assert db.get_statistics() == {'messages': 5}
+    assert [event['date'] for event in db.get_recent_events(3)] == [5, 4, 3]
+    assert hasattr(db, 'insert_message_many')
+    with pytest.raises(AttributeError):
+        db.get_messages
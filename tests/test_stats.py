@@ -0,0 +1,107 @@
+import asyncio
+import sqlite3
+
+from records import EditRecord, MessageRecord, ReactionRecord
+from stats import StatsStore
+
+DATE = 1717236000  # 2024-06-01
+
+
+def message(message_id, chat_id, chat_type, title, **fields):
+    return MessageRecord(message_id=message_id, chat_id=chat_id, chat_type=chat_type, chat_title=title,
+                         sender_id=10, is_edited=False, is_deleted=False, date=DATE, **fields)
+
+
+def test_counts_and_chat_titles(tmp_path):
+    store = StatsStore(tmp_path / 'stats.db')
+    try:
+        asyncio.run(store.on_rows('insert_message', [
+            message(1, 1001, 'channel', 'Новости'),
+            message(2, 1001, 'channel', 'Новости'),
+            message(3, 2002, 'group', 'Друзья'),
+        ]))
+        asyncio.run(store.on_rows('insert_reaction', [
+            ReactionRecord(message_id=1, chat_id=1001, user_id=10, reaction='👍', action='added', date=DATE)
+        ]))
+        totals = store.totals()
+        assert totals['messages'] == 3 and totals['reactions'] == 1
+        assert totals['channels'] == 1 and totals['groups'] == 1
+        assert store.top('chat', 'messages', 1) == [('1001', 2)]
+        assert store.chat_title(1001) == 'Новости'
+
+        # Переименование чата обновляет название, но не счетчик чатов
+        asyncio.run(store.on_rows('insert_message', [message(4, 1001, 'channel', 'Новости 2')]))
+        assert store.chat_title(1001) == 'Новости 2'
+        assert store.totals()['channels'] == 1
+    finally:
+        store.close()
+
+
+def test_opens_store_without_title_column(tmp_path):
+    path = tmp_path / 'stats.db'
+    conn = sqlite3.connect(str(path))
+    conn.execute("CREATE TABLE chats (chat_id INTEGER PRIMARY KEY, type TEXT NOT NULL)")
+    conn.execute("INSERT INTO chats VALUES (1, 'private')")
+    conn.commit()
+    conn.close()
+
+    store = StatsStore(path)
+    try:
+        assert store.chat_title(1) is None
+        assert store.totals()['contacts'] == 1
+    finally:
+        store.close()
+
+
+def test_edit_rows_are_counted_once(tmp_path):
+    store = StatsStore(tmp_path / 'stats.db')
+    try:
+        edit = EditRecord(message_id=1, chat_id=1001, sender_id=10, text='новый', date=DATE)
+        fallback = message(1, 1001, 'channel', 'Новости')
+        fallback.is_edited = True
+        asyncio.run(store.on_rows('record_edit', [edit]))
+        asyncio.run(store.on_rows('insert_message', [fallback]))
+        totals = store.totals()
+        assert totals['edited'] == 1 and totals['messages'] == 0
+    finally:
+        store.close()
+
+
+def make_messages_db(path, count):
+    conn = sqlite3.connect(str(path))
+    conn.execute("CREATE TABLE IF NOT EXISTS messages (id INTEGER PRIMARY KEY, message_id INTEGER, chat_id INTEGER, "
+                 "chat_type TEXT, chat_title TEXT, sender_id INTEGER, is_edited INTEGER, is_deleted INTEGER, date TEXT)")
+    start = conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+    conn.executemany(
+        "INSERT INTO messages (message_id, chat_id, chat_type, chat_title, sender_id, is_edited, is_deleted, date) "
+        "VALUES (?, 1001, 'channel', 'Новости', 10, 0, 0, '2024-06-01 12:00:00')",
+        [(start + index,) for index in range(count)]
+    )
+    conn.commit()
+    conn.close()
+
+
+def test_sync_counts_rows_missed_by_the_queue(tmp_path):
+    db_path = tmp_path / 'monitor.db'
+    make_messages_db(db_path, 3)
+    store = StatsStore(tmp_path / 'stats.db', [db_path])
+    try:
+        # Новое хранилище строится по уже накопленному архиву
+        assert store.sync() == 3
+        # Строки, записанные и учтенные очередью, повторно не считаются
+        make_messages_db(db_path, 2)
+        asyncio.run(store.on_rows('insert_message', [message(3, 1001, 'channel', 'Новости'),
+                                                     message(4, 1001, 'channel', 'Новости')]))
+        assert store.sync() == 0
+        # Сбой между записью в базу и обновлением агрегатов: строка досчитывается при запуске
+        make_messages_db(db_path, 1)
+    finally:
+        store.close()
+
+    store = StatsStore(tmp_path / 'stats.db', [db_path])
+    try:
+        assert store.sync() == 1
+        assert store.totals()['messages'] == 6 and store.totals()['channels'] == 1
+        assert store.get('chat', 1001)['messages'] == 6
+    finally:
+        store.close()
@@ -0,0 +1,99 @@
+import asyncio
+import json
+import sqlite3
+
+from writer import WriteBehindQueue
+
+
+class BulkDatabase:
+    """Пакетная запись одной транзакцией: плохая строка отклоняет весь пакет"""
+
+    def __init__(self, bad=(), locked=0):
+        self.rows = []
+        self.bad = set(bad)
+        self.locked = locked  # Сколько вызовов подряд база занята
+        self.calls = 0
+
+    async def insert_message_many(self, rows):
+        self.calls += 1
+        if self.locked:
+            self.locked -= 1
+            raise sqlite3.OperationalError("database is locked")
+        if any(row['message_id'] in self.bad for row in rows):
+            raise ValueError("bad row")
+        self.rows.extend(rows)
+
+
+class SingleDatabase:
+    """Только запись по одной строке"""
+
+    def __init__(self, bad=()):
+        self.rows = []
+        self.bad = set(bad)
+
+    async def insert_message(self, row):
+        if row['message_id'] in self.bad:
+            raise ValueError("bad row")
+        self.rows.append(row)
+
+
+def flush(db, count, tmp_path, **kwargs):
+    writer = WriteBehindQueue(db, retry_delay=0, dead_letter_path=tmp_path / 'failed.jsonl', **kwargs)
+    seen = []
+
+    async def sink(method, rows):
+        seen.extend(row['message_id'] for row in rows)
+
+    writer.add_sink(sink)
+
+    async def run():
+        for message_id in range(count):
+            await writer.put('insert_message', {'message_id': message_id})
+        await writer.close()
+
+    asyncio.run(run())
+    return writer, seen
+
+
+def dead_letters(tmp_path):
+    path = tmp_path / 'failed.jsonl'
+    if not path.exists():
+        return []
+    return [json.loads(line)['row']['message_id'] for line in path.read_text(encoding='utf-8').splitlines()]
+
+
+def test_bad_row_in_bulk_falls_back_to_single_rows(tmp_path):
+    db = BulkDatabase(bad={3})
+    writer, seen = flush(db, 6, tmp_path)
+    assert [row['message_id'] for row in db.rows] == [0, 1, 2, 4, 5]
+    assert seen == [0, 1, 2, 4, 5]
+    assert writer.stats['written'] == 5
+    assert writer.stats['errors'] == 1
+    assert dead_letters(tmp_path) == [3]
+
+
+def test_single_row_failure_does_not_drop_following_rows(tmp_path):
+    db = SingleDatabase(bad={1})
+    writer, seen = flush(db, 4, tmp_path)
+    assert [row['message_id'] for row in db.rows] == [0, 2, 3]
+    assert seen == [0, 2, 3]
+    assert writer.stats['errors'] == 1
+    assert dead_letters(tmp_path) == [1]
+
+
+def test_transient_error_is_retried(tmp_path):
+    db = BulkDatabase(locked=2)
+    writer, seen = flush(db, 3, tmp_path)
+    assert len(db.rows) == 3
+    assert writer.stats['retries'] == 2
+    assert writer.stats['errors'] == 0
+    assert dead_letters(tmp_path) == []
+
+
+def test_persistent_transient_error_is_bounded_and_kept(tmp_path):
+    db = BulkDatabase(locked=100)
+    writer, seen = flush(db, 3, tmp_path, retries=2)
+    assert db.calls == 3
+    assert db.rows == [] and seen == []
+    assert writer.stats['errors'] == 3
+    assert dead_letters(tmp_path) == [0, 1, 2]
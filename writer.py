@@ -0,0 +1,305 @@
+"""
+Модуль отложенной пакетной записи в базу данных
+"""
+import asyncio
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Optional
+
+from logger import logger
+from records import Record, as_row
+
+# Ошибки, после которых запись имеет смысл повторить (база занята, сбой ввода-вывода)
+TRANSIENT_ERRORS = (sqlite3.OperationalError, OSError, asyncio.TimeoutError)
+
+
+class PartialWriteError(Exception):
+    """Пакет записан не целиком (например, отказал один из шардов)
+
+    failed - позиция строки в переданном пакете -> ошибка; остальные строки
+    пакета уже записаны и повторно не пишутся.
+    """
+
+    def __init__(self, failed: dict):
+        self.failed = failed
+        self.error = next(iter(failed.values()))
+        super().__init__(f"не записано {len(failed)} строк: {self.error}")
+
+    @property
+    def transient(self) -> bool:
+        """Все ошибки временные - повтор имеет смысл"""
+        return all(isinstance(error, TRANSIENT_ERRORS) for error in self.failed.values())
+
+
+class WriteBehindQueue:
+    """Очередь отложенной записи в базу данных
+
+    Обработчики только ставят строки в очередь, а фоновая задача сбрасывает
+    их в Database пакетами - по размеру пакета или по возрасту первой строки.
+    Строка ставится как пара (имя метода Database, данные). Если у Database
+    есть пакетный вариант метода с суффиксом `_many` (например
+    `insert_message_many`), весь пакет уходит одним вызовом (одной транзакцией),
+    иначе строки записываются по одной. Для методов, зарегистрированных через
+    `register`, пакет передается собственному обработчику вместо Database.
+
+    В очереди лежат компактные записи (records.py); словари для Database
+    строятся только в момент сброса, приемники получают исходные записи.
+
+    Временные ошибки (база занята, сбой ввода-вывода) повторяются до
+    `retries` раз с растущей паузой. Если пакет записан частично
+    (PartialWriteError), повторяются и отклоняются только незаписанные строки.
+    Если пакет отклонен из-за отдельной строки, строки записываются по одной,
+    и ошибка одной строки не мешает остальным. Строки, которые так и не удалось записать, дописываются в
+    `dead_letter_path` (JSON Lines) для повторного импорта.
+    """
+
+    def __init__(self, db, batch_size: int = 500, max_age: float = 0.5, max_size: int = 50000, perf=None,
+                 retries: int = 3, retry_delay: float = 0.1, dead_letter_path=None):
+        self.db = db
+        self.perf = perf  # PerfRegistry для замеров записи по методам
+        self.batch_size = batch_size
+        self.max_age = max_age  # Максимальное время ожидания строки в очереди (сек)
+        self.retries = retries
+        self.retry_delay = retry_delay  # Пауза перед первым повтором (сек), дальше удваивается
+        self.dead_letter_path = Path(dead_letter_path) if dead_letter_path else None
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self.sinks = []  # Получатели записанных строк: async (method, rows)
+        self.handlers = {}  # Собственные обработчики методов: method -> async (rows)
+        self.stats = {
+            'written': 0,
+            'batches': 0,
+            'errors': 0,
+            'retries': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0
+        }
+
+    def add_sink(self, sink):
+        """Подписка на строки, успешно записанные в базу данных"""
+        self.sinks.append(sink)
+
+    def remove_sink(self, sink):
+        """Отписка получателя записанных строк"""
+        if sink in self.sinks:
+            self.sinks.remove(sink)
+
+    def register(self, method: str, handler):
+        """Регистрация обработчика пакетов для метода, которого нет в Database"""
+        self.handlers[method] = handler
+
+    def unregister(self, method: str):
+        """Снятие собственного обработчика метода"""
+        self.handlers.pop(method, None)
+
+    def start(self):
+        """Запуск фоновой задачи сброса"""
+        self._closing = False
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def put(self, method: str, row):
+        """Постановка строки в очередь на запись"""
+        # При переполнении очереди ожидаем - строки не теряются
+        await self.queue.put((method, row))
+
+    async def close(self):
+        """Полный сброс очереди и остановка фоновой задачи"""
+        self._closing = True
+        if self._task is None or self._task.done():
+            # Задача не запущена - сбрасываем остаток напрямую
+            batch = []
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            if batch:
+                await self._flush(batch)
+                for _ in batch:
+                    self.queue.task_done()
+            return
+        await self.queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        """Цикл сбора и сброса пакетов"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            started = loop.time()
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                remaining = self.max_age - (loop.time() - started)
+                if remaining <= 0 or self._closing:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def _flush(self, batch):
+        """Запись пакета в базу данных"""
+        started = time.perf_counter()
+        # Группируем подряд идущие строки одного метода, сохраняя порядок записи
+        groups = []
+        for method, row in batch:
+            if groups and groups[-1][0] == method:
+                groups[-1][1].append(row)
+            else:
+                groups.append((method, [row]))
+
+        for method, rows in groups:
+            group_started = time.perf_counter()
+            try:
+                written = await self._write_group(method, rows)
+            finally:
+                if self.perf:
+                    self.perf.observe(f"db.{method}", time.perf_counter() - group_started)
+            self.stats['written'] += len(written)
+            if not written:
+                continue
+
+            for sink in self.sinks:
+                try:
+                    await sink(method, written)
+                except Exception as e:
+                    logger.error(f"Ошибка обработки записанных строк ({method}): {e}")
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.stats['batches'] += 1
+        self.stats['last_flush_ms'] = elapsed_ms
+        self.stats['total_flush_ms'] += elapsed_ms
+        if elapsed_ms > self.stats['max_flush_ms']:
+            self.stats['max_flush_ms'] = elapsed_ms
+
+    async def _write_group(self, method: str, rows: list) -> list:
+        """Запись строк одного метода; возвращает успешно записанные строки"""
+        handler = self.handlers.get(method)
+        bulk = getattr(self.db, f"{method}_many", None)
+        if handler is not None:
+            # Собственные обработчики читают слоты записей напрямую
+            data = rows
+            write_all, write_one = handler, lambda row: handler([row])
+        else:
+            # Словари для Database строятся один раз на группу, повторы их переиспользуют
+            data = [as_row(row) for row in rows]
+            single = getattr(self.db, method, None)
+            write_all = bulk
+            write_one = single if single is not None else (lambda row: bulk([row]))
+
+        pending = list(range(len(rows)))
+        if write_all is not None:
+            pending, error = await self._attempt_bulk(write_all, data)
+            if not pending:
+                return rows
+            if isinstance(error, TRANSIENT_ERRORS) or (isinstance(error, PartialWriteError) and error.transient):
+                # База недоступна и после повторов - запись по одной ничего не даст
+                await self._reject(method, [rows[index] for index in pending], error)
+                return self._written(rows, pending)
+            # Незаписанная часть пакета - одна транзакция: ищем плохие строки по одной
+            logger.warning(f"Пакет отклонен ({method}, {len(pending)} из {len(rows)} строк), запись по одной: {error}")
+
+        failed = []
+        for position, index in enumerate(pending):
+            try:
+                await self._attempt(write_one, data[index])
+            except TRANSIENT_ERRORS as e:
+                rest = pending[position:]
+                await self._reject(method, [rows[i] for i in rest], e)
+                failed.extend(rest)
+                break
+            except Exception as e:
+                await self._reject(method, [rows[index]], e)
+                failed.append(index)
+        return self._written(rows, failed)
+
+    @staticmethod
+    def _written(rows: list, failed) -> list:
+        """Строки группы без незаписанных (по позициям), в исходном порядке"""
+        failed = set(failed)
+        return [row for index, row in enumerate(rows) if index not in failed]
+
+    async def _attempt_bulk(self, write_all, data: list):
+        """Пакетная запись с повтором временных ошибок только для незаписанных строк
+
+        Возвращает (позиции незаписанных строк, последняя ошибка).
+        """
+        pending = list(range(len(data)))
+        for attempt in range(self.retries + 1):
+            try:
+                await write_all([data[index] for index in pending])
+                return [], None
+            except PartialWriteError as e:
+                pending = [pending[position] for position in sorted(e.failed)]
+                error = e
+                transient = e.transient
+            except Exception as e:
+                error = e
+                transient = isinstance(e, TRANSIENT_ERRORS)
+            if not transient or attempt == self.retries:
+                return pending, error
+            self.stats['retries'] += 1
+            await asyncio.sleep(self.retry_delay * 2 ** attempt)
+
+    async def _attempt(self, write, data):
+        """Вызов записи с повтором временных ошибок"""
+        for attempt in range(self.retries + 1):
+            try:
+                return await write(data)
+            except TRANSIENT_ERRORS:
+                if attempt == self.retries:
+                    raise
+                self.stats['retries'] += 1
+                await asyncio.sleep(self.retry_delay * 2 ** attempt)
+
+    async def _reject(self, method: str, rows: list, error: Exception):
+        """Учет строк, которые не удалось записать, и сохранение их в файл отказов"""
+        self.stats['errors'] += len(rows)
+        if self.perf:
+            self.perf.error(f"db.{method}")
+        target = f", сохранены в {self.dead_letter_path}" if self.dead_letter_path else ""
+        logger.error(f"Ошибка записи ({method}, {len(rows)} строк{target}): {error}")
+        if self.dead_letter_path:
+            try:
+                await asyncio.to_thread(self._append_dead_letter, method, rows, str(error))
+            except Exception as e:
+                logger.error(f"Ошибка сохранения строк в {self.dead_letter_path}: {e}")
+
+    def _append_dead_letter(self, method: str, rows: list, error: str):
+        """Дозапись строк в файл отказов (в отдельном потоке)"""
+        self.dead_letter_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.dead_letter_path, 'a', encoding='utf-8') as f:
+            for row in rows:
+                data = row.fields() if isinstance(row, Record) else row
+                f.write(json.dumps({'method': method, 'error': error, 'row': data},
+                                   ensure_ascii=False, default=str) + '\n')
+
+    def get_stats(self) -> dict:
+        """Получение статистики очереди"""
+        batches = self.stats['batches']
+        return {
+            'depth': self.queue.qsize(),
+            'written': self.stats['written'],
+            'batches': batches,
+            'errors': self.stats['errors'],
+            'retries': self.stats['retries'],
+            'last_flush_ms': round(self.stats['last_flush_ms'], 2),
+            'avg_flush_ms': round(self.stats['total_flush_ms'] / batches, 2) if batches else 0.0,
+            'max_flush_ms': round(self.stats['max_flush_ms'], 2)
+        }